@@ -1,116 +1,128 @@
 from __future__ import annotations
 
-import struct
-from dataclasses import asdict, dataclass
+import json
 from datetime import datetime
 from pathlib import Path
+from typing import Callable
 
-from .flash import read_flash, write_flash_at
+from .baudrate import DEFAULT_TRANSFER_BAUD, resolve_baud
+from .device import serial_number_for_port
+from .eraseplan import BlankAwarePlan, plan_blank_aware
+from .flash import write_flash_at
+from .flashmap import (
+    HASH_BLOCK_SIZE,
+    Extent,
+    block_md5s,
+    changed_blocks,
+    coalesce_extents,
+    estimate_transfer_seconds,
+    split_blocks,
+    subtract_extents,
+    total_size,
+)
+from .flashsession import FlashSession, open_flash_session
+from .inventory import record_backup
+from .partitions import (
+    PARTITION_TABLE_OFFSET,
+    PARTITION_TABLE_SIZE,
+    PartitionEntry,
+    parse_partition_table,
+    parse_partition_table_bytes,
+)
+from .progress import ProgressCallback, region_progress, tracker_for
+from .resumable import ReadProgress, ResumableReadError, find_resumable_read, read_flash_resumable
+from .sparseimage import (
+    SPARSE_SUFFIX,
+    convert_raw_to_sparse,
+    is_sparse_image,
+    load_flash_image,
+    read_sparse_image,
+)
 
-PARTITION_TABLE_OFFSET = 0x10000
-PARTITION_TABLE_SIZE = 0x1000
 STATE_PARTITION_LABELS = frozenset({"nvs", "storage", "factory"})
 
 
-@dataclass
-class PartitionEntry:
-    label: str
-    type: int
-    subtype: int
-    offset: int
-    size: int
-    flags: int
-
-    def to_dict(self) -> dict:
-        d = asdict(self)
-        d["offset_hex"] = hex(self.offset)
-        d["size_hex"] = hex(self.size)
-        return d
-
-
 def _ts() -> str:
     return datetime.now().strftime("%Y%m%d-%H%M%S")
 
 
-def parse_partition_table(part_bin_path: str | Path) -> list[PartitionEntry]:
-    data = Path(part_bin_path).read_bytes()
-    out: list[PartitionEntry] = []
-    for i in range(0, len(data), 32):
-        entry = data[i : i + 32]
-        if len(entry) < 32:
-            break
-        if entry == b"\xFF" * 32:
-            continue
-        magic, ptype, subtype, offset, size, label_raw, flags = struct.unpack("<HBBII16sI", entry)
-        if magic != 0x50AA:
-            continue
-        label = label_raw.split(b"\x00", 1)[0].decode("ascii", errors="ignore")
-        out.append(
-            PartitionEntry(
-                label=label,
-                type=ptype,
-                subtype=subtype,
-                offset=offset,
-                size=size,
-                flags=flags,
-            )
-        )
-    return out
-
-
 def select_state_partitions(entries: list[PartitionEntry]) -> list[PartitionEntry]:
     return [entry for entry in entries if entry.label in STATE_PARTITION_LABELS]
 
 
-def _read_partition_table_snapshot(
-    port: str,
-    out_dir: str | Path,
-    baud: int,
+def _snapshot_partition_table(
+    session: FlashSession,
+    out_dir: Path,
     offset: int,
     size: int,
 ) -> tuple[dict, list[PartitionEntry]]:
-    out_dir = Path(out_dir)
-    out_dir.mkdir(parents=True, exist_ok=True)
     out_path = out_dir / f"codee-partitions-{_ts()}.bin"
-    res = read_flash(port=port, offset=offset, size=size, out_path=out_path, baud=baud, timeout=300)
-    if not res.ok:
-        return (
-            {
-                "ok": False,
-                "stage": "read_partition_table",
-                "path": str(out_path),
-                "stdout": res.stdout,
-                "stderr": res.stderr,
-            },
-            [],
-        )
-    entries = parse_partition_table(out_path)
+    with session.stage("read_partition_table") as timing:
+        data = session.read(offset, size)
+        timing.bytes = len(data)
+    out_path.write_bytes(data)
+    entries = parse_partition_table_bytes(data)
     return (
         {
             "ok": True,
             "path": str(out_path),
             "entries": [entry.to_dict() for entry in entries],
-            "stdout": res.stdout,
-            "stderr": res.stderr,
+            "seconds": round(timing.seconds, 3),
         },
         entries,
     )
 
 
+def _backup_path(
+    session: FlashSession,
+    out_dir: Path,
+    name: str,
+    offset: int,
+    size: int,
+) -> Path:
+    """An unfinished `codee-<name>-*` read of the same range and device, else a new name."""
+    resumable = find_resumable_read(
+        out_dir,
+        f"codee-{name}-*.bin",
+        offset=offset,
+        size=size,
+        device=session.mac(),
+    )
+    return resumable or out_dir / f"codee-{name}-{_ts()}.bin"
+
+
+def _read_to_file(
+    session: FlashSession,
+    out_path: Path,
+    stage: str,
+    offset: int,
+    size: int,
+    progress: ProgressCallback | None = None,
+) -> ReadProgress:
+    tracker = tracker_for(stage, progress)
+    on_progress = (lambda p: tracker.update(p.bytes_done, p.bytes_total)) if tracker else None
+    with session.stage(stage) as timing:
+        result = read_flash_resumable(session, offset, size, out_path, on_progress=on_progress)
+        timing.bytes = result.bytes_transferred
+    return result
+
+
 def _backup_single_partition(
-    port: str,
-    out_dir: str | Path,
-    baud: int,
+    session: FlashSession,
+    out_dir: Path,
     partition: PartitionEntry,
+    progress: ProgressCallback | None = None,
 ) -> dict:
-    out_path = Path(out_dir) / f"codee-{partition.label}-{_ts()}.bin"
-    res = read_flash(
-        port=port,
+    out_path = _backup_path(
+        session, out_dir, partition.label, offset=partition.offset, size=partition.size
+    )
+    read = _read_to_file(
+        session,
+        out_path,
+        stage=f"backup_{partition.label}",
         offset=partition.offset,
         size=partition.size,
-        out_path=out_path,
-        baud=baud,
-        timeout=1800,
+        progress=progress,
     )
     return {
         "label": partition.label,
@@ -119,94 +131,407 @@ def _backup_single_partition(
         "size": partition.size,
         "size_hex": hex(partition.size),
         "path": str(out_path),
-        "ok": res.ok,
-        "stdout": res.stdout,
-        "stderr": res.stderr,
+        "ok": True,
+        "read": read.to_dict(),
     }
 
 
 def backup_partition_table(
     port: str,
     out_dir: str | Path,
-    baud: int = 921600,
+    baud: int | None = None,
     offset: int = PARTITION_TABLE_OFFSET,
     size: int = PARTITION_TABLE_SIZE,
 ) -> dict:
-    info, _ = _read_partition_table_snapshot(
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    baud = resolve_baud(port, baud, DEFAULT_TRANSFER_BAUD)
+    try:
+        with open_flash_session(port=port, baud=baud) as session:
+            info, _ = _snapshot_partition_table(session, out_dir, offset=offset, size=size)
+    except Exception as exc:  # noqa: BLE001 - esptool/serial failures are reported, not raised
+        return {"ok": False, "stage": "read_partition_table", "error": str(exc)}
+    return info
+
+
+def full_flash_manifest_path(image_path: str | Path) -> Path:
+    return Path(image_path).with_suffix(".json")
+
+
+def write_full_flash_manifest(
+    image_path: str | Path,
+    data: bytes,
+    port: str,
+    block_size: int = HASH_BLOCK_SIZE,
+    block_hashes: list[str] | None = None,
+) -> dict:
+    manifest = {
+        "kind": "fullflash",
+        "image": Path(image_path).name,
+        "port": port,
+        "usb_serial": serial_number_for_port(port),
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "flash_size": len(data),
+        "block_size": block_size,
+        "block_md5": block_hashes if block_hashes is not None else block_md5s(data, block_size),
+    }
+    full_flash_manifest_path(image_path).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return manifest
+
+
+def latest_full_flash_snapshot(
+    out_dir: str | Path,
+    flash_size: int,
+    block_size: int = HASH_BLOCK_SIZE,
+) -> tuple[Path, dict] | None:
+    """Newest full-flash image in out_dir whose manifest matches the requested geometry."""
+    images = [
+        p for p in Path(out_dir).glob("codee-fullflash-*") if p.suffix in (".bin", SPARSE_SUFFIX)
+    ]
+    for image_path in sorted(images, reverse=True):
+        manifest_path = full_flash_manifest_path(image_path)
+        if not manifest_path.exists():
+            continue
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if manifest.get("flash_size") == flash_size and manifest.get("block_size") == block_size:
+            return image_path, manifest
+    return None
+
+
+def _backup_full_flash_incremental(
+    port: str,
+    out_path: Path,
+    flash_size: int,
+    baud: int,
+    block_size: int,
+    progress: ProgressCallback | None = None,
+) -> dict:
+    base = latest_full_flash_snapshot(out_path.parent, flash_size=flash_size, block_size=block_size)
+    previous_hashes = base[1]["block_md5"] if base else None
+    image = bytearray(load_flash_image(base[0])) if base else bytearray(b"\xFF" * flash_size)
+    blocks = split_blocks(0, flash_size, block_size)
+
+    with open_flash_session(port=port, baud=baud) as session:
+        mac = session.mac()
+        with session.stage("hash_device"):
+            device_hashes = [session.md5(b.offset, b.size) for b in blocks]
+        changed = changed_blocks(previous_hashes, device_hashes)
+        to_read = coalesce_extents([blocks[i] for i in changed])
+        tracker = tracker_for("read_changed", progress)
+        with session.stage("read_changed") as timing:
+            for extent in to_read:
+                image[extent.offset : extent.end] = session.read(
+                    extent.offset,
+                    extent.size,
+                    region_progress(tracker, timing.bytes, extent.size, total_size(to_read)),
+                )
+                timing.bytes += extent.size
+
+    data = bytes(image)
+    mismatched = changed_blocks(device_hashes, block_md5s(data, block_size))
+    if mismatched:
+        raise RuntimeError(f"Rebuilt image does not match device hashes in blocks {mismatched}")
+    out_path.write_bytes(data)
+    write_full_flash_manifest(
+        out_path,
+        data,
         port=port,
-        out_dir=out_dir,
-        baud=baud,
-        offset=offset,
-        size=size,
+        block_size=block_size,
+        block_hashes=device_hashes,
     )
-    return info
+    return {
+        "mac": mac,
+        "base_path": str(base[0]) if base else None,
+        "blocks_total": len(blocks),
+        "blocks_changed": len(changed),
+        "bytes_read": total_size(to_read),
+        "regions_read": [e.to_dict() for e in to_read],
+        "timings": session.timings_report(),
+    }
 
 
 def backup_full_flash(
     port: str,
     out_dir: str | Path,
     flash_size: int = 0x400000,
-    baud: int = 921600,
+    baud: int | None = None,
+    incremental: bool = False,
+    block_size: int = HASH_BLOCK_SIZE,
+    sparse: bool = False,
+    progress: ProgressCallback | None = None,
 ) -> dict:
+    """Dump full flash to a timestamped image plus a block-hash manifest.
+
+    With `incremental=True` the device hashes each block via the stub's MD5 command and
+    only blocks that differ from the newest previous snapshot in out_dir are read back.
+    With `sparse=True` the image is stored as a sparse container without erased sectors.
+    Plain reads are chunked and checkpointed; rerunning after a failure resumes the
+    unfinished image in out_dir. `progress` receives throttled ProgressEvents while
+    flash is read.
+    """
     out_dir = Path(out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
-    out_path = out_dir / f"codee-fullflash-{_ts()}.bin"
-    res = read_flash(port=port, offset=0, size=flash_size, out_path=out_path, baud=baud, timeout=3600)
-    return {
-        "ok": res.ok,
-        "path": str(out_path),
+    baud = resolve_baud(port, baud, DEFAULT_TRANSFER_BAUD)
+    result: dict = {
         "flash_size": flash_size,
         "flash_size_hex": hex(flash_size),
-        "stdout": res.stdout,
-        "stderr": res.stderr,
+        "incremental": incremental,
+    }
+    if incremental:
+        out_path = out_dir / f"codee-fullflash-{_ts()}.bin"
+        result["path"] = str(out_path)
+        result["manifest_path"] = str(full_flash_manifest_path(out_path))
+        try:
+            details = _backup_full_flash_incremental(
+                port=port,
+                out_path=out_path,
+                flash_size=flash_size,
+                baud=baud,
+                block_size=block_size,
+                progress=progress,
+            )
+        except Exception as exc:  # noqa: BLE001 - esptool/serial failures are reported, not raised
+            return {**result, "ok": False, "error": str(exc)}
+        result = {**result, "ok": True, **details, **_store_sparse(out_path, sparse)}
+        record_backup(port, result["path"], kind="backup_fullflash", mac=result["mac"])
+        return result
+
+    try:
+        with open_flash_session(port=port, baud=baud) as session:
+            # Resuming needs the device MAC, so the output name is chosen once connected.
+            result["mac"] = session.mac()
+            out_path = _backup_path(session, out_dir, "fullflash", offset=0, size=flash_size)
+            result["path"] = str(out_path)
+            result["manifest_path"] = str(full_flash_manifest_path(out_path))
+            read = _read_to_file(
+                session,
+                out_path,
+                "backup_fullflash",
+                offset=0,
+                size=flash_size,
+                progress=progress,
+            )
+    except ResumableReadError as exc:
+        return {**result, "ok": False, "error": str(exc), "read": exc.progress.to_dict()}
+    except Exception as exc:  # noqa: BLE001 - esptool/serial failures are reported, not raised
+        return {**result, "ok": False, "error": str(exc)}
+    write_full_flash_manifest(out_path, out_path.read_bytes(), port=port, block_size=block_size)
+    result = {
+        **result,
+        "ok": True,
+        "read": read.to_dict(),
+        "timings": session.timings_report(),
+        **_store_sparse(out_path, sparse),
+    }
+    record_backup(port, result["path"], kind="backup_fullflash", mac=result["mac"])
+    return result
+
+
+def _store_sparse(raw_path: Path, sparse: bool) -> dict:
+    """Replace a freshly written raw dump with its sparse container when requested."""
+    if not sparse:
+        return {}
+    info = convert_raw_to_sparse(raw_path)
+    raw_path.unlink()
+    return {
+        "path": info["sparse_path"],
+        "sparse": True,
+        "stored_bytes": info["stored_bytes"],
+        "data_bytes": info["data_bytes"],
     }
 
 
 def backup_state_partitions(
     port: str,
     out_dir: str | Path,
-    baud: int = 921600,
+    baud: int | None = None,
+    progress: ProgressCallback | None = None,
 ) -> dict:
-    part_info, entries = _read_partition_table_snapshot(
-        port=port,
-        out_dir=out_dir,
-        baud=baud,
-        offset=PARTITION_TABLE_OFFSET,
-        size=PARTITION_TABLE_SIZE,
-    )
-    if not part_info.get("ok"):
-        return part_info
-
-    wanted = select_state_partitions(entries)
+    """Back up the partition table and state partitions over one esptool session."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    baud = resolve_baud(port, baud, DEFAULT_TRANSFER_BAUD)
+    stage = "connect"
+    session: FlashSession | None = None
+    part_info: dict | None = None
     backups: list[dict] = []
+    mac: str | None = None
+    try:
+        with open_flash_session(port=port, baud=baud) as session:
+            mac = session.mac()
+            stage = "read_partition_table"
+            part_info, entries = _snapshot_partition_table(
+                session,
+                out_dir,
+                offset=PARTITION_TABLE_OFFSET,
+                size=PARTITION_TABLE_SIZE,
+            )
+            for p in select_state_partitions(entries):
+                stage = f"backup_{p.label}"
+                backups.append(
+                    _backup_single_partition(session, out_dir, partition=p, progress=progress)
+                )
+    except Exception as exc:  # noqa: BLE001 - esptool/serial failures are reported, not raised
+        return {
+            "ok": False,
+            "stage": stage,
+            "error": str(exc),
+            "read": exc.progress.to_dict() if isinstance(exc, ResumableReadError) else None,
+            "partition_table": part_info,
+            "backups": backups,
+            "timings": session.timings_report() if session else [],
+        }
 
-    for p in wanted:
-        backup = _backup_single_partition(port=port, out_dir=out_dir, baud=baud, partition=p)
-        backups.append(backup)
-        if not backup["ok"]:
-            return {
-                "ok": False,
-                "stage": f"backup_{p.label}",
-                "partition_table": part_info,
-                "backups": backups,
-            }
-
+    files = [part_info["path"], *(b["path"] for b in backups)] if part_info else []
+    record_backup(port, out_dir, kind="backup_state", files=files, mac=mac)
     return {
         "ok": True,
+        "mac": mac,
         "partition_table": part_info,
         "backups": backups,
+        "timings": session.timings_report(),
+    }
+
+
+def _restore_plan(
+    regions: list[Extent],
+    writes: BlankAwarePlan,
+    image_size: int,
+    baud: int,
+) -> dict:
+    bytes_to_write = total_size(writes.write)
+    return {
+        "regions": [r.to_dict() for r in regions],
+        **writes.to_dict(),
+        "bytes_total": image_size,
+        "estimated_seconds": round(estimate_transfer_seconds(bytes_to_write, baud), 2),
+    }
+
+
+def _restore_sparse(
+    port: str,
+    path: Path,
+    baud: int,
+    progress: ProgressCallback | None = None,
+) -> dict:
+    image = read_sparse_image(path)
+    erased = image.erased_extents()
+    bytes_to_write = sum(e.size for e in image.extents)
+    tracker = tracker_for("write_extents", progress)
+    with open_flash_session(port=port, baud=baud) as session:
+        with session.stage("hash_blank"):
+            to_erase = subtract_extents(erased, session.blank_extents(erased))
+        with session.stage("erase_blank") as timing:
+            for extent in to_erase:
+                session.erase(extent.offset, extent.size)
+            timing.bytes = total_size(to_erase)
+        with session.stage("write_extents") as timing:
+            for extent in image.extents:
+                session.write(
+                    extent.offset,
+                    image.read_extent(extent),
+                    region_progress(tracker, timing.bytes, extent.size, bytes_to_write),
+                )
+                timing.bytes += extent.size
+    return {
+        "sparse": True,
+        "extents_written": len(image.extents),
+        "bytes_written": bytes_to_write,
+        "bytes_erased_only": total_size(to_erase),
+        "bytes_skipped_blank": total_size(erased) - total_size(to_erase),
+        "timings": session.timings_report(),
     }
 
 
+def _restore_full_flash_diff(
+    port: str,
+    path: Path,
+    baud: int,
+    dry_run: bool,
+    on_plan: Callable[[dict], None] | None,
+    progress: ProgressCallback | None = None,
+) -> dict:
+    data = load_flash_image(path)
+    with open_flash_session(port=port, baud=baud) as session:
+        with session.stage("hash_device"):
+            regions = session.mismatched_extents(0, data)
+        # Mismatched sectors never read as blank, so 0xFF targets among them just need an erase.
+        writes = plan_blank_aware(data, regions, device_blank=[])
+        plan = _restore_plan(regions, writes, len(data), baud)
+        if on_plan is not None:
+            on_plan(plan)
+        if not dry_run:
+            with session.stage("erase_blank") as timing:
+                for region in writes.erase:
+                    session.erase(region.offset, region.size)
+                timing.bytes = total_size(writes.erase)
+            tracker = tracker_for("write_changed", progress)
+            with session.stage("write_changed") as timing:
+                for region in writes.write:
+                    session.write(
+                        region.offset,
+                        data[region.offset : region.end],
+                        region_progress(tracker, timing.bytes, region.size, plan["bytes_to_write"]),
+                    )
+                    timing.bytes += region.size
+            with session.stage("verify"):
+                remaining = session.mismatched_extents(0, data)
+            if remaining:
+                raise RuntimeError(
+                    "Device still differs from backup at "
+                    + ", ".join(hex(r.offset) for r in remaining)
+                )
+    return {"plan": plan, "dry_run": dry_run, "timings": session.timings_report()}
+
+
 def restore_full_flash_backup(
     port: str,
     backup_path: str | Path,
-    baud: int = 921600,
+    baud: int | None = None,
+    diff: bool = False,
+    dry_run: bool = False,
+    on_plan: Callable[[dict], None] | None = None,
+    progress: ProgressCallback | None = None,
 ) -> dict:
+    """Restore a full-flash image (raw .bin or sparse container) at 0x0.
+
+    With `diff=True` device flash is hashed region by region and only mismatched
+    sectors are erased and rewritten (0xFF-only sectors are erased, not written);
+    `on_plan` receives the write plan before any write starts. `dry_run` always
+    plans this way (with or without `diff`) and never writes. Sparse containers
+    without `diff` erase the blank regions that are not already erased on the device
+    and write only the stored extents. `progress` receives ProgressEvents for the
+    write phase on every path.
+    """
     path = Path(backup_path)
     if not path.exists():
         return {"ok": False, "error": f"Backup file not found: {path}"}
-    res = write_flash_at(port=port, offset=0, in_path=path, baud=baud, timeout=3600)
+    baud = resolve_baud(port, baud, DEFAULT_TRANSFER_BAUD)
+    if diff or dry_run or is_sparse_image(path):
+        try:
+            if diff or dry_run:
+                details = _restore_full_flash_diff(
+                    port=port,
+                    path=path,
+                    baud=baud,
+                    dry_run=dry_run,
+                    on_plan=on_plan,
+                    progress=progress,
+                )
+            else:
+                details = _restore_sparse(port=port, path=path, baud=baud, progress=progress)
+        except Exception as exc:  # noqa: BLE001 - esptool/serial failures are reported, not raised
+            return {"ok": False, "backup_path": str(path), "error": str(exc)}
+        return {"ok": True, "backup_path": str(path), **details}
+
+    res = write_flash_at(
+        port=port,
+        offset=0,
+        in_path=path,
+        baud=baud,
+        timeout=3600,
+        progress=progress,
+    )
     return {
         "ok": res.ok,
         "backup_path": str(path),
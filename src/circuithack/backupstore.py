@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import zlib
+from datetime import datetime
+from pathlib import Path
+
+from .flashmap import SECTOR_SIZE
+from .sparseimage import load_flash_image
+
+DEFAULT_STORE_DIR = "backups/store"
+_BACKUP_NAME = re.compile(r"^codee-(?P<label>[A-Za-z0-9_]+)-\d{8}-\d{6}$")
+
+
+def _sectors_dir(store_dir: Path) -> Path:
+    return store_dir / "sectors"
+
+
+def _snapshots_dir(store_dir: Path) -> Path:
+    return store_dir / "snapshots"
+
+
+def _sector_path(store_dir: Path, digest: str) -> Path:
+    return _sectors_dir(store_dir) / digest[:2] / digest
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def label_from_backup_name(path: str | Path) -> str:
+    """'codee-nvs-20260101-120000.bin' -> 'nvs'; unknown names fall back to the stem."""
+    stem = Path(path).stem
+    match = _BACKUP_NAME.match(stem)
+    return match.group("label") if match else stem
+
+
+def chunk_sectors(data: bytes, sector_size: int = SECTOR_SIZE) -> list[tuple[str, bytes]]:
+    view = memoryview(data)
+    return [
+        (hashlib.sha256(view[i : i + sector_size]).hexdigest(), bytes(view[i : i + sector_size]))
+        for i in range(0, len(data), sector_size)
+    ]
+
+
+def add_snapshot(
+    store_dir: str | Path,
+    image_path: str | Path,
+    device: str = "unknown",
+    label: str | None = None,
+) -> dict:
+    """Store an image (raw or sparse) as a manifest of content-addressed 4KB sectors."""
+    store_dir = Path(store_dir)
+    image_path = Path(image_path)
+    data = load_flash_image(image_path)
+    sectors = chunk_sectors(data)
+
+    new_sectors = 0
+    bytes_added = 0
+    for digest, payload in sectors:
+        path = _sector_path(store_dir, digest)
+        if path.exists():
+            continue
+        compressed = zlib.compress(payload, 6)
+        _write_atomic(path, compressed)
+        new_sectors += 1
+        bytes_added += len(compressed)
+
+    created = datetime.now()
+    label = label or label_from_backup_name(image_path)
+    image_sha256 = hashlib.sha256(data).hexdigest()
+    snapshot_id = f"{device}-{label}-{created.strftime('%Y%m%d-%H%M%S')}-{image_sha256[:8]}"
+    manifest = {
+        "id": snapshot_id,
+        "device": device,
+        "label": label,
+        "source": str(image_path),
+        "created": created.isoformat(timespec="microseconds"),
+        "size": len(data),
+        "sha256": image_sha256,
+        "sector_size": SECTOR_SIZE,
+        "sectors": [digest for digest, _ in sectors],
+    }
+    _write_atomic(
+        _snapshots_dir(store_dir) / f"{snapshot_id}.json",
+        json.dumps(manifest, indent=2).encode("utf-8"),
+    )
+    return {
+        "ok": True,
+        "id": snapshot_id,
+        "sectors_total": len(sectors),
+        "sectors_new": new_sectors,
+        "bytes_added": bytes_added,
+    }
+
+
+def load_snapshots(store_dir: str | Path) -> list[dict]:
+    snapshots = [
+        json.loads(path.read_text(encoding="utf-8"))
+        for path in _snapshots_dir(Path(store_dir)).glob("*.json")
+    ]
+    snapshots.sort(key=lambda s: (s["created"], s["id"]))
+    return snapshots
+
+
+def _summary(snapshot: dict) -> dict:
+    return {k: v for k, v in snapshot.items() if k != "sectors"}
+
+
+def list_snapshots(
+    store_dir: str | Path,
+    device: str | None = None,
+    label: str | None = None,
+) -> dict:
+    snapshots = [
+        _summary(s)
+        for s in load_snapshots(store_dir)
+        if (device is None or s["device"] == device) and (label is None or s["label"] == label)
+    ]
+    return {"ok": True, "store_dir": str(store_dir), "snapshots": snapshots, **store_usage(store_dir)}
+
+
+def sector_files(store_dir: str | Path) -> list[Path]:
+    """Every stored sector; the file name is the SHA-256 of its decompressed bytes."""
+    return list(_sectors_dir(Path(store_dir)).glob("*/*"))
+
+
+def store_usage(store_dir: str | Path) -> dict:
+    files = sector_files(store_dir)
+    return {
+        "unique_sectors": len(files),
+        "stored_bytes": sum(p.stat().st_size for p in files),
+    }
+
+
+def restore_snapshot(store_dir: str | Path, snapshot_id: str, out_path: str | Path) -> dict:
+    store_dir = Path(store_dir)
+    manifest_path = _snapshots_dir(store_dir) / f"{snapshot_id}.json"
+    if not manifest_path.exists():
+        return {"ok": False, "error": f"Snapshot not found: {snapshot_id}"}
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+
+    data = b"".join(
+        zlib.decompress(_sector_path(store_dir, digest).read_bytes()) for digest in manifest["sectors"]
+    )
+    if hashlib.sha256(data).hexdigest() != manifest["sha256"]:
+        return {"ok": False, "id": snapshot_id, "error": "Rebuilt image does not match snapshot sha256"}
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_bytes(data)
+    return {"ok": True, "id": snapshot_id, "path": str(out_path), "size": len(data)}
+
+
+def select_expired_snapshots(snapshots: list[dict], keep_last: int) -> list[dict]:
+    """Everything but the newest `keep_last` snapshots per (device, label)."""
+    groups: dict[tuple[str, str], list[dict]] = {}
+    for snapshot in snapshots:
+        groups.setdefault((snapshot["device"], snapshot["label"]), []).append(snapshot)
+    expired: list[dict] = []
+    for members in groups.values():
+        members.sort(key=lambda s: (s["created"], s["id"]))
+        expired.extend(members[: max(len(members) - keep_last, 0)])
+    return expired
+
+
+def prune_snapshots(store_dir: str | Path, keep_last: int, dry_run: bool = False) -> dict:
+    """Drop expired snapshot manifests, then delete sectors no manifest references."""
+    if keep_last < 1:
+        raise ValueError("keep_last must be at least 1")
+    snapshots = load_snapshots(store_dir)
+    expired = select_expired_snapshots(snapshots, keep_last)
+    return remove_snapshots(store_dir, {s["id"] for s in expired}, dry_run=dry_run)
+
+
+def remove_snapshots(store_dir: str | Path, expired_ids: set[str], dry_run: bool = False) -> dict:
+    """Delete the given snapshot manifests and every sector only they referenced."""
+    store_dir = Path(store_dir)
+    snapshots = load_snapshots(store_dir)
+    live = {digest for s in snapshots if s["id"] not in expired_ids for digest in s["sectors"]}
+    orphans = [p for p in sector_files(store_dir) if p.name not in live]
+    reclaimed = sum(p.stat().st_size for p in orphans)
+
+    if not dry_run:
+        for snapshot_id in expired_ids:
+            (_snapshots_dir(store_dir) / f"{snapshot_id}.json").unlink()
+        for path in orphans:
+            path.unlink()
+
+    return {
+        "ok": True,
+        "dry_run": dry_run,
+        "removed_snapshots": sorted(expired_ids),
+        "removed_sectors": len(orphans),
+        "reclaimed_bytes": reclaimed,
+    }
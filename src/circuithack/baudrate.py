@@ -0,0 +1,130 @@
+from __future__ import annotations
+
+import hashlib
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from pathlib import Path
+
+from .device import serial_number_for_port
+from .flashsession import FlashSession, close_loader, connect_loader
+from .util import cache_dir, load_json_cache, update_json_cache
+
+ROM_BAUD = 115200
+DEFAULT_BAUD = 460800
+DEFAULT_TRANSFER_BAUD = 921600
+CALIBRATION_BAUDS = (115200, 230400, 460800, 921600, 1500000, 2000000)
+CALIBRATION_PAYLOAD_SIZE = 0x10000
+
+
+@dataclass
+class BaudTrial:
+    baud: int
+    ok: bool
+    seconds: float
+    error: str | None = None
+
+    def to_dict(self) -> dict:
+        d = asdict(self)
+        d["seconds"] = round(self.seconds, 3)
+        return d
+
+
+def baud_cache_path() -> Path:
+    return cache_dir() / "baud.json"
+
+
+def load_baud_cache() -> dict[str, dict]:
+    return load_json_cache(baud_cache_path())
+
+
+def record_baud(serial_number: str, baud: int, port: str) -> None:
+    with update_json_cache(baud_cache_path()) as cache:
+        cache[serial_number] = {
+            "baud": baud,
+            "port": port,
+            "calibrated": datetime.now().isoformat(timespec="seconds"),
+        }
+
+
+def cached_baud(port: str) -> int | None:
+    serial_number = serial_number_for_port(port)
+    if not serial_number:
+        return None
+    entry = load_baud_cache().get(serial_number)
+    return int(entry["baud"]) if entry else None
+
+
+def resolve_baud(port: str, baud: int | None, default: int) -> int:
+    """Explicit baud wins; otherwise the device's calibrated rate; otherwise `default`."""
+    if baud:
+        return baud
+    return cached_baud(port) or default
+
+
+def pick_stable_baud(trials: list[BaudTrial]) -> int | None:
+    """Highest baud reached before the first failure when stepping upwards."""
+    best: int | None = None
+    for trial in sorted(trials, key=lambda t: t.baud):
+        if not trial.ok:
+            break
+        best = trial.baud
+    return best
+
+
+def _run_trials(
+    session: FlashSession,
+    candidates: tuple[int, ...],
+    offset: int,
+    payload_size: int,
+) -> list[BaudTrial]:
+    expected = session.md5(offset, payload_size)
+    trials: list[BaudTrial] = []
+    for baud in sorted(candidates):
+        start = time.monotonic()
+        try:
+            session.esp.change_baud(baud)
+            ok = hashlib.md5(session.read(offset, payload_size)).hexdigest() == expected
+            error = None if ok else "payload MD5 mismatch"
+        except Exception as exc:  # noqa: BLE001 - a failing rate is a result, not an error
+            ok, error = False, str(exc)
+        trials.append(BaudTrial(baud=baud, ok=ok, seconds=time.monotonic() - start, error=error))
+        if not ok:
+            # The link is unreliable past this point; higher rates are not worth trying.
+            break
+    return trials
+
+
+def calibrate_baud(
+    port: str,
+    candidates: tuple[int, ...] = CALIBRATION_BAUDS,
+    payload_size: int = CALIBRATION_PAYLOAD_SIZE,
+    offset: int = 0,
+    save: bool = True,
+) -> dict:
+    """Step through increasing baud rates with a read-and-verify payload.
+
+    The fastest rate that passed (with every slower rate also passing) is cached
+    by USB serial number so later backup, restore and flash calls pick it up.
+    """
+    esp = connect_loader(port=port, baud=ROM_BAUD)
+    try:
+        trials = _run_trials(FlashSession(esp=esp, port=port), candidates, offset, payload_size)
+    finally:
+        try:
+            close_loader(esp)
+        except Exception:  # noqa: BLE001 - the port may already be wedged by a failed rate
+            pass
+
+    best = pick_stable_baud(trials)
+    serial_number = serial_number_for_port(port)
+    if best and save and serial_number:
+        record_baud(serial_number, best, port)
+    return {
+        "ok": best is not None,
+        "port": port,
+        "serial_number": serial_number,
+        "baud": best,
+        "saved": bool(best and save and serial_number),
+        "trials": [t.to_dict() for t in trials],
+    }
@@ -2,13 +2,34 @@ from __future__ import annotations
 
 import argparse
 import json
+import sys
+import threading
 from pathlib import Path
 
 from .backup import backup_full_flash, backup_state_partitions, restore_full_flash_backup
+from .backupstore import (
+    DEFAULT_STORE_DIR,
+    add_snapshot,
+    list_snapshots,
+    prune_snapshots,
+    restore_snapshot,
+)
+from .baudrate import calibrate_baud
 from .codee import FIRMWARE_SOURCES, decode_codee_savegame, flash_codee_firmware
-from .device import detect_codee_candidates, list_serial_devices, resolve_codee_port
+from .deploy import DEFAULT_DEPLOY_DIR, DEFAULT_REMOTE_DIR, deploy_port_kit
+from .device import (
+    DeviceEvent,
+    DeviceWatcher,
+    WATCH_INTERVAL,
+    detect_codee_candidates,
+    list_serial_devices,
+    resolve_codee_port,
+)
 from .env import auto_load_env
+from .extract import extract_partitions, extract_partitions_batch
 from .firmware import download_asset, latest_stock_asset
+from .fleet import DEFAULT_FLEET_LOG_DIR, DEFAULT_FLEET_WORKERS, FLEET_STEPS, run_fleet
+from .fwimage import inspect_firmware_image
 from .flash import enter_programmer_mode, write_flash_zero
 from .gamewatch import (
     codee_gamewatch_adaptation_report,
@@ -16,24 +37,94 @@ from .gamewatch import (
     sync_gamewatch_source,
 )
 from .gamesync import sync_game_sources
+from .inventory import query_inventory, record_scan
 from .micropython import build_and_flash_micropython
+from .mpycross import DEFAULT_MPY_OUT_DIR, compile_port_kit, device_mpy_target
+from .pipeline import PIPELINE_STAGES, run_pipeline
+from .probe import DEFAULT_PROBE_WORKERS, PROBE_TIMEOUT, probe_devices
+from .progress import ProgressCallback, ProgressEvent
+from .repartition import DEFAULT_FLASH_SIZE, plan_repartition_offline, repartition_device
+from .retention import DEFAULT_BACKUP_ROOT, RetentionPolicy, apply_retention, audit_backups
 from .rompatch import apply_ips_patch_file
-from .runner import run_script
+from .runner import run_repl_ops, run_script
+from .sparseimage import convert_raw_to_sparse, export_sparse_to_raw
+from .verify import verify_flash_image
+
+
+_BAUD_HELP = "Serial baud rate (default: calibrated rate for this device, else esptool default)."
 
 
 def _print(obj: dict) -> None:
     print(json.dumps(obj, indent=2))
 
 
+def _print_plan(plan: dict) -> None:
+    # Plans go to stderr so stdout stays a single JSON result.
+    print(json.dumps({"plan": plan}, indent=2), file=sys.stderr, flush=True)
+
+
+def _print_progress_event(event: ProgressEvent) -> None:
+    # One JSON object per line on stderr, so a wrapper can tail progress while stdout stays clean.
+    print(json.dumps({"progress": event.to_dict()}), file=sys.stderr, flush=True)
+
+
+def _progress(args: argparse.Namespace) -> ProgressCallback | None:
+    return _print_progress_event if args.progress else None
+
+
 def cmd_scan(_: argparse.Namespace) -> None:
+    candidates = detect_codee_candidates()
+    record_scan(candidates)
     _print(
         {
             "devices": [x.to_dict() for x in list_serial_devices(only_likely_usb=True)],
-            "codee_candidates": [x.to_dict() for x in detect_codee_candidates()],
+            "codee_candidates": [x.to_dict() for x in candidates],
         }
     )
 
 
+def cmd_probe(args: argparse.Namespace) -> None:
+    _print(
+        probe_devices(
+            ports=args.port,
+            timeout=args.timeout,
+            refresh=args.refresh,
+            workers=args.workers,
+        )
+    )
+
+
+def _print_device_event(event: DeviceEvent) -> None:
+    print(json.dumps({"device_event": event.to_dict()}), file=sys.stderr, flush=True)
+
+
+def cmd_watch(args: argparse.Namespace) -> None:
+    watcher = DeviceWatcher(interval=args.interval)
+    watcher.add_listener(_print_device_event)
+    with watcher:
+        if args.next_codee:
+            found = watcher.wait_for_codee(timeout=args.timeout)
+            _print(
+                {
+                    "ok": found is not None,
+                    "device": found.to_dict() if found else None,
+                    "error": None if found else "No Codee was plugged in before the timeout.",
+                }
+            )
+            return
+        try:
+            threading.Event().wait(args.timeout)
+        except KeyboardInterrupt:
+            pass
+        _print(
+            {
+                "ok": True,
+                "devices": [d.to_dict() for d in watcher.devices()],
+                "codee_candidates": [d.to_dict() for d in watcher.candidates()],
+            }
+        )
+
+
 def cmd_download(args: argparse.Namespace) -> None:
     asset = latest_stock_asset("codee")
     path = download_asset(asset, args.out_dir)
@@ -52,7 +143,12 @@ def cmd_restore(args: argparse.Namespace) -> None:
     if not firmware_path:
         asset = latest_stock_asset("codee")
         firmware_path = str(download_asset(asset, "downloads/codee"))
-    res = write_flash_zero(port=port, firmware_bin=firmware_path, baud=args.baud)
+    res = write_flash_zero(
+        port=port,
+        firmware_bin=firmware_path,
+        baud=args.baud,
+        progress=_progress(args),
+    )
     _print(
         {
             "ok": res.ok,
@@ -64,9 +160,19 @@ def cmd_restore(args: argparse.Namespace) -> None:
     )
 
 
+def cmd_calibrate_baud(args: argparse.Namespace) -> None:
+    port = resolve_codee_port(args.port)
+    _print(calibrate_baud(port=port, save=not args.no_save))
+
+
 def cmd_install_binary(args: argparse.Namespace) -> None:
     port = resolve_codee_port(args.port)
-    res = write_flash_zero(port=port, firmware_bin=args.bin_path, baud=args.baud)
+    res = write_flash_zero(
+        port=port,
+        firmware_bin=args.bin_path,
+        baud=args.baud,
+        progress=_progress(args),
+    )
     _print(
         {
             "ok": res.ok,
@@ -85,6 +191,7 @@ def cmd_install_source(args: argparse.Namespace) -> None:
         repo_dir=args.repo_dir,
         board=args.board,
         baud=args.baud,
+        freeze_dir=args.freeze_dir,
     )
     _print(result)
 
@@ -95,6 +202,32 @@ def cmd_run(args: argparse.Namespace) -> None:
     _print({"ok": res.ok, "port": port, "stdout": res.stdout, "stderr": res.stderr})
 
 
+def cmd_deploy(args: argparse.Namespace) -> None:
+    port = resolve_codee_port(args.port)
+    _print(
+        deploy_port_kit(
+            port,
+            src_dir=args.src_dir,
+            remote_dir=args.remote_dir,
+            prune=not args.no_prune,
+            dry_run=args.dry_run,
+            mpy=args.mpy,
+            mpy_out_dir=args.mpy_out_dir,
+            measure=args.measure,
+        )
+    )
+
+
+def cmd_mpy_build(args: argparse.Namespace) -> None:
+    target = device_mpy_target(resolve_codee_port(args.port)) if args.match_device else None
+    _print(compile_port_kit(args.src_dir, out_dir=args.out_dir, target=target))
+
+
+def cmd_repl(args: argparse.Namespace) -> None:
+    port = resolve_codee_port(args.port)
+    _print(run_repl_ops(port, args.ops or [], soft_reset=not args.keep_state))
+
+
 def cmd_backup_full(args: argparse.Namespace) -> None:
     port = resolve_codee_port(args.port)
     _print(
@@ -103,6 +236,97 @@ def cmd_backup_full(args: argparse.Namespace) -> None:
             out_dir=args.out_dir,
             flash_size=args.flash_size,
             baud=args.baud,
+            incremental=args.incremental,
+            sparse=args.sparse,
+            progress=_progress(args),
+        )
+    )
+
+
+def cmd_sparse_pack(args: argparse.Namespace) -> None:
+    _print(
+        convert_raw_to_sparse(
+            raw_path=args.raw_path,
+            out_path=args.out_path,
+            compress=not args.no_compress,
+        )
+    )
+
+
+def cmd_sparse_export(args: argparse.Namespace) -> None:
+    _print(export_sparse_to_raw(sparse_path=args.sparse_path, out_path=args.out_path))
+
+
+def cmd_extract_partitions(args: argparse.Namespace) -> None:
+    if args.dump_dir:
+        _print(
+            extract_partitions_batch(dump_dir=args.dump_dir, out_dir=args.out_dir, labels=args.label)
+        )
+    else:
+        _print(extract_partitions(dump_path=args.dump_path, out_dir=args.out_dir, labels=args.label))
+
+
+def cmd_store_add(args: argparse.Namespace) -> None:
+    _print(
+        {
+            "ok": True,
+            "snapshots": [
+                add_snapshot(
+                    store_dir=args.store_dir,
+                    image_path=image_path,
+                    device=args.device,
+                    label=args.label,
+                )
+                for image_path in args.image_path
+            ],
+        }
+    )
+
+
+def cmd_store_list(args: argparse.Namespace) -> None:
+    _print(list_snapshots(store_dir=args.store_dir, device=args.device, label=args.label))
+
+
+def cmd_store_restore(args: argparse.Namespace) -> None:
+    _print(
+        restore_snapshot(
+            store_dir=args.store_dir,
+            snapshot_id=args.snapshot_id,
+            out_path=args.out_path,
+        )
+    )
+
+
+def cmd_store_prune(args: argparse.Namespace) -> None:
+    _print(prune_snapshots(store_dir=args.store_dir, keep_last=args.keep_last, dry_run=args.dry_run))
+
+
+def cmd_retention(args: argparse.Namespace) -> None:
+    policy = RetentionPolicy(
+        keep_last=args.keep_last,
+        keep_daily=args.keep_daily,
+        keep_weekly=args.keep_weekly,
+    )
+    _print(
+        apply_retention(
+            root=args.root,
+            policy=policy,
+            store_dir=args.store_dir,
+            dry_run=not args.apply,
+        )
+    )
+
+
+def cmd_audit_backups(args: argparse.Namespace) -> None:
+    _print(audit_backups(root=args.root, store_dir=args.store_dir, workers=args.workers))
+
+
+def cmd_inventory(args: argparse.Namespace) -> None:
+    _print(
+        query_inventory(
+            device=args.device,
+            stale_days=args.stale_days,
+            firmware_md5=args.firmware_md5,
         )
     )
 
@@ -114,6 +338,7 @@ def cmd_backup_state(args: argparse.Namespace) -> None:
             port=port,
             out_dir=args.out_dir,
             baud=args.baud,
+            progress=_progress(args),
         )
     )
 
@@ -125,6 +350,36 @@ def cmd_restore_full_backup(args: argparse.Namespace) -> None:
             port=port,
             backup_path=args.backup_path,
             baud=args.baud,
+            diff=args.diff,
+            dry_run=args.dry_run,
+            on_plan=_print_plan,
+            progress=_progress(args),
+        )
+    )
+
+
+def cmd_repartition(args: argparse.Namespace) -> None:
+    if args.table_path:
+        _print(
+            plan_repartition_offline(
+                current_table_path=args.table_path,
+                layout_path=args.layout_path,
+                flash_size=args.flash_size,
+                baud=args.baud,
+            )
+        )
+        return
+    port = resolve_codee_port(args.port)
+    _print(
+        repartition_device(
+            port=port,
+            layout_path=args.layout_path,
+            out_dir=args.out_dir,
+            flash_size=args.flash_size,
+            baud=args.baud,
+            dry_run=not args.apply,
+            on_plan=_print_plan,
+            progress=_progress(args),
         )
     )
 
@@ -139,6 +394,71 @@ def cmd_flash_firmware(args: argparse.Namespace) -> None:
             official_out_dir=args.official_out_dir,
             build_dir=args.build_dir,
             baud=args.baud,
+            progress=_progress(args),
+            verify=args.verify,
+            skip_unchanged=args.skip_unchanged,
+            cached_payload=args.cached_payload,
+        )
+    )
+
+
+def cmd_fleet(args: argparse.Namespace) -> None:
+    _print(
+        run_fleet(
+            ports=args.port,
+            steps=tuple(args.steps),
+            max_workers=args.workers,
+            source=args.source,
+            firmware_path=args.firmware_path,
+            official_out_dir=args.official_out_dir,
+            build_dir=args.build_dir,
+            out_dir=args.out_dir,
+            log_dir=args.log_dir,
+            baud=args.baud,
+            skip_unchanged=args.skip_unchanged,
+        )
+    )
+
+
+def _stage_limit(value: str) -> tuple[str, int]:
+    stage, _, limit = value.partition("=")
+    if stage not in PIPELINE_STAGES or not limit.isdigit() or int(limit) < 1:
+        raise argparse.ArgumentTypeError(f"expected STAGE=N with STAGE in {PIPELINE_STAGES}")
+    return stage, int(limit)
+
+
+def cmd_pipeline(args: argparse.Namespace) -> None:
+    _print(
+        run_pipeline(
+            ports=args.port,
+            stages=tuple(args.stages),
+            concurrency=dict(args.concurrency or []),
+            source=args.source,
+            firmware_path=args.firmware_path,
+            official_out_dir=args.official_out_dir,
+            build_dir=args.build_dir,
+            out_dir=args.out_dir,
+            deploy_dir=args.deploy_dir,
+            smoke_script=args.smoke_script,
+            baud=args.baud,
+            skip_unchanged=args.skip_unchanged,
+            verify=not args.no_verify,
+        )
+    )
+
+
+def cmd_inspect_firmware(args: argparse.Namespace) -> None:
+    _print(inspect_firmware_image(args.image_path))
+
+
+def cmd_verify_flash(args: argparse.Namespace) -> None:
+    port = resolve_codee_port(args.port)
+    _print(
+        verify_flash_image(
+            port=port,
+            image_path=args.image_path,
+            offset=args.offset,
+            baud=args.baud,
         )
     )
 
@@ -223,63 +543,260 @@ def cmd_apply_ips(args: argparse.Namespace) -> None:
 
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(prog="circuithack-cli")
+    p.add_argument(
+        "--progress",
+        action="store_true",
+        help="Stream JSON progress events (percent, bytes/s, ETA) to stderr during flash transfers.",
+    )
     sub = p.add_subparsers(dest="cmd", required=True)
 
     s = sub.add_parser("scan", help="Scan serial ports and detect Codee candidates.")
     s.set_defaults(func=cmd_scan)
 
+    s = sub.add_parser(
+        "probe",
+        help="Fingerprint Codee ports (chip, MAC, flash size) in parallel; cached until replug.",
+    )
+    s.add_argument("--port", action="append", help="Repeat for several; default: all candidates.")
+    s.add_argument("--timeout", type=float, default=PROBE_TIMEOUT)
+    s.add_argument("--workers", type=int, default=DEFAULT_PROBE_WORKERS)
+    s.add_argument("--refresh", action="store_true", help="Ignore cached fingerprints.")
+    s.set_defaults(func=cmd_probe)
+
+    s = sub.add_parser(
+        "watch",
+        help="Report serial devices as they attach and detach (JSON lines on stderr).",
+    )
+    s.add_argument("--next-codee", action="store_true", help="Exit once a Codee is plugged in.")
+    s.add_argument("--timeout", type=float, help="Seconds to watch (default: until Ctrl-C).")
+    s.add_argument("--interval", type=float, default=WATCH_INTERVAL)
+    s.set_defaults(func=cmd_watch)
+
     s = sub.add_parser("download-stock", help="Download latest official Codee stock firmware.")
     s.add_argument("--out-dir", default="downloads/codee")
     s.set_defaults(func=cmd_download)
 
     s = sub.add_parser("enter-programmer", help="Reset into ESP32S3 bootloader/programmer mode.")
     s.add_argument("--port")
-    s.add_argument("--baud", type=int, default=460800)
+    s.add_argument("--baud", type=int, help=_BAUD_HELP)
     s.set_defaults(func=cmd_programmer)
 
+    s = sub.add_parser(
+        "calibrate-baud",
+        help="Find the fastest stable esptool baud rate and cache it for this device.",
+    )
+    s.add_argument("--port")
+    s.add_argument("--no-save", action="store_true", help="Report the result without caching it.")
+    s.set_defaults(func=cmd_calibrate_baud)
+
     s = sub.add_parser("restore-stock", help="Flash stock Codee firmware at 0x0.")
     s.add_argument("--port")
     s.add_argument("--firmware-path")
-    s.add_argument("--baud", type=int, default=460800)
+    s.add_argument("--baud", type=int, help=_BAUD_HELP)
     s.set_defaults(func=cmd_restore)
 
     s = sub.add_parser("install-mpy-bin", help="Flash a MicroPython .bin at 0x0.")
     s.add_argument("--port")
     s.add_argument("--bin-path", required=True)
-    s.add_argument("--baud", type=int, default=460800)
+    s.add_argument("--baud", type=int, help=_BAUD_HELP)
     s.set_defaults(func=cmd_install_binary)
 
     s = sub.add_parser("install-mpy-source", help="Build CM_Codee MicroPython from CircuitMess fork and flash.")
     s.add_argument("--port")
     s.add_argument("--repo-dir", default="third_party/circuitmess-micropython")
     s.add_argument("--board", default="CM_Codee")
-    s.add_argument("--baud", type=int, default=460800)
+    s.add_argument("--baud", type=int, help=_BAUD_HELP)
+    s.add_argument(
+        "--freeze-dir",
+        help=f"Freeze this package into the firmware as bytecode (e.g. {DEFAULT_DEPLOY_DIR})",
+    )
     s.set_defaults(func=cmd_install_source)
 
-    s = sub.add_parser("run-script", help="Run a local Python script on device using mpremote.")
+    s = sub.add_parser("run-script", help="Run a local Python script on device over the raw REPL.")
     s.add_argument("--port")
     s.add_argument("--script-path", required=True)
     s.set_defaults(func=cmd_run)
 
+    s = sub.add_parser(
+        "deploy",
+        help="Upload only new or changed port-kit files and remove ones an earlier deploy left.",
+    )
+    s.add_argument("--port")
+    s.add_argument("--src-dir", default=DEFAULT_DEPLOY_DIR)
+    s.add_argument(
+        "--remote-dir",
+        default=DEFAULT_REMOTE_DIR,
+        help=f"Device package directory (default: {DEFAULT_REMOTE_DIR}).",
+    )
+    s.add_argument("--no-prune", action="store_true", help="Keep files removed locally.")
+    s.add_argument("--dry-run", action="store_true")
+    s.add_argument("--mpy", action="store_true", help="Ship .mpy precompiled for the device.")
+    s.add_argument("--mpy-out-dir", default=DEFAULT_MPY_OUT_DIR)
+    s.add_argument(
+        "--measure",
+        action="store_true",
+        help="Report import time and heap of the package before and after the sync.",
+    )
+    s.set_defaults(func=cmd_deploy)
+
+    s = sub.add_parser("mpy-build", help="Precompile the port kit to .mpy with mpy-cross (cached).")
+    s.add_argument("--src-dir", default=DEFAULT_DEPLOY_DIR)
+    s.add_argument("--out-dir", default=DEFAULT_MPY_OUT_DIR)
+    s.add_argument("--port")
+    s.add_argument(
+        "--match-device",
+        action="store_true",
+        help="Read the firmware's bytecode version and arch over the REPL and enforce them.",
+    )
+    s.set_defaults(func=cmd_mpy_build)
+
+    s = sub.add_parser(
+        "repl",
+        help="Run scripts, copies and evals in order over one raw-REPL connection.",
+    )
+    s.add_argument("--port")
+    for kind, metavar in (("run", "SCRIPT"), ("cp", "LOCAL[:REMOTE]"), ("eval", "EXPR")):
+        s.add_argument(
+            f"--{kind}",
+            dest="ops",
+            action="append",
+            metavar=metavar,
+            type=lambda value, kind=kind: (kind, value),
+        )
+    s.add_argument(
+        "--keep-state",
+        action="store_true",
+        help="Do not soft-reset before each --run; keep modules and globals between runs.",
+    )
+    s.set_defaults(func=cmd_repl)
+
     s = sub.add_parser("backup-full", help="Backup full flash (includes firmware and all partitions).")
     s.add_argument("--port")
     s.add_argument("--out-dir", default="backups")
     s.add_argument("--flash-size", type=lambda x: int(x, 0), default=0x400000)
-    s.add_argument("--baud", type=int, default=921600)
+    s.add_argument("--baud", type=int, help=_BAUD_HELP)
+    s.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Hash flash on device and read back only blocks changed since the last snapshot in --out-dir.",
+    )
+    s.add_argument("--sparse", action="store_true", help="Store the image as a sparse container.")
     s.set_defaults(func=cmd_backup_full)
 
+    s = sub.add_parser("sparse-pack", help="Convert a raw full-flash dump into a sparse container.")
+    s.add_argument("--raw-path", required=True)
+    s.add_argument("--out-path", help="Output path (default: <raw>.sparse).")
+    s.add_argument("--no-compress", action="store_true", help="Store extents without zlib compression.")
+    s.set_defaults(func=cmd_sparse_pack)
+
+    s = sub.add_parser("sparse-export", help="Expand a sparse container back into a raw .bin dump.")
+    s.add_argument("--sparse-path", required=True)
+    s.add_argument("--out-path", help="Output path (default: <sparse>.bin).")
+    s.set_defaults(func=cmd_sparse_export)
+
+    s = sub.add_parser(
+        "extract-partitions",
+        help="Export partitions from full-flash dumps on disk using the dump's own partition table.",
+    )
+    dump = s.add_mutually_exclusive_group(required=True)
+    dump.add_argument("--dump-path", help="A codee-fullflash-*.bin or .sparse dump.")
+    dump.add_argument("--dump-dir", help="Process every codee-fullflash-* dump in this directory.")
+    s.add_argument("--out-dir", help="Output directory (default: <dump dir>/extracted).")
+    s.add_argument("--label", action="append", help="Partition to export (repeatable; default: all).")
+    s.set_defaults(func=cmd_extract_partitions)
+
+    s = sub.add_parser("store-add", help="Add backup images to the deduplicating sector store.")
+    s.add_argument("--store-dir", default=DEFAULT_STORE_DIR)
+    s.add_argument("--image-path", action="append", required=True, help="Repeat for multiple images.")
+    s.add_argument("--device", default="unknown", help="Device id (e.g. USB serial number).")
+    s.add_argument("--label", help="Snapshot label (default: parsed from codee-<label>-<ts> names).")
+    s.set_defaults(func=cmd_store_add)
+
+    s = sub.add_parser("store-list", help="List snapshots in the deduplicating sector store.")
+    s.add_argument("--store-dir", default=DEFAULT_STORE_DIR)
+    s.add_argument("--device")
+    s.add_argument("--label")
+    s.set_defaults(func=cmd_store_list)
+
+    s = sub.add_parser("store-restore", help="Rebuild a snapshot from the sector store into a file.")
+    s.add_argument("--store-dir", default=DEFAULT_STORE_DIR)
+    s.add_argument("--snapshot-id", required=True)
+    s.add_argument("--out-path", required=True)
+    s.set_defaults(func=cmd_store_restore)
+
+    s = sub.add_parser("store-prune", help="Keep the newest N snapshots per device/label and drop unused sectors.")
+    s.add_argument("--store-dir", default=DEFAULT_STORE_DIR)
+    s.add_argument("--keep-last", type=int, required=True)
+    s.add_argument("--dry-run", action="store_true")
+    s.set_defaults(func=cmd_store_prune)
+
+    s = sub.add_parser(
+        "retention",
+        help="Prune timestamped backups and store snapshots per device with last/daily/weekly policies.",
+    )
+    s.add_argument("--root", default=DEFAULT_BACKUP_ROOT)
+    s.add_argument("--store-dir", default=DEFAULT_STORE_DIR)
+    s.add_argument("--keep-last", type=int, default=0, help="Newest N per device and label.")
+    s.add_argument("--keep-daily", type=int, default=0, help="Newest per day for the last D days.")
+    s.add_argument("--keep-weekly", type=int, default=0, help="Newest per week for the last W weeks.")
+    s.add_argument("--apply", action="store_true", help="Delete expired backups (default: report only).")
+    s.set_defaults(func=cmd_retention)
+
+    s = sub.add_parser(
+        "audit-backups",
+        help="Re-hash backup images and store sectors against their manifests on a process pool.",
+    )
+    s.add_argument("--root", default=DEFAULT_BACKUP_ROOT)
+    s.add_argument("--store-dir", default=DEFAULT_STORE_DIR)
+    s.add_argument("--workers", type=int, help="Worker processes (default: CPU count).")
+    s.set_defaults(func=cmd_audit_backups)
+
+    s = sub.add_parser(
+        "inventory",
+        help="Query known devices (serial, MAC, last firmware, last backup) without hardware.",
+    )
+    s.add_argument("--device", help="USB serial, MAC or last known port of one device.")
+    s.add_argument("--stale-days", type=int, help="Only devices not backed up for N days.")
+    s.add_argument("--firmware-md5", help="Only devices last flashed with this image.")
+    s.set_defaults(func=cmd_inventory)
+
     s = sub.add_parser("backup-state", help="Backup nvs + storage + factory using live partition table.")
     s.add_argument("--port")
     s.add_argument("--out-dir", default="backups")
-    s.add_argument("--baud", type=int, default=921600)
+    s.add_argument("--baud", type=int, help=_BAUD_HELP)
     s.set_defaults(func=cmd_backup_state)
 
-    s = sub.add_parser("restore-full-backup", help="Restore a full-flash backup at offset 0x0.")
+    s = sub.add_parser(
+        "restore-full-backup",
+        help="Restore a full-flash backup (raw or sparse) at offset 0x0.",
+    )
     s.add_argument("--port")
     s.add_argument("--backup-path", required=True)
-    s.add_argument("--baud", type=int, default=921600)
+    s.add_argument("--baud", type=int, help=_BAUD_HELP)
+    s.add_argument(
+        "--diff",
+        action="store_true",
+        help="Hash device flash and rewrite only sectors that differ from the backup.",
+    )
+    s.add_argument("--dry-run", action="store_true", help="Print the diff write plan and stop; nothing is written.")
     s.set_defaults(func=cmd_restore_full_backup)
 
+    s = sub.add_parser(
+        "repartition",
+        help="Plan (and with --apply, perform) a move to a new partition layout.",
+    )
+    s.add_argument("--layout-path", required=True, help="Target layout: ESP-IDF partitions CSV or table .bin.")
+    s.add_argument("--port")
+    s.add_argument(
+        "--table-path",
+        help="Plan offline against a saved partition table instead of reading the device.",
+    )
+    s.add_argument("--out-dir", default="backups/repartition", help="Where affected partitions are backed up.")
+    s.add_argument("--flash-size", type=lambda x: int(x, 0), default=DEFAULT_FLASH_SIZE)
+    s.add_argument("--baud", type=int, help=_BAUD_HELP)
+    s.add_argument("--apply", action="store_true", help="Back up, relocate and write the new table.")
+    s.set_defaults(func=cmd_repartition)
+
     s = sub.add_parser(
         "flash-firmware",
         help="Flash Codee firmware from official release, local build, or explicit path.",
@@ -289,9 +806,83 @@ def build_parser() -> argparse.ArgumentParser:
     s.add_argument("--firmware-path")
     s.add_argument("--official-out-dir", default="downloads/codee-official")
     s.add_argument("--build-dir", default="third_party/Codee-Firmware/build")
-    s.add_argument("--baud", type=int, default=460800)
+    s.add_argument("--baud", type=int, help=_BAUD_HELP)
+    s.add_argument(
+        "--verify",
+        action="store_true",
+        help="After flashing, compare device-side MD5s with the image's cached hashes.",
+    )
+    s.add_argument(
+        "--skip-unchanged",
+        action="store_true",
+        help="Write only plan extents (bootloader, table, apps, data partitions) whose MD5 differs.",
+    )
+    s.add_argument(
+        "--cached-payload",
+        action="store_true",
+        help="Write in-process from a deflate payload compressed once per image and cached.",
+    )
     s.set_defaults(func=cmd_flash_firmware)
 
+    s = sub.add_parser(
+        "fleet",
+        help="Run backup/flash/verify on many Codees in parallel (default: all detected).",
+    )
+    s.add_argument("--port", action="append", help="Repeat for each device; omit to use all detected.")
+    s.add_argument("--steps", nargs="+", choices=FLEET_STEPS, default=list(FLEET_STEPS))
+    s.add_argument("--workers", type=int, default=DEFAULT_FLEET_WORKERS)
+    s.add_argument("--source", choices=FIRMWARE_SOURCES, default="official")
+    s.add_argument("--firmware-path")
+    s.add_argument("--official-out-dir", default="downloads/codee-official")
+    s.add_argument("--build-dir", default="third_party/Codee-Firmware/build")
+    s.add_argument("--out-dir", default="backups/fleet")
+    s.add_argument("--log-dir", default=DEFAULT_FLEET_LOG_DIR)
+    s.add_argument("--baud", type=int, help=_BAUD_HELP)
+    s.add_argument("--skip-unchanged", action="store_true")
+    s.set_defaults(func=cmd_fleet)
+
+    s = sub.add_parser(
+        "pipeline",
+        help="Provision devices through detect/backup/flash/deploy/smoke stages with per-stage limits.",
+    )
+    s.add_argument("--port", action="append", help="Repeat for each device; omit to use all detected.")
+    s.add_argument("--stages", nargs="+", choices=PIPELINE_STAGES, default=list(PIPELINE_STAGES))
+    s.add_argument(
+        "--concurrency",
+        action="append",
+        type=_stage_limit,
+        metavar="STAGE=N",
+        help="Worker limit for one stage, e.g. --concurrency flash=2 (repeatable).",
+    )
+    s.add_argument("--source", choices=FIRMWARE_SOURCES, default="official")
+    s.add_argument("--firmware-path")
+    s.add_argument("--official-out-dir", default="downloads/codee-official")
+    s.add_argument("--build-dir", default="third_party/Codee-Firmware/build")
+    s.add_argument("--out-dir", default="backups/fleet")
+    s.add_argument("--deploy-dir", default=DEFAULT_DEPLOY_DIR)
+    s.add_argument("--smoke-script")
+    s.add_argument("--baud", type=int, help=_BAUD_HELP)
+    s.add_argument("--skip-unchanged", action="store_true")
+    s.add_argument("--no-verify", action="store_true", help="Skip the post-flash MD5 check.")
+    s.set_defaults(func=cmd_pipeline)
+
+    s = sub.add_parser(
+        "inspect-firmware",
+        help="Parse an ESP32-S3 firmware image and print its segments and flash plan.",
+    )
+    s.add_argument("--image-path", required=True)
+    s.set_defaults(func=cmd_inspect_firmware)
+
+    s = sub.add_parser(
+        "verify-flash",
+        help="Check an image against device flash by MD5 without reading it back.",
+    )
+    s.add_argument("--port")
+    s.add_argument("--image-path", required=True)
+    s.add_argument("--offset", type=lambda x: int(x, 0), default=0)
+    s.add_argument("--baud", type=int, help=_BAUD_HELP)
+    s.set_defaults(func=cmd_verify_flash)
+
     s = sub.add_parser(
         "decode-nvs",
         help="Decode Codee save-state fields from an NVS backup binary.",
@@ -4,7 +4,12 @@ from pathlib import Path
 
 from .firmware import download_asset, latest_stock_asset
 from .flash import write_flash_zero
+from .fwimage import flash_image_by_plan
+from .inventory import mac_from_esptool_output, record_flash
 from .nvsdecode import decode_codee_nvs_backup
+from .payloadcache import write_image_cached
+from .progress import ProgressCallback
+from .verify import verify_flash_image
 
 
 FIRMWARE_SOURCE_OFFICIAL = "official"
@@ -53,24 +58,50 @@ def flash_codee_firmware(
     firmware_path: str | None = None,
     official_out_dir: str = "downloads/codee-official",
     build_dir: str = "third_party/Codee-Firmware/build",
-    baud: int = 460800,
+    baud: int | None = None,
+    progress: ProgressCallback | None = None,
+    verify: bool = False,
+    skip_unchanged: bool = False,
+    cached_payload: bool = False,
 ) -> dict:
+    """Flash firmware at 0x0, or with `skip_unchanged` only the image extents that differ.
+
+    `skip_unchanged` builds a flash plan from the image (bootloader, partition table,
+    apps) and already re-checks every written extent by MD5, so `verify` adds nothing.
+    `cached_payload` writes through the stub in-process from a deflate stream built
+    once per image instead of running esptool (which recompresses on every call).
+    Successful flashes are recorded in the device inventory.
+    """
     fw_path, source_info = resolve_codee_firmware_path(
         source=source,
         firmware_path=firmware_path,
         official_out_dir=official_out_dir,
         build_dir=build_dir,
     )
-    res = write_flash_zero(port=port, firmware_bin=fw_path, baud=baud)
-    return {
-        "ok": res.ok,
+    result = {
         "port": port,
         "firmware_path": str(fw_path),
         "source": source_info.get("source"),
         "source_info": source_info,
-        "stdout": res.stdout,
-        "stderr": res.stderr,
     }
+    if skip_unchanged:
+        plan = flash_image_by_plan(port=port, image_path=fw_path, baud=baud, progress=progress)
+        result = {**result, "ok": plan["ok"], "plan": plan}
+        mac = plan.get("mac")
+    elif cached_payload:
+        write = write_image_cached(port=port, image_path=fw_path, baud=baud, progress=progress)
+        result = {**result, "ok": write["ok"], "write": write}
+        mac = write.get("mac")
+    else:
+        res = write_flash_zero(port=port, firmware_bin=fw_path, baud=baud, progress=progress)
+        result = {**result, "ok": res.ok, "stdout": res.stdout, "stderr": res.stderr}
+        mac = mac_from_esptool_output(res.stdout)
+    if verify and result["ok"]:
+        result["verify"] = verify_flash_image(port=port, image_path=fw_path, baud=baud)
+        result["ok"] = result["verify"]["ok"]
+    if result["ok"]:
+        record_flash(port, fw_path, {"source": source_info.get("source")}, mac=mac)
+    return result
 
 
 def decode_codee_savegame(
@@ -0,0 +1,248 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from .mpycross import DEFAULT_MPY_OUT_DIR, compile_port_kit, device_mpy_target, measure_import
+from .replsession import ReplSession, repl_pool
+
+DEFAULT_DEPLOY_DIR = "ports/codee"
+DEFAULT_REMOTE_DIR = "codee"  # the kit is a package; its modules use relative imports
+DEPLOY_PATTERNS = ("*.py", "*.mpy")
+DEPLOY_MANIFEST = ".circuithack-deploy.json"
+DEPLOY_CHUNK_SIZE = 4096  # raw bytes per exec; keeps the base64 literal small on the device heap
+
+# Runs on the device: SHA-256 of every path in LOCAL plus those the previous deploy to
+# the same remote_dir recorded, printed with the whole manifest as one JSON line, so
+# the listing is a single raw-REPL round trip. The manifest maps each remote_dir to the
+# files deployed there; an older flat list is grouped by parent directory.
+_LISTING = """
+import hashlib, binascii, json
+def _h(p):
+    h = hashlib.sha256()
+    b = bytearray(1024)
+    try:
+        with open(p, 'rb') as f:
+            while True:
+                n = f.readinto(b)
+                if not n:
+                    break
+                h.update(b if n == len(b) else b[:n])
+    except OSError:
+        return None
+    return binascii.hexlify(h.digest()).decode()
+try:
+    with open({manifest!r}) as f:
+        _m = json.load(f)
+except (OSError, ValueError):
+    _m = {{}}
+if isinstance(_m, list):
+    _g = {{}}
+    for _p in _m:
+        _g.setdefault(_p.rsplit('/', 1)[0] if '/' in _p else '', []).append(_p)
+    _m = _g
+_k = set(_m.get({key!r}, [])) | set({local!r})
+print(json.dumps({{'manifest': _m, 'hashes': {{p: _h(p) for p in _k}}}}))
+"""
+
+_MKDIRS = """
+import os
+for _d in {dirs!r}:
+    try:
+        os.mkdir(_d)
+    except OSError:
+        pass
+"""
+
+_OPEN = "import binascii\n_f = open({path!r}, 'wb')\n"
+_CHUNK = "_f.write(binascii.a2b_base64({data!r}))\n"
+_CLOSE = "_f.close()\n"
+
+_REMOVE = """
+import os
+for _p in {paths!r}:
+    try:
+        os.remove(_p)
+    except OSError:
+        pass
+"""
+
+_WRITE_MANIFEST = """
+import json
+with open({manifest!r}, 'w') as f:
+    json.dump({entries!r}, f)
+"""
+
+
+def deploy_files(deploy_dir: str | Path) -> list[Path]:
+    """Modules at the top of `deploy_dir`; subdirectories (such as wokwi/) are not deployed."""
+    deploy_dir = Path(deploy_dir)
+    return sorted({p for pattern in DEPLOY_PATTERNS for p in deploy_dir.glob(pattern)})
+
+
+def remote_path(remote_dir: str, name: str) -> str:
+    return f"{remote_dir.strip('/')}/{name}" if remote_dir.strip("/") else name
+
+
+def py_source(path: str) -> str | None:
+    """The .py file a deployed .mpy must replace: MicroPython imports the .py first."""
+    return f"{path[: -len('.mpy')]}.py" if path.endswith(".mpy") else None
+
+
+@dataclass(frozen=True)
+class DeployPlan:
+    upload: list[str]
+    unchanged: list[str]
+    remove: list[str]
+
+    def to_dict(self) -> dict:
+        return {"upload": self.upload, "unchanged": self.unchanged, "remove": self.remove}
+
+
+def plan_deploy(
+    local: dict[str, str],
+    remote: dict[str, str | None],
+    managed: list[str],
+) -> DeployPlan:
+    """Upload new or changed files; remove files an earlier deploy put there that are gone now.
+
+    Only paths recorded in the device's deploy manifest are ever removed, so boot.py,
+    main.py and save files are left alone. The one exception is the .py source of a
+    deployed .mpy, which would otherwise shadow it.
+    """
+    upload = sorted(p for p, digest in local.items() if remote.get(p) != digest)
+    unchanged = sorted(p for p in local if p not in upload)
+    stale = set(managed) | ({py_source(p) for p in local} - {None})
+    remove = sorted(p for p in stale - set(local) if remote.get(p) is not None)
+    return DeployPlan(upload=upload, unchanged=unchanged, remove=remove)
+
+
+def _exec(session: ReplSession, code: str) -> str:
+    stdout, stderr = session.exec(code, timeout=60)
+    if stderr:
+        raise RuntimeError(stderr.strip())
+    return stdout
+
+
+def read_device_hashes(
+    session: ReplSession,
+    paths: list[str],
+    remote_dir: str = "",
+) -> tuple[dict, dict[str, list[str]]]:
+    """Device hashes of `paths` and of the files managed under `remote_dir`, plus the manifest."""
+    code = _LISTING.format(manifest=DEPLOY_MANIFEST, key=remote_dir.strip("/"), local=paths)
+    listing = json.loads(_exec(session, code))
+    return listing["hashes"], listing["manifest"]
+
+
+def _upload(session: ReplSession, path: str, data: bytes) -> None:
+    # One exec per chunk; the first also opens the file and the last closes it.
+    chunks = [data[i : i + DEPLOY_CHUNK_SIZE] for i in range(0, len(data), DEPLOY_CHUNK_SIZE)]
+    chunks = chunks or [b""]
+    for i, chunk in enumerate(chunks):
+        code = _OPEN.format(path=path) if i == 0 else ""
+        code += _CHUNK.format(data=base64.b64encode(chunk))
+        if i == len(chunks) - 1:
+            code += _CLOSE
+        _exec(session, code)
+
+
+def _sync(
+    session: ReplSession,
+    files: dict[str, Path],
+    remote_dir: str,
+    prune: bool,
+    dry_run: bool,
+) -> dict:
+    local = {path: hashlib.sha256(p.read_bytes()).hexdigest() for path, p in files.items()}
+    sources = {py_source(p) for p in local} - {None}
+    remote, manifest = read_device_hashes(session, sorted(set(local) | sources), remote_dir)
+    key = remote_dir.strip("/")
+    managed = manifest.get(key, [])
+    plan = plan_deploy(local, remote, managed if prune else [])
+    if dry_run:
+        return {"plan": plan.to_dict()}
+    dirs = sorted({str(Path(p).parent) for p in plan.upload} - {"."})
+    if dirs:
+        parents = {"/".join(d.split("/")[: i + 1]) for d in dirs for i in range(d.count("/") + 1)}
+        _exec(session, _MKDIRS.format(dirs=sorted(parents)))
+    sent = 0
+    for path in plan.upload:
+        data = files[path].read_bytes()
+        _upload(session, path, data)
+        sent += len(data)
+    if plan.remove:
+        _exec(session, _REMOVE.format(paths=plan.remove))
+    kept = sorted(set(local) if prune else (set(local) | set(managed)) - set(plan.remove))
+    if plan.upload or plan.remove or sorted(managed) != kept:
+        entries = {**manifest, key: kept}
+        _exec(session, _WRITE_MANIFEST.format(manifest=DEPLOY_MANIFEST, entries=entries))
+    return {
+        "plan": plan.to_dict(),
+        "uploaded": len(plan.upload),
+        "unchanged": len(plan.unchanged),
+        "removed": len(plan.remove),
+        "bytes_sent": sent,
+    }
+
+
+def _import_saving(before: dict, after: dict) -> dict | None:
+    if not (before["ok"] and after["ok"]):
+        return None
+    return {
+        key: before[key] - after[key]
+        for key in ("import_us", "heap_allocated", "heap_retained")
+    }
+
+
+def deploy_port_kit(
+    port: str,
+    src_dir: str | Path = DEFAULT_DEPLOY_DIR,
+    remote_dir: str = DEFAULT_REMOTE_DIR,
+    prune: bool = True,
+    dry_run: bool = False,
+    mpy: bool = False,
+    mpy_out_dir: str | Path = DEFAULT_MPY_OUT_DIR,
+    measure: bool = False,
+) -> dict:
+    """Sync the port kit into the `remote_dir` package on the device, sending only what changed.
+
+    Device hashes come back in one round trip; uploads, removals and the updated
+    deploy manifest all go over the same pooled raw-REPL session. With `mpy` the kit
+    is first precompiled for the device's bytecode version and the .mpy files
+    replace the sources. `measure` imports the package (the last part of
+    `remote_dir`) before and after the sync and reports the time and heap saved.
+    """
+    start = time.monotonic()
+    result: dict = {"port": port, "src_dir": str(src_dir), "dry_run": dry_run}
+    package = remote_dir.strip("/").split("/")[-1]
+    if measure and not package:
+        return {**result, "ok": False, "error": "measure needs remote_dir, the package directory"}
+    sync_dir = Path(src_dir)
+    try:
+        if mpy:
+            build = compile_port_kit(src_dir, out_dir=mpy_out_dir, target=device_mpy_target(port))
+            result["mpy"] = build
+            if not build["ok"]:
+                return {**result, "ok": False, "error": build["error"]}
+            sync_dir = Path(build["out_dir"])
+        before = measure_import(port, package) if measure and not dry_run else None
+        files = {remote_path(remote_dir, p.name): p for p in deploy_files(sync_dir)}
+        with repl_pool().session(port) as session:
+            result.update(
+                _sync(session, files, remote_dir=remote_dir, prune=prune, dry_run=dry_run)
+            )
+    except Exception as exc:  # noqa: BLE001 - transport and device errors are reported, not raised
+        return {**result, "ok": False, "error": str(exc)}
+    if before is not None:
+        after = measure_import(port, package)
+        result["import"] = {
+            "before": before,
+            "after": after,
+            "saved": _import_saving(before, after),
+        }
+    return {**result, "ok": True, "seconds": round(time.monotonic() - start, 3)}
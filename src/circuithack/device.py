@@ -1,15 +1,22 @@
 from __future__ import annotations
 
 import glob
+import os
 import platform
 import subprocess
+import threading
+import time
+from collections import deque
 from dataclasses import asdict, dataclass
+from typing import Callable
 
 from serial.tools import list_ports
 
 
 KNOWN_ESPRESSIF_VIDS = {0x303A}
 LIKELY_USB_PATTERNS = ("usb", "acm", "modem", "wch", "cp210", "ch340", "serial")
+SERIAL_NODE_PREFIXES = ("ttyACM", "ttyUSB", "cu.", "tty.")
+WATCH_INTERVAL = 0.5
 
 
 @dataclass
@@ -51,24 +58,245 @@ def list_serial_devices(only_likely_usb: bool = True) -> list[SerialDevice]:
     return out
 
 
+def is_codee_candidate(d: SerialDevice) -> bool:
+    text = " ".join(x or "" for x in [d.path, d.description, d.manufacturer, d.product]).lower()
+    return d.vid in KNOWN_ESPRESSIF_VIDS or "espressif" in text or "usbmodem" in text
+
+
 def detect_codee_candidates() -> list[SerialDevice]:
-    candidates: list[SerialDevice] = []
-    for d in list_serial_devices(only_likely_usb=True):
-        text = " ".join(
-            x or "" for x in [d.path, d.description, d.manufacturer, d.product]
-        ).lower()
-        if d.vid in KNOWN_ESPRESSIF_VIDS or "espressif" in text or "usbmodem" in text:
-            candidates.append(d)
-    return candidates
+    return [d for d in list_serial_devices(only_likely_usb=True) if is_codee_candidate(d)]
+
+
+def serial_number_for_port(port: str) -> str | None:
+    """USB serial number behind a port path, or None for non-USB/network ports."""
+    for p in list_ports.comports():
+        if p.device == port:
+            return p.serial_number
+    return None
+
+
+def serial_node_names(dev_dir: str = "/dev") -> frozenset[tuple[str, int, int]] | None:
+    """Serial device nodes with their inode and change time, from a single directory read.
+
+    A replugged device gets a fresh node, so the set also changes when the same path
+    comes back. None where there is no /dev (Windows): callers enumerate every time.
+    """
+    try:
+        with os.scandir(dev_dir) as entries:
+            return frozenset(
+                (e.name, e.inode(), e.stat(follow_symlinks=False).st_ctime_ns)
+                for e in entries
+                if e.name.startswith(SERIAL_NODE_PREFIXES)
+            )
+    except OSError:
+        return None
+
+
+@dataclass(frozen=True)
+class DeviceEvent:
+    kind: str  # "attach" or "detach"
+    device: SerialDevice
+    at: float
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "at": self.at, **self.device.to_dict()}
+
+
+DeviceListener = Callable[[DeviceEvent], None]
+_UNSCANNED = object()
+
+
+class DeviceWatcher:
+    """Live registry of attached USB serial devices, kept current by a background thread.
+
+    Each poll lists /dev once; the full port enumeration (sysfs on Linux, IOKit on
+    macOS) reruns only when the set of serial nodes changes, so an idle watcher costs
+    one directory read per interval. Lookups answer from the registry.
+    """
+
+    def __init__(
+        self,
+        interval: float = WATCH_INTERVAL,
+        dev_dir: str = "/dev",
+        enumerate_devices: Callable[[], list[SerialDevice]] | None = None,
+    ) -> None:
+        self.interval = interval
+        self.dev_dir = dev_dir
+        self._enumerate = enumerate_devices or (lambda: list_serial_devices(only_likely_usb=True))
+        self._cond = threading.Condition()
+        self._devices: dict[str, SerialDevice] = {}
+        self._candidates: list[SerialDevice] = []
+        self._nodes: object = _UNSCANNED
+        self._events: deque[tuple[int, DeviceEvent]] = deque(maxlen=256)
+        self._seq = 0
+        self._listeners: list[DeviceListener] = []
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def add_listener(self, listener: DeviceListener) -> None:
+        """Call `listener` from the watcher thread for every attach and detach."""
+        self._listeners.append(listener)
+
+    def poll(self) -> list[DeviceEvent]:
+        """Refresh the registry once and return the attach/detach events it produced."""
+        nodes = serial_node_names(self.dev_dir)
+        if nodes is not None and nodes == self._nodes:
+            return []
+        current = {d.path: d for d in self._enumerate()}
+        now = time.time()
+        with self._cond:
+            events = [
+                DeviceEvent("detach", d, now)
+                for path, d in self._devices.items()
+                if current.get(path) != d
+            ]
+            events += [
+                DeviceEvent("attach", d, now)
+                for path, d in current.items()
+                if self._devices.get(path) != d
+            ]
+            self._devices = current
+            self._candidates = sorted(
+                (d for d in current.values() if is_codee_candidate(d)),
+                key=lambda d: d.path,
+            )
+            self._nodes = nodes
+            for event in events:
+                self._seq += 1
+                self._events.append((self._seq, event))
+            self._cond.notify_all()
+        for event in events:
+            for listener in self._listeners:
+                listener(event)
+        return events
+
+    def devices(self) -> list[SerialDevice]:
+        with self._cond:
+            return sorted(self._devices.values(), key=lambda d: d.path)
+
+    def candidates(self) -> list[SerialDevice]:
+        with self._cond:
+            return list(self._candidates)
+
+    def first_candidate(self) -> SerialDevice | None:
+        with self._cond:
+            return self._candidates[0] if self._candidates else None
+
+    def recent_events(self) -> list[DeviceEvent]:
+        with self._cond:
+            return [event for _, event in self._events]
+
+    def _attached_since(self, seq: int) -> SerialDevice | None:
+        for n, event in self._events:
+            device = event.device
+            if (
+                n > seq
+                and event.kind == "attach"
+                and is_codee_candidate(device)
+                and self._devices.get(device.path) == device
+            ):
+                return device
+        return None
+
+    def wait_for_codee(self, timeout: float | None = None) -> SerialDevice | None:
+        """Block until a Codee candidate is plugged in after this call; None on timeout.
+
+        Without the background thread the caller polls at the watcher's interval.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            seen = self._seq
+        while True:
+            if not self.running:
+                self.poll()
+            with self._cond:
+                found = self._attached_since(seen)
+                if found is not None:
+                    return found
+                wait = self.interval
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    wait = min(wait, remaining)
+                self._cond.wait(wait)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:  # noqa: BLE001 - a failed enumeration is retried next interval
+                continue
+
+    def start(self) -> DeviceWatcher:
+        """Populate the registry, then keep it current from a daemon thread."""
+        if not self.running:
+            self.poll()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="device-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> DeviceWatcher:
+        return self.start()
+
+    def __exit__(self, *exc: object) -> None:
+        self.stop()
+
+
+_watcher: DeviceWatcher | None = None
+_watcher_lock = threading.Lock()
+
+
+def start_device_watcher(interval: float = WATCH_INTERVAL) -> DeviceWatcher:
+    """The shared watcher; once it runs, port resolution answers from its registry."""
+    global _watcher
+    with _watcher_lock:
+        if _watcher is None or not _watcher.running:
+            _watcher = DeviceWatcher(interval=interval).start()
+        return _watcher
+
+
+def stop_device_watcher() -> None:
+    global _watcher
+    with _watcher_lock:
+        if _watcher is not None:
+            _watcher.stop()
+            _watcher = None
+
+
+def active_device_watcher() -> DeviceWatcher | None:
+    watcher = _watcher
+    return watcher if watcher is not None and watcher.running else None
+
+
+def codee_candidates() -> list[SerialDevice]:
+    """Codee candidates from the running watcher, or a fresh enumeration without one."""
+    watcher = active_device_watcher()
+    return watcher.candidates() if watcher else detect_codee_candidates()
 
 
 def resolve_codee_port(port: str | None) -> str:
     if port:
         return port
-    candidates = detect_codee_candidates()
-    if not candidates:
+    watcher = active_device_watcher()
+    if watcher:
+        found = watcher.first_candidate()
+    else:
+        found = next(iter(detect_codee_candidates()), None)
+    if found is None:
         raise RuntimeError("No Codee-like USB serial device found.")
-    return candidates[0].path
+    return found.path
 
 
 def macos_usb_summary() -> str:
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+from .flashmap import SECTOR_SIZE, Extent, coalesce_extents, is_erased, split_blocks, total_size
+
+
+@dataclass(frozen=True)
+class BlankAwarePlan:
+    """How to bring flash regions to the target bytes without touching blank sectors.
+
+    The stub erases every sector it writes, so sectors left out of `write` are also
+    left out of the erase set. Sectors whose target is all 0xFF are erased only when
+    the device does not already read them as blank.
+    """
+
+    write: list[Extent]
+    erase: list[Extent]
+    skipped: list[Extent]
+
+    def to_dict(self) -> dict:
+        return {
+            "write": [e.to_dict() for e in self.write],
+            "erase": [e.to_dict() for e in self.erase],
+            "bytes_to_write": total_size(self.write),
+            "bytes_erase_only": total_size(self.erase),
+            "bytes_skipped_blank": total_size(self.skipped),
+            "sectors_skipped_blank": total_size(self.skipped) // SECTOR_SIZE,
+        }
+
+
+def _sectors(regions: list[Extent]) -> list[Extent]:
+    return [
+        sector
+        for region in coalesce_extents(regions)
+        for sector in split_blocks(region.offset, region.size, SECTOR_SIZE)
+    ]
+
+
+def _whole_blank_sector(data: bytes | memoryview, sector: Extent, base: int) -> bool:
+    # Partial sectors share an erase unit with bytes outside the region, so they are always written.
+    return (
+        sector.offset % SECTOR_SIZE == 0
+        and sector.size == SECTOR_SIZE
+        and is_erased(data[sector.offset - base : sector.end - base])
+    )
+
+
+def blank_target_sectors(data: bytes, regions: list[Extent], base: int = 0) -> list[Extent]:
+    """Whole sectors inside `regions` whose target bytes (`data` placed at `base`) are all 0xFF."""
+    view = memoryview(data)
+    return coalesce_extents([s for s in _sectors(regions) if _whole_blank_sector(view, s, base)])
+
+
+def plan_blank_aware(
+    data: bytes,
+    regions: list[Extent],
+    device_blank: list[Extent],
+    base: int = 0,
+) -> BlankAwarePlan:
+    """Split `regions` of `data` (placed at `base`) into write, erase-only and skipped sectors.
+
+    `device_blank` lists the extents already erased on the device, e.g. from
+    `FlashSession.blank_extents(blank_target_sectors(...))`.
+    """
+    view = memoryview(data)
+    blank = coalesce_extents(device_blank)
+    write: list[Extent] = []
+    erase: list[Extent] = []
+    skipped: list[Extent] = []
+    for sector in _sectors(regions):
+        if not _whole_blank_sector(view, sector, base):
+            write.append(sector)
+        elif any(b.offset <= sector.offset and sector.end <= b.end for b in blank):
+            skipped.append(sector)
+        else:
+            erase.append(sector)
+    return BlankAwarePlan(
+        write=coalesce_extents(write),
+        erase=coalesce_extents(erase),
+        skipped=coalesce_extents(skipped),
+    )
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import hashlib
+import mmap
+import re
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator
+
+from .partitions import (
+    PARTITION_TABLE_OFFSET,
+    PARTITION_TABLE_SIZE,
+    PartitionEntry,
+    parse_partition_table_bytes,
+)
+from .sparseimage import SparseImage, is_sparse_image, read_sparse_image
+
+DUMP_PATTERNS = ("codee-fullflash-*.bin", "codee-fullflash-*.sparse")
+_DUMP_NAME = re.compile(r"^codee-fullflash-(?P<ts>\d{8}-\d{6})$")
+
+
+class _SparseView:
+    """Slice-only view of a sparse container; a slice decompresses just the extents it touches."""
+
+    def __init__(self, image: SparseImage) -> None:
+        self.image = image
+
+    def __len__(self) -> int:
+        return self.image.flash_size
+
+    def __getitem__(self, key: slice) -> bytes:
+        start, stop, _ = key.indices(self.image.flash_size)
+        out = bytearray(b"\xFF" * max(stop - start, 0))
+        for extent in self.image.extents:
+            lo, hi = max(start, extent.offset), min(stop, extent.offset + extent.size)
+            if lo < hi:
+                data = self.image.read_extent(extent)
+                out[lo - start : hi - start] = data[lo - extent.offset : hi - extent.offset]
+        return bytes(out)
+
+
+@contextmanager
+def open_flash_dump(path: str | Path) -> Iterator[memoryview | _SparseView]:
+    """Sliceable view of a full-flash dump without reading it into memory.
+
+    Raw dumps are memory-mapped, so slices are served by the page cache; sparse
+    containers decompress only the extents a slice overlaps. Slices of a raw view
+    must not outlive the block.
+    """
+    path = Path(path)
+    if is_sparse_image(path):
+        yield _SparseView(read_sparse_image(path))
+        return
+    with path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        with memoryview(mapped) as view:
+            yield view
+
+
+def dump_partition_table(view: memoryview | _SparseView) -> list[PartitionEntry]:
+    if len(view) < PARTITION_TABLE_OFFSET + PARTITION_TABLE_SIZE:
+        raise ValueError(f"Dump is {len(view)} bytes, too short to hold a partition table")
+    return parse_partition_table_bytes(
+        bytes(view[PARTITION_TABLE_OFFSET : PARTITION_TABLE_OFFSET + PARTITION_TABLE_SIZE])
+    )
+
+
+def extracted_name(dump_path: str | Path, label: str) -> str:
+    """'codee-fullflash-<ts>.bin' -> 'codee-<label>-<ts>.bin', matching backup-state names."""
+    stem = Path(dump_path).stem
+    match = _DUMP_NAME.match(stem)
+    return f"codee-{label}-{match.group('ts')}.bin" if match else f"{stem}-{label}.bin"
+
+
+def read_dump_partition(dump_path: str | Path, label: str) -> bytes:
+    """Bytes of one partition from a full-flash dump, e.g. nvs for decode-nvs."""
+    with open_flash_dump(dump_path) as view:
+        for entry in dump_partition_table(view):
+            if entry.label == label:
+                return bytes(view[entry.offset : entry.offset + entry.size])
+    raise KeyError(f"No partition '{label}' in {dump_path}")
+
+
+def _write_slice(view: memoryview | _SparseView, offset: int, size: int, out_path: Path) -> dict:
+    chunk = view[offset : offset + size]
+    try:
+        out_path.write_bytes(chunk)
+        return {"path": str(out_path), "size": len(chunk), "md5": hashlib.md5(chunk).hexdigest()}
+    finally:
+        # A live slice would keep the mmap from closing.
+        if isinstance(chunk, memoryview):
+            chunk.release()
+
+
+def extract_partitions(
+    dump_path: str | Path,
+    out_dir: str | Path | None = None,
+    labels: list[str] | None = None,
+) -> dict:
+    """Export the partition table and partitions of a full-flash dump as separate files.
+
+    The table is parsed from the dump itself. `labels` limits the export to named
+    partitions; partitions extending past the end of the dump are truncated and flagged.
+    """
+    dump_path = Path(dump_path)
+    out_dir = Path(out_dir) if out_dir else dump_path.parent / "extracted"
+    try:
+        with open_flash_dump(dump_path) as view:
+            entries = dump_partition_table(view)
+            missing = sorted(set(labels or []) - {e.label for e in entries})
+            if missing:
+                raise KeyError(f"Partitions not in the dump's table: {', '.join(missing)}")
+            out_dir.mkdir(parents=True, exist_ok=True)
+            table = _write_slice(
+                view,
+                PARTITION_TABLE_OFFSET,
+                PARTITION_TABLE_SIZE,
+                out_dir / extracted_name(dump_path, "partitions"),
+            )
+            partitions = []
+            for entry in entries:
+                if labels and entry.label not in labels:
+                    continue
+                written = _write_slice(
+                    view,
+                    entry.offset,
+                    entry.size,
+                    out_dir / extracted_name(dump_path, entry.label),
+                )
+                partitions.append(
+                    {**entry.to_dict(), **written, "truncated": written["size"] < entry.size}
+                )
+    except (OSError, ValueError, KeyError) as exc:
+        return {"ok": False, "dump_path": str(dump_path), "error": str(exc)}
+    return {
+        "ok": True,
+        "dump_path": str(dump_path),
+        "out_dir": str(out_dir),
+        "partition_table": {**table, "entries": [e.to_dict() for e in entries]},
+        "partitions": partitions,
+    }
+
+
+def find_flash_dumps(dump_dir: str | Path) -> list[Path]:
+    dump_dir = Path(dump_dir)
+    return sorted({p for pattern in DUMP_PATTERNS for p in dump_dir.glob(pattern)})
+
+
+def extract_partitions_batch(
+    dump_dir: str | Path,
+    out_dir: str | Path | None = None,
+    labels: list[str] | None = None,
+) -> dict:
+    """Run `extract_partitions` over every full-flash dump in a directory.
+
+    A bad dump is reported in its own entry and does not stop the batch.
+    """
+    dump_dir = Path(dump_dir)
+    out_dir = Path(out_dir) if out_dir else dump_dir / "extracted"
+    results = [
+        extract_partitions(path, out_dir=out_dir, labels=labels)
+        for path in find_flash_dumps(dump_dir)
+    ]
+    return {
+        "ok": all(r["ok"] for r in results),
+        "dump_dir": str(dump_dir),
+        "out_dir": str(out_dir),
+        "dumps": len(results),
+        "failed": sum(1 for r in results if not r["ok"]),
+        "results": results,
+    }
@@ -3,7 +3,9 @@ from __future__ import annotations
 import shutil
 from pathlib import Path
 
-from .util import CommandResult, run_cmd
+from .baudrate import DEFAULT_BAUD, DEFAULT_TRANSFER_BAUD, resolve_baud
+from .progress import ProgressCallback, esptool_output_handler
+from .util import CommandResult, release_port, run_cmd
 
 
 def esptool_executable() -> list[str]:
@@ -34,27 +36,49 @@ def build_esptool_base(
     ]
 
 
-def enter_programmer_mode(port: str, baud: int = 460800) -> CommandResult:
+def enter_programmer_mode(port: str, baud: int | None = None) -> CommandResult:
     # chip_id requires successful ROM bootloader handshake.
     cmd = build_esptool_base(
         port=port,
-        baud=baud,
+        baud=resolve_baud(port, baud, DEFAULT_BAUD),
         chip="esp32s3",
         before="default-reset",
         after="no-reset",
     ) + ["chip-id"]
-    return run_cmd(cmd)
+    return _run_esptool(port, cmd)
 
 
-def erase_flash(port: str, baud: int = 460800) -> CommandResult:
+def _run_esptool(
+    port: str,
+    cmd: list[str],
+    timeout: int = 180,
+    progress: ProgressCallback | None = None,
+) -> CommandResult:
+    # esptool needs the port to itself; a pooled REPL session would hold it open.
+    release_port(port)
+    return run_cmd(cmd, timeout=timeout, on_line=_progress_handler(progress))
+
+
+def _progress_handler(progress: ProgressCallback | None):
+    return esptool_output_handler(progress) if progress is not None else None
+
+
+def erase_flash(port: str, baud: int | None = None) -> CommandResult:
+    baud = resolve_baud(port, baud, DEFAULT_BAUD)
     cmd = build_esptool_base(port=port, baud=baud) + ["erase_flash"]
-    return run_cmd(cmd, timeout=600)
+    return _run_esptool(port, cmd, timeout=600)
 
 
-def write_flash_zero(port: str, firmware_bin: str | Path, baud: int = 460800) -> CommandResult:
+def write_flash_zero(
+    port: str,
+    firmware_bin: str | Path,
+    baud: int | None = None,
+    progress: ProgressCallback | None = None,
+) -> CommandResult:
     fw = str(Path(firmware_bin))
+    baud = resolve_baud(port, baud, DEFAULT_BAUD)
     cmd = build_esptool_base(port=port, baud=baud) + ["write_flash", "0x0", fw]
-    return run_cmd(cmd, timeout=900)
+    return _run_esptool(port, cmd, timeout=900, progress=progress)
 
 
 def read_flash(
@@ -62,30 +86,34 @@ def read_flash(
     offset: int,
     size: int,
     out_path: str | Path,
-    baud: int = 921600,
+    baud: int | None = None,
     timeout: int = 1800,
+    progress: ProgressCallback | None = None,
 ) -> CommandResult:
     path = str(Path(out_path))
+    baud = resolve_baud(port, baud, DEFAULT_TRANSFER_BAUD)
     cmd = build_esptool_base(port=port, baud=baud) + [
         "read-flash",
         hex(offset),
         hex(size),
         path,
     ]
-    return run_cmd(cmd, timeout=timeout)
+    return _run_esptool(port, cmd, timeout=timeout, progress=progress)
 
 
 def write_flash_at(
     port: str,
     offset: int,
     in_path: str | Path,
-    baud: int = 921600,
+    baud: int | None = None,
     timeout: int = 1800,
+    progress: ProgressCallback | None = None,
 ) -> CommandResult:
     path = str(Path(in_path))
+    baud = resolve_baud(port, baud, DEFAULT_TRANSFER_BAUD)
     cmd = build_esptool_base(port=port, baud=baud) + [
         "write-flash",
         hex(offset),
         path,
     ]
-    return run_cmd(cmd, timeout=timeout)
+    return _run_esptool(port, cmd, timeout=timeout, progress=progress)
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass
+from functools import lru_cache
+
+SECTOR_SIZE = 0x1000
+HASH_BLOCK_SIZE = 0x10000
+_ERASED_SECTOR = b"\xFF" * SECTOR_SIZE
+
+
+@dataclass(frozen=True)
+class Extent:
+    offset: int
+    size: int
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.size
+
+    def to_dict(self) -> dict:
+        return {
+            "offset": self.offset,
+            "offset_hex": hex(self.offset),
+            "size": self.size,
+            "size_hex": hex(self.size),
+        }
+
+
+def split_blocks(offset: int, size: int, block_size: int = HASH_BLOCK_SIZE) -> list[Extent]:
+    """Cut [offset, offset+size) into block-sized extents; the last may be shorter."""
+    return [
+        Extent(offset=start, size=min(block_size, offset + size - start))
+        for start in range(offset, offset + size, block_size)
+    ]
+
+
+def block_md5s(data: bytes, block_size: int = HASH_BLOCK_SIZE) -> list[str]:
+    view = memoryview(data)
+    return [
+        hashlib.md5(view[i : i + block_size]).hexdigest()
+        for i in range(0, len(data), block_size)
+    ]
+
+
+def is_erased(chunk: bytes | memoryview) -> bool:
+    return chunk == _ERASED_SECTOR[: len(chunk)]
+
+
+@lru_cache(maxsize=None)
+def erased_md5(size: int) -> str:
+    """MD5 the device reports for `size` bytes of erased (all 0xFF) flash."""
+    return hashlib.md5(b"\xFF" * size).hexdigest()
+
+
+def changed_blocks(previous: list[str] | None, current: list[str]) -> list[int]:
+    """Indices whose hash differs; everything is changed when there is no previous list."""
+    if previous is None or len(previous) != len(current):
+        return list(range(len(current)))
+    return [i for i, (old, new) in enumerate(zip(previous, current)) if old != new]
+
+
+def coalesce_extents(extents: list[Extent]) -> list[Extent]:
+    """Merge touching or overlapping extents so each maps to one flash operation."""
+    merged: list[Extent] = []
+    for extent in sorted(extents, key=lambda e: e.offset):
+        if merged and extent.offset <= merged[-1].end:
+            last = merged[-1]
+            merged[-1] = Extent(offset=last.offset, size=max(last.end, extent.end) - last.offset)
+        else:
+            merged.append(extent)
+    return merged
+
+
+def subtract_extents(extents: list[Extent], remove: list[Extent]) -> list[Extent]:
+    """Parts of `extents` not covered by any extent in `remove`."""
+    remaining: list[Extent] = []
+    holes = coalesce_extents(remove)
+    for extent in coalesce_extents(extents):
+        cursor = extent.offset
+        for hole in holes:
+            if hole.end <= cursor or hole.offset >= extent.end:
+                continue
+            if hole.offset > cursor:
+                remaining.append(Extent(cursor, hole.offset - cursor))
+            cursor = max(cursor, hole.end)
+        if cursor < extent.end:
+            remaining.append(Extent(cursor, extent.end - cursor))
+    return remaining
+
+
+def total_size(extents: list[Extent]) -> int:
+    return sum(e.size for e in extents)
+
+
+def estimate_transfer_seconds(nbytes: int, baud: int) -> float:
+    # 8N1 framing puts 10 bits on the wire per byte; compression and SLIP overhead are ignored.
+    return nbytes * 10 / baud if baud else 0.0
@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Iterator
+
+from esptool.cmds import attach_flash, detect_chip, reset_chip, run_stub
+from esptool.loader import DEFAULT_TIMEOUT, ERASE_WRITE_TIMEOUT_PER_MB, timeout_per_mb
+
+from .flashmap import (
+    HASH_BLOCK_SIZE,
+    SECTOR_SIZE,
+    Extent,
+    block_md5s,
+    coalesce_extents,
+    erased_md5,
+    split_blocks,
+)
+from .util import release_port
+
+ProgressFn = Callable[[int, int], None]
+
+
+@dataclass
+class StageTiming:
+    name: str
+    seconds: float
+    bytes: int = 0
+
+    def to_dict(self) -> dict:
+        d = asdict(self)
+        d["seconds"] = round(self.seconds, 3)
+        return d
+
+
+@dataclass
+class FlashSession:
+    """One connected esptool loader reused for a whole read/write plan.
+
+    Connecting (reset, ROM sync, stub upload, baud switch) happens once in
+    `open_flash_session`; every operation here talks to the already-running stub.
+    """
+
+    esp: Any
+    port: str = ""
+    baud: int = 0
+    timings: list[StageTiming] = field(default_factory=list)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageTiming]:
+        timing = StageTiming(name=name, seconds=0.0)
+        start = time.monotonic()
+        try:
+            yield timing
+        finally:
+            timing.seconds = time.monotonic() - start
+            self.timings.append(timing)
+
+    def read(self, offset: int, size: int, progress: ProgressFn | None = None) -> bytes:
+        return bytes(self.esp.read_flash(offset, size, progress))
+
+    def md5(self, offset: int, size: int) -> str:
+        return str(self.esp.flash_md5sum(offset, size)).lower()
+
+    def mac(self) -> str:
+        """Base MAC address; identifies the device a partial read came from."""
+        return ":".join(f"{b:02x}" for b in self.esp.read_mac())
+
+    def erase(self, offset: int, size: int) -> None:
+        self.esp.erase_region(offset, size)
+
+    def write(self, offset: int, data: bytes, progress: ProgressFn | None = None) -> None:
+        self.write_compressed(offset, len(data), zlib.compress(data, 9), progress)
+
+    def write_compressed(
+        self,
+        offset: int,
+        size: int,
+        compressed: bytes,
+        progress: ProgressFn | None = None,
+    ) -> None:
+        block_size = self.esp.FLASH_WRITE_SIZE
+        blocks = self.esp.flash_defl_begin(size, len(compressed), offset)
+        # As in esptool's write_flash: a block's write time scales with its decompressed
+        # size, which for zero-filled extents is far more than the 3 s default allows.
+        decompress = zlib.decompressobj()
+        timeout = DEFAULT_TIMEOUT
+        for seq in range(blocks):
+            block = compressed[seq * block_size : (seq + 1) * block_size]
+            written = len(decompress.decompress(block))
+            block_timeout = timeout_per_mb(ERASE_WRITE_TIMEOUT_PER_MB, written)
+            if not self.esp.IS_STUB:
+                timeout = block_timeout  # the ROM writes a block before ACKing it
+            self.esp.flash_defl_block(block, seq, timeout=timeout)
+            if self.esp.IS_STUB:
+                # The stub ACKs on receipt and writes while the next block arrives.
+                timeout = block_timeout
+            if progress is not None:
+                progress(min((seq + 1) * block_size, len(compressed)), len(compressed))
+        # Leave the stub running so the session can continue with more work.
+        self.esp.flash_defl_finish(reboot=False)
+
+    def mismatched_extents(
+        self,
+        offset: int,
+        data: bytes,
+        block_size: int = HASH_BLOCK_SIZE,
+        sector_size: int = SECTOR_SIZE,
+    ) -> list[Extent]:
+        """Regions where device flash differs from `data` placed at `offset`.
+
+        Hashes coarse blocks first, then refines only mismatched blocks to sectors, so an
+        unchanged image costs one MD5 round trip per block.
+        """
+        mismatched: list[Extent] = []
+        host_blocks = block_md5s(data, block_size)
+        for block, expected in zip(split_blocks(offset, len(data), block_size), host_blocks):
+            if self.md5(block.offset, block.size) == expected:
+                continue
+            block_data = data[block.offset - offset : block.end - offset]
+            host_sectors = block_md5s(block_data, sector_size)
+            sectors = split_blocks(block.offset, block.size, sector_size)
+            for sector, expected_sector in zip(sectors, host_sectors):
+                if self.md5(sector.offset, sector.size) != expected_sector:
+                    mismatched.append(sector)
+        return coalesce_extents(mismatched)
+
+    def blank_extents(
+        self,
+        extents: list[Extent],
+        block_size: int = HASH_BLOCK_SIZE,
+        sector_size: int = SECTOR_SIZE,
+    ) -> list[Extent]:
+        """Parts of `extents` that already read as erased (all 0xFF) on the device.
+
+        Same coarse-then-fine hashing as `mismatched_extents`, compared against the
+        erased-flash MD5 instead of host data.
+        """
+        blank: list[Extent] = []
+        for extent in extents:
+            for block in split_blocks(extent.offset, extent.size, block_size):
+                if self.md5(block.offset, block.size) == erased_md5(block.size):
+                    blank.append(block)
+                    continue
+                blank.extend(
+                    sector
+                    for sector in split_blocks(block.offset, block.size, sector_size)
+                    if self.md5(sector.offset, sector.size) == erased_md5(sector.size)
+                )
+        return coalesce_extents(blank)
+
+    def timings_report(self) -> list[dict]:
+        return [t.to_dict() for t in self.timings]
+
+
+def connect_loader(port: str, baud: int, chip: str = "esp32s3") -> Any:
+    release_port(port)
+    esp = detect_chip(port=port, connect_mode="default-reset")
+    try:
+        if esp.CHIP_NAME.lower().replace("-", "") != chip.lower().replace("-", ""):
+            raise RuntimeError(f"Expected {chip}, found {esp.CHIP_NAME} on {port}")
+        esp = run_stub(esp)
+        if baud and baud != esp.ESP_ROM_BAUD:
+            esp.change_baud(baud)
+        attach_flash(esp)
+    except BaseException:
+        esp._port.close()  # the stub loader shares the ROM loader's port
+        raise
+    return esp
+
+
+def close_loader(esp: Any, after: str = "hard-reset") -> None:
+    try:
+        reset_chip(esp, after)
+    finally:
+        esp._port.close()
+
+
+@contextmanager
+def open_flash_session(
+    port: str,
+    baud: int = 921600,
+    chip: str = "esp32s3",
+    after: str = "hard-reset",
+) -> Iterator[FlashSession]:
+    start = time.monotonic()
+    esp = connect_loader(port=port, baud=baud, chip=chip)
+    session = FlashSession(esp=esp, port=port, baud=baud)
+    session.timings.append(StageTiming(name="connect", seconds=time.monotonic() - start))
+    try:
+        yield session
+    finally:
+        close_loader(esp, after=after)
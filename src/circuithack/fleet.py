@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import json
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+from .backup import backup_state_partitions
+from .codee import (
+    FIRMWARE_SOURCE_OFFICIAL,
+    FIRMWARE_SOURCE_PATH,
+    flash_codee_firmware,
+    resolve_codee_firmware_path,
+)
+from .device import codee_candidates, serial_number_for_port
+from .fwimage import flash_image_by_plan
+from .progress import ProgressCallback
+from .verify import verify_flash_image
+
+FLEET_STEPS = ("backup", "flash", "verify")
+DEFAULT_FLEET_WORKERS = 4
+DEFAULT_FLEET_LOG_DIR = "logs/fleet"
+
+
+@dataclass
+class DeviceRun:
+    port: str
+    device: str
+    log_path: str
+    ok: bool = True
+    failed_step: str | None = None
+    error: str | None = None
+    seconds: float = 0.0
+    bytes: int = 0
+    steps: list[dict] = field(default_factory=list)
+
+    def to_dict(self) -> dict:
+        return {
+            "port": self.port,
+            "device": self.device,
+            "ok": self.ok,
+            "failed_step": self.failed_step,
+            "error": self.error,
+            "seconds": round(self.seconds, 3),
+            "bytes": self.bytes,
+            "log_path": self.log_path,
+            "steps": self.steps,
+        }
+
+
+def resolve_fleet_ports(ports: list[str] | None) -> list[str]:
+    """Explicit ports, or every detected Codee candidate when none are given."""
+    if ports:
+        return list(dict.fromkeys(ports))
+    return [d.path for d in codee_candidates()]
+
+
+def device_key(port: str, serial_number: str | None) -> str:
+    """Filesystem-safe per-device name: USB serial number when known, else the port."""
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", serial_number or port).strip("_")
+
+
+def step_bytes(step: str, result: dict, firmware_size: int) -> int:
+    """Bytes that crossed the serial link for one step's result."""
+    if step == "flash":
+        if "plan" in result:
+            return result["plan"].get("bytes_written", 0)
+        if "write" in result:
+            return result["write"]["compressed_size"]
+        return firmware_size
+    if step == "backup":
+        return sum(t.get("bytes", 0) for t in result.get("timings", []))
+    return 0
+
+
+def summarize_fleet(runs: list[DeviceRun], wall_seconds: float) -> dict:
+    total_bytes = sum(r.bytes for r in runs)
+    failures: dict[str, int] = {}
+    for run in runs:
+        if not run.ok:
+            step = run.failed_step or "unknown"
+            failures[step] = failures.get(step, 0) + 1
+    return {
+        "devices": len(runs),
+        "succeeded": sum(1 for r in runs if r.ok),
+        "failed": sum(1 for r in runs if not r.ok),
+        "failures_by_step": failures,
+        "wall_seconds": round(wall_seconds, 3),
+        "device_seconds": round(sum(r.seconds for r in runs), 3),
+        "bytes": total_bytes,
+        "bytes_per_second": round(total_bytes / wall_seconds) if wall_seconds > 0 else 0,
+    }
+
+
+class _DeviceLog:
+    """Append-only JSON-lines log for one device; progress events are kept too."""
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._file = path.open("a", encoding="utf-8")
+
+    def write(self, event: str, **fields: object) -> None:
+        record = {"time": datetime.now().isoformat(timespec="milliseconds"), "event": event, **fields}
+        self._file.write(json.dumps(record, default=str) + "\n")
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _step_runners(
+    firmware_path: Path,
+    baud: int | None,
+    skip_unchanged: bool,
+) -> dict[str, Callable[..., dict]]:
+    def backup(port: str, device_dir: Path, progress: ProgressCallback) -> dict:
+        return backup_state_partitions(port=port, out_dir=device_dir, baud=baud, progress=progress)
+
+    def flash(port: str, device_dir: Path, progress: ProgressCallback) -> dict:
+        return flash_codee_firmware(
+            port=port,
+            source=FIRMWARE_SOURCE_PATH,
+            firmware_path=str(firmware_path),
+            baud=baud,
+            progress=progress,
+            skip_unchanged=skip_unchanged,
+            cached_payload=True,
+        )
+
+    def verify(port: str, device_dir: Path, progress: ProgressCallback) -> dict:
+        if skip_unchanged:
+            # Only plan extents are written in this mode; padding is not expected to match.
+            result = flash_image_by_plan(port=port, image_path=firmware_path, baud=baud, dry_run=True)
+            return {**result, "ok": result["ok"] and not result.get("to_write")}
+        return verify_flash_image(port=port, image_path=firmware_path, baud=baud)
+
+    return {"backup": backup, "flash": flash, "verify": verify}
+
+
+def _provision_device(
+    port: str,
+    steps: tuple[str, ...],
+    runners: dict[str, Callable[..., dict]],
+    out_dir: Path,
+    log_dir: Path,
+    firmware_size: int,
+) -> DeviceRun:
+    device = device_key(port, serial_number_for_port(port))
+    log = _DeviceLog(log_dir / f"{device}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.log")
+    run = DeviceRun(port=port, device=device, log_path=str(log.path))
+    start = time.monotonic()
+    try:
+        for step in steps:
+            log.write("step_start", step=step)
+            step_start = time.monotonic()
+            try:
+                result = runners[step](
+                    port,
+                    out_dir / device,
+                    lambda event, step=step: log.write("progress", step=step, **event.to_dict()),
+                )
+            except Exception as exc:  # noqa: BLE001 - one device failing must not stop the fleet
+                result = {"ok": False, "error": str(exc)}
+            seconds = time.monotonic() - step_start
+            moved = step_bytes(step, result, firmware_size) if result.get("ok") else 0
+            run.bytes += moved
+            run.steps.append(
+                {
+                    "step": step,
+                    "ok": bool(result.get("ok")),
+                    "seconds": round(seconds, 3),
+                    "bytes": moved,
+                }
+            )
+            log.write("step_done", step=step, seconds=round(seconds, 3), result=result)
+            if not result.get("ok"):
+                run.ok, run.failed_step = False, step
+                run.error = result.get("error") or result.get("stderr") or "step failed"
+                break
+    finally:
+        run.seconds = time.monotonic() - start
+        log.write("device_done", **run.to_dict())
+        log.close()
+    return run
+
+
+def run_fleet(
+    ports: list[str] | None = None,
+    steps: tuple[str, ...] = FLEET_STEPS,
+    max_workers: int = DEFAULT_FLEET_WORKERS,
+    source: str = FIRMWARE_SOURCE_OFFICIAL,
+    firmware_path: str | None = None,
+    official_out_dir: str = "downloads/codee-official",
+    build_dir: str = "third_party/Codee-Firmware/build",
+    out_dir: str | Path = "backups/fleet",
+    log_dir: str | Path = DEFAULT_FLEET_LOG_DIR,
+    baud: int | None = None,
+    skip_unchanged: bool = False,
+) -> dict:
+    """Run backup/flash/verify on many devices at once with a bounded worker pool.
+
+    Each device runs its steps in order and stops at its first failure; other devices
+    carry on. Firmware is resolved (and downloaded) once before the pool starts. Every
+    device gets a JSON-lines log under log_dir and a backup folder under out_dir.
+    """
+    unknown = [s for s in steps if s not in FLEET_STEPS]
+    if unknown:
+        raise ValueError(f"Unknown fleet steps {unknown}, expected a subset of {FLEET_STEPS}")
+    if max_workers < 1:
+        raise ValueError("max_workers must be at least 1")
+    targets = resolve_fleet_ports(ports)
+    if not targets:
+        return {"ok": False, "error": "No Codee-like USB serial devices found.", "devices": []}
+
+    fw_path, source_info = resolve_codee_firmware_path(
+        source=source,
+        firmware_path=firmware_path,
+        official_out_dir=official_out_dir,
+        build_dir=build_dir,
+    )
+    out_dir, log_dir = Path(out_dir), Path(log_dir)
+    runners = _step_runners(fw_path, baud, skip_unchanged)
+    firmware_size = fw_path.stat().st_size
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(targets))) as pool:
+        runs = list(
+            pool.map(
+                lambda port: _provision_device(port, steps, runners, out_dir, log_dir, firmware_size),
+                targets,
+            )
+        )
+    summary = summarize_fleet(runs, time.monotonic() - start)
+    return {
+        "ok": summary["failed"] == 0,
+        "steps": list(steps),
+        "firmware_path": str(fw_path),
+        "source_info": source_info,
+        "summary": summary,
+        "devices": [r.to_dict() for r in runs],
+    }
@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import hashlib
+import struct
+from dataclasses import dataclass
+from pathlib import Path
+
+from .baudrate import DEFAULT_TRANSFER_BAUD, resolve_baud
+from .eraseplan import blank_target_sectors, plan_blank_aware
+from .flashmap import Extent, total_size
+from .flashsession import open_flash_session
+from .partitions import PARTITION_TABLE_OFFSET, PARTITION_TABLE_SIZE, parse_partition_table_bytes
+from .payloadcache import compressed_payload
+from .progress import ProgressCallback, region_progress, tracker_for
+
+ESP_IMAGE_MAGIC = 0xE9
+ESP_CHECKSUM_SEED = 0xEF
+ESP32S3_CHIP_ID = 9
+PARTITION_TYPE_APP = 0x00
+
+# magic, segment_count, spi_mode, spi_speed_size, entry_addr
+_IMAGE_HEADER = struct.Struct("<BBBBI")
+# wp_pin, spi_pin_drv[3], chip_id, min_chip_rev, min_chip_rev_full, max_chip_rev_full,
+# reserved[4], hash_appended
+_EXTENDED_HEADER = struct.Struct("<B3sHBHH4sB")
+# load_addr, data_len
+_SEGMENT_HEADER = struct.Struct("<II")
+_SHA256_LEN = 32
+
+
+class FirmwareImageError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class ImageSegment:
+    load_address: int
+    offset: int
+    size: int
+
+    def to_dict(self) -> dict:
+        return {
+            "load_address": hex(self.load_address),
+            "offset": self.offset,
+            "size": self.size,
+        }
+
+
+@dataclass(frozen=True)
+class AppImage:
+    """One ESP app/bootloader image as laid out in flash (header, segments, checksum, hash)."""
+
+    offset: int
+    size: int
+    chip_id: int
+    entry_address: int
+    segments: list[ImageSegment]
+    hash_appended: bool
+
+    def to_dict(self) -> dict:
+        return {
+            "offset": self.offset,
+            "offset_hex": hex(self.offset),
+            "size": self.size,
+            "chip_id": self.chip_id,
+            "entry_address": hex(self.entry_address),
+            "hash_appended": self.hash_appended,
+            "segments": [s.to_dict() for s in self.segments],
+        }
+
+
+@dataclass(frozen=True)
+class FlashPlanEntry:
+    label: str
+    kind: str
+    offset: int
+    size: int
+    md5: str
+
+    @property
+    def extent(self) -> Extent:
+        return Extent(self.offset, self.size)
+
+    def to_dict(self) -> dict:
+        return {"label": self.label, "kind": self.kind, **self.extent.to_dict(), "md5": self.md5}
+
+
+def _xor_bytes(chunk: bytes | memoryview) -> int:
+    """XOR of all bytes, folded as one big integer instead of a per-byte Python loop."""
+    value = int.from_bytes(chunk, "little")
+    width = len(chunk)
+    while width > 1:
+        half = (width + 1) // 2
+        value = (value >> (8 * half)) ^ (value & ((1 << (8 * half)) - 1))
+        width = half
+    return value
+
+
+def parse_app_image(data: bytes, offset: int = 0) -> AppImage:
+    """Parse the ESP image starting at `offset` in `data`, checking checksum and SHA-256."""
+    view = memoryview(data)
+    header_end = offset + _IMAGE_HEADER.size + _EXTENDED_HEADER.size
+    if len(data) < header_end:
+        raise FirmwareImageError(f"Truncated image header at {hex(offset)}")
+    magic, segment_count, _, _, entry = _IMAGE_HEADER.unpack_from(data, offset)
+    if magic != ESP_IMAGE_MAGIC:
+        raise FirmwareImageError(f"No ESP image magic at {hex(offset)}")
+    extended = _EXTENDED_HEADER.unpack_from(data, offset + _IMAGE_HEADER.size)
+    chip_id, hash_appended = extended[2], extended[-1] == 1
+
+    segments: list[ImageSegment] = []
+    checksum = ESP_CHECKSUM_SEED
+    pos = header_end
+    for _ in range(segment_count):
+        if pos + _SEGMENT_HEADER.size > len(data):
+            raise FirmwareImageError(f"Truncated segment header in image at {hex(offset)}")
+        load_address, size = _SEGMENT_HEADER.unpack_from(data, pos)
+        pos += _SEGMENT_HEADER.size
+        if pos + size > len(data):
+            raise FirmwareImageError(f"Segment at {hex(pos)} runs past the end of the file")
+        segments.append(ImageSegment(load_address=load_address, offset=pos, size=size))
+        checksum ^= _xor_bytes(view[pos : pos + size])
+        pos += size
+
+    # Checksum byte sits in the last byte of the next 16-byte boundary.
+    pos = (pos // 16 + 1) * 16
+    if pos > len(data) or data[pos - 1] != checksum:
+        raise FirmwareImageError(f"Checksum mismatch in image at {hex(offset)}")
+    if hash_appended:
+        if pos + _SHA256_LEN > len(data):
+            raise FirmwareImageError(f"Missing SHA-256 digest in image at {hex(offset)}")
+        if hashlib.sha256(view[offset:pos]).digest() != bytes(view[pos : pos + _SHA256_LEN]):
+            raise FirmwareImageError(f"SHA-256 mismatch in image at {hex(offset)}")
+        pos += _SHA256_LEN
+    return AppImage(
+        offset=offset,
+        size=pos - offset,
+        chip_id=chip_id,
+        entry_address=entry,
+        segments=segments,
+        hash_appended=hash_appended,
+    )
+
+
+def _plan_entry(data: bytes, label: str, kind: str, offset: int, size: int) -> FlashPlanEntry:
+    md5 = hashlib.md5(memoryview(data)[offset : offset + size]).hexdigest()
+    return FlashPlanEntry(label=label, kind=kind, offset=offset, size=size, md5=md5)
+
+
+def build_flash_plan(data: bytes) -> list[FlashPlanEntry]:
+    """Extents of a firmware file written at 0x0 that carry data, with their MD5s.
+
+    A merged image yields the bootloader, the partition table, each app image found
+    in an app partition, and the part of every other partition that the image covers,
+    blank or not. Data partitions such as otadata, phy_init or nvs are therefore
+    written (or erased) just as `write_flash` would. A bare app image yields one
+    entry. Only the erased padding outside partitions and after app images is not
+    part of the plan.
+    """
+    first = parse_app_image(data, 0)
+    if first.chip_id != ESP32S3_CHIP_ID:
+        raise FirmwareImageError(f"Image targets chip id {first.chip_id}, not ESP32-S3")
+    table = data[PARTITION_TABLE_OFFSET : PARTITION_TABLE_OFFSET + PARTITION_TABLE_SIZE]
+    entries = parse_partition_table_bytes(table) if len(table) == PARTITION_TABLE_SIZE else []
+    if not entries:
+        return [_plan_entry(data, "app", "app", 0, first.size)]
+
+    plan = [
+        _plan_entry(data, "bootloader", "bootloader", 0, first.size),
+        _plan_entry(
+            data,
+            "partition_table",
+            "partition_table",
+            PARTITION_TABLE_OFFSET,
+            PARTITION_TABLE_SIZE,
+        ),
+    ]
+    for entry in entries:
+        if entry.offset >= len(data):
+            continue
+        if entry.type == PARTITION_TYPE_APP and data[entry.offset] == ESP_IMAGE_MAGIC:
+            app = parse_app_image(data, entry.offset)
+            plan.append(_plan_entry(data, entry.label, "app", entry.offset, app.size))
+            continue
+        size = min(entry.size, len(data) - entry.offset)
+        plan.append(_plan_entry(data, entry.label, "data", entry.offset, size))
+    return plan
+
+
+def planned_writes(data: bytes, stale: list[FlashPlanEntry]) -> list[Extent]:
+    """Extents flash_image_by_plan sends for the `stale` entries; 0xFF-only sectors never go."""
+    return plan_blank_aware(data, [e.extent for e in stale], []).write
+
+
+def inspect_firmware_image(path: str | Path) -> dict:
+    path = Path(path)
+    data = path.read_bytes()
+    plan = build_flash_plan(data)
+    return {
+        "ok": True,
+        "path": str(path),
+        "size": len(data),
+        "images": [
+            {"label": e.label, **parse_app_image(data, e.offset).to_dict()}
+            for e in plan
+            if e.kind in ("bootloader", "app")
+        ],
+        "plan": [e.to_dict() for e in plan],
+        "plan_bytes": total_size([e.extent for e in plan]),
+    }
+
+
+def flash_image_by_plan(
+    port: str,
+    image_path: str | Path,
+    baud: int | None = None,
+    dry_run: bool = False,
+    progress: ProgressCallback | None = None,
+) -> dict:
+    """Write only the plan extents whose device-side MD5 differs from the image.
+
+    Re-flashing the firmware already on the device costs one MD5 round trip per
+    extent; changed extents are written and re-checked by MD5 afterwards. 0xFF-only
+    sectors inside a changed extent are skipped when the device already reads them
+    as blank and erased (not written) otherwise.
+    """
+    path = Path(image_path)
+    data = path.read_bytes()
+    plan = build_flash_plan(data)
+    baud = resolve_baud(port, baud, DEFAULT_TRANSFER_BAUD)
+    try:
+        with open_flash_session(port=port, baud=baud) as session:
+            mac = session.mac()
+            with session.stage("hash_device"):
+                stale = [e for e in plan if session.md5(e.offset, e.size) != e.md5]
+            stale_extents = [e.extent for e in stale]
+            with session.stage("hash_blank"):
+                device_blank = session.blank_extents(blank_target_sectors(data, stale_extents))
+            writes = plan_blank_aware(data, stale_extents, device_blank)
+            bytes_to_write = total_size(writes.write)
+            if not dry_run and stale:
+                with session.stage("erase_blank") as timing:
+                    for extent in writes.erase:
+                        session.erase(extent.offset, extent.size)
+                    timing.bytes = total_size(writes.erase)
+                tracker = tracker_for("write_changed", progress)
+                with session.stage("write_changed") as timing:
+                    for extent in writes.write:
+                        # Extents repeat across devices, so their deflate streams are cached.
+                        payload, _ = compressed_payload(data[extent.offset : extent.end])
+                        session.write_compressed(
+                            extent.offset,
+                            extent.size,
+                            payload,
+                            region_progress(tracker, timing.bytes, extent.size, bytes_to_write),
+                        )
+                        timing.bytes += extent.size
+                with session.stage("verify"):
+                    failed = [e.label for e in stale if session.md5(e.offset, e.size) != e.md5]
+                if failed:
+                    raise RuntimeError(f"Extents still differ after writing: {', '.join(failed)}")
+    except Exception as exc:  # noqa: BLE001 - esptool/serial failures are reported, not raised
+        return {"ok": False, "image_path": str(path), "error": str(exc)}
+    return {
+        "ok": True,
+        "image_path": str(path),
+        "mac": mac,
+        "dry_run": dry_run,
+        "to_write": [e.to_dict() for e in stale],
+        "skipped": [e.to_dict() for e in plan if e not in stale],
+        "bytes_written": 0 if dry_run else bytes_to_write,
+        "bytes_skipped": total_size([e.extent for e in plan]) - bytes_to_write,
+        "blank": writes.to_dict(),
+        "timings": session.timings_report(),
+    }
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+
+from .flashmap import HASH_BLOCK_SIZE
+from .util import cache_dir, load_json_cache, update_json_cache
+
+
+def hash_cache_path() -> Path:
+    return cache_dir() / "image-hashes.json"
+
+
+def load_hash_cache() -> dict[str, dict]:
+    return load_json_cache(hash_cache_path())
+
+
+def hash_image_file(path: Path, block_size: int) -> dict:
+    """Whole-file MD5 plus per-block MD5s, streamed so large images are never held in memory."""
+    whole = hashlib.md5()
+    blocks: list[str] = []
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            whole.update(block)
+            blocks.append(hashlib.md5(block).hexdigest())
+    return {"md5": whole.hexdigest(), "block_md5": blocks}
+
+
+def image_hashes(path: str | Path, block_size: int = HASH_BLOCK_SIZE) -> dict:
+    """Hashes for an image file, cached by resolved path, size and mtime.
+
+    Returns {"md5", "block_md5", "size", "block_size", "cached"}; a touched or
+    rewritten file is rehashed on the next call.
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    key = str(path)
+    cache = load_hash_cache()
+    entry = cache.get(key)
+    if (
+        entry
+        and entry["mtime_ns"] == stat.st_mtime_ns
+        and entry["size"] == stat.st_size
+        and str(block_size) in entry["blocks"]
+    ):
+        return {
+            "md5": entry["md5"],
+            "block_md5": entry["blocks"][str(block_size)],
+            "size": stat.st_size,
+            "block_size": block_size,
+            "cached": True,
+        }
+
+    hashed = hash_image_file(path, block_size)
+    with update_json_cache(hash_cache_path()) as cache:
+        # Re-read under the lock: another thread may have added other block sizes.
+        entry = cache.get(key)
+        if not entry or entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            entry = {
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "md5": hashed["md5"],
+                "blocks": {},
+            }
+        entry["blocks"][str(block_size)] = hashed["block_md5"]
+        cache[key] = entry
+    return {**hashed, "size": stat.st_size, "block_size": block_size, "cached": False}
@@ -0,0 +1,283 @@
+from __future__ import annotations
+
+import json
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterator
+
+from .device import SerialDevice, list_serial_devices
+from .hashcache import image_hashes
+from .util import cache_dir
+
+INVENTORY_SCHEMA_VERSION = 1
+_MAC = re.compile(r"^[0-9a-f]{2}(:[0-9a-f]{2}){5}$")
+_ESPTOOL_MAC = re.compile(r"^MAC:\s*([0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5})\s*$", re.MULTILINE)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    id INTEGER PRIMARY KEY,
+    usb_serial TEXT UNIQUE,
+    mac TEXT UNIQUE,
+    port TEXT,
+    description TEXT,
+    vid INTEGER,
+    pid INTEGER,
+    firmware_md5 TEXT,
+    firmware_path TEXT,
+    first_seen TEXT NOT NULL,
+    last_seen TEXT NOT NULL,
+    last_flash TEXT,
+    last_backup TEXT,
+    last_backup_path TEXT
+);
+CREATE INDEX IF NOT EXISTS devices_port ON devices(port);
+CREATE INDEX IF NOT EXISTS devices_last_seen ON devices(last_seen);
+CREATE INDEX IF NOT EXISTS devices_last_backup ON devices(last_backup);
+CREATE INDEX IF NOT EXISTS devices_firmware ON devices(firmware_md5);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    device_id INTEGER NOT NULL REFERENCES devices(id),
+    kind TEXT NOT NULL,
+    at TEXT NOT NULL,
+    detail TEXT
+);
+CREATE INDEX IF NOT EXISTS events_device_at ON events(device_id, at);
+"""
+
+
+def inventory_path() -> Path:
+    return cache_dir() / "inventory.sqlite3"
+
+
+@contextmanager
+def open_inventory(path: str | Path | None = None) -> Iterator[sqlite3.Connection]:
+    """Connection to the inventory database, schema created on first use.
+
+    Each call opens its own connection, so fleet worker threads can record concurrently;
+    WAL mode keeps readers from blocking the writer.
+    """
+    conn = sqlite3.connect(str(path or inventory_path()), timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] < INVENTORY_SCHEMA_VERSION:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            conn.execute(f"PRAGMA user_version = {INVENTORY_SCHEMA_VERSION}")
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def mac_from_serial(usb_serial: str | None) -> str | None:
+    """ESP32-S3 USB-Serial/JTAG reports the chip MAC as its USB serial number."""
+    text = (usb_serial or "").strip().lower().replace("-", ":")
+    return text if _MAC.match(text) else None
+
+
+def mac_from_esptool_output(output: str) -> str | None:
+    """The "MAC: ..." line esptool prints after connecting."""
+    match = _ESPTOOL_MAC.search(output or "")
+    return match.group(1).lower() if match else None
+
+
+def _upsert_device(
+    conn: sqlite3.Connection,
+    usb_serial: str | None,
+    mac: str | None,
+    at: str,
+    **fields: object,
+) -> int:
+    row = conn.execute(
+        "SELECT id FROM devices WHERE usb_serial = ? OR mac = ? LIMIT 1",
+        (usb_serial, mac),
+    ).fetchone()
+    values = {k: v for k, v in fields.items() if v is not None}
+    if row is None:
+        values.update(usb_serial=usb_serial, mac=mac, first_seen=at, last_seen=at)
+        columns = ", ".join(values)
+        cur = conn.execute(
+            f"INSERT INTO devices ({columns}) VALUES ({', '.join('?' for _ in values)})",
+            tuple(values.values()),
+        )
+        device_id = int(cur.lastrowid)
+    else:
+        device_id = int(row["id"])
+        values.update(last_seen=at)
+        if usb_serial:
+            values["usb_serial"] = usb_serial
+        if mac:
+            values["mac"] = mac
+        assignments = ", ".join(f"{k} = ?" for k in values)
+        conn.execute(
+            f"UPDATE devices SET {assignments} WHERE id = ?",
+            (*values.values(), device_id),
+        )
+    port = fields.get("port")
+    if port:
+        # Port paths are reused across plugs; only the unit seen last keeps one.
+        conn.execute("UPDATE devices SET port = NULL WHERE port = ? AND id != ?", (port, device_id))
+    return device_id
+
+
+def _event(conn: sqlite3.Connection, device_id: int, kind: str, at: str, detail: dict) -> None:
+    conn.execute(
+        "INSERT INTO events (device_id, kind, at, detail) VALUES (?, ?, ?, ?)",
+        (device_id, kind, at, json.dumps(detail)),
+    )
+
+
+def _port_info(port: str) -> SerialDevice | None:
+    return next((d for d in list_serial_devices(only_likely_usb=False) if d.path == port), None)
+
+
+_AT = object()  # placeholder for "the time of this record" in _record fields
+
+
+def _record(
+    port: str,
+    kind: str,
+    detail: dict,
+    device: SerialDevice | None = None,
+    mac: str | None = None,
+    **fields: object,
+) -> bool:
+    """Best effort: bookkeeping must never turn a finished flash or backup into a failure.
+
+    `mac` is the chip MAC read over the loader; without it the MAC is only known when
+    the USB serial number happens to be one.
+    """
+    try:
+        device = device or _port_info(port)
+        if device is None or not device.serial_number:
+            return False
+        at = _now()
+        with open_inventory() as conn:
+            device_id = _upsert_device(
+                conn,
+                usb_serial=device.serial_number,
+                mac=mac or mac_from_serial(device.serial_number),
+                at=at,
+                port=port,
+                description=device.description,
+                vid=device.vid,
+                pid=device.pid,
+                **{k: (at if v is _AT else v) for k, v in fields.items()},
+            )
+            _event(conn, device_id, kind, at, detail)
+        return True
+    except (sqlite3.Error, OSError):
+        return False
+
+
+def record_scan(devices: list[SerialDevice]) -> int:
+    """Note every USB device seen by a scan; returns how many were recorded."""
+    return sum(_record(d.path, "scan", {}, device=d) for d in devices)
+
+
+def record_flash(
+    port: str,
+    firmware_path: str | Path,
+    detail: dict | None = None,
+    mac: str | None = None,
+) -> bool:
+    try:
+        firmware_md5 = image_hashes(firmware_path)["md5"]
+    except OSError:
+        return False
+    return _record(
+        port,
+        "flash",
+        {"firmware_path": str(firmware_path), "firmware_md5": firmware_md5, **(detail or {})},
+        mac=mac,
+        firmware_md5=firmware_md5,
+        firmware_path=str(firmware_path),
+        last_flash=_AT,
+    )
+
+
+def record_backup(
+    port: str,
+    backup_path: str | Path,
+    kind: str = "backup",
+    files: list[str] | None = None,
+    mac: str | None = None,
+) -> bool:
+    detail: dict = {"path": str(backup_path)}
+    if files:
+        detail["files"] = [str(f) for f in files]
+    return _record(
+        port,
+        kind,
+        detail,
+        mac=mac,
+        last_backup=_AT,
+        last_backup_path=str(backup_path),
+    )
+
+
+def backup_owners(path: str | Path | None = None) -> dict[str, str]:
+    """Resolved backup file path -> USB serial of the device it was read from."""
+    owners: dict[str, str] = {}
+    try:
+        with open_inventory(path) as conn:
+            rows = conn.execute(
+                "SELECT d.usb_serial, e.detail FROM events e JOIN devices d ON d.id = e.device_id"
+                " WHERE e.kind LIKE 'backup%' ORDER BY e.at, e.id"
+            ).fetchall()
+    except (sqlite3.Error, OSError):
+        return owners
+    for row in rows:
+        detail = json.loads(row["detail"])
+        for f in [detail.get("path"), *detail.get("files", [])]:
+            if f:
+                owners[str(Path(f).resolve())] = row["usb_serial"]
+    return owners
+
+
+def query_inventory(
+    device: str | None = None,
+    stale_days: int | None = None,
+    firmware_md5: str | None = None,
+    path: str | Path | None = None,
+) -> dict:
+    """Inventory rows without touching hardware.
+
+    `device` matches a USB serial, MAC or last known port; `stale_days` keeps devices
+    whose last backup is older than that (or missing); `firmware_md5` keeps devices
+    last flashed with that image.
+    """
+    clauses: list[str] = []
+    params: list[object] = []
+    if device:
+        clauses.append("(usb_serial = ? OR mac = ? OR port = ?)")
+        params += [device, mac_from_serial(device) or device, device]
+    if stale_days is not None:
+        cutoff = (datetime.now() - timedelta(days=stale_days)).isoformat(timespec="seconds")
+        clauses.append("(last_backup IS NULL OR last_backup < ?)")
+        params.append(cutoff)
+    if firmware_md5:
+        clauses.append("firmware_md5 = ?")
+        params.append(firmware_md5)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    with open_inventory(path) as conn:
+        rows = conn.execute(
+            f"SELECT * FROM devices {where} ORDER BY last_seen DESC",
+            params,
+        ).fetchall()
+        devices = [dict(r) for r in rows]
+        if device and devices:
+            events = conn.execute(
+                "SELECT kind, at, detail FROM events WHERE device_id = ?"
+                " ORDER BY at DESC, id DESC LIMIT 20",
+                (devices[0]["id"],),
+            ).fetchall()
+            devices[0]["events"] = [{**dict(e), "detail": json.loads(e["detail"])} for e in events]
+    return {"ok": True, "path": str(path or inventory_path()), "devices": devices}
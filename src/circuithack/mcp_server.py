@@ -1,15 +1,27 @@
 from __future__ import annotations
 
+import functools
 from pathlib import Path
+from typing import Any, Callable
 
-from mcp.server.fastmcp import FastMCP
+import anyio
+from mcp.server.fastmcp import Context, FastMCP
 
 from .backup import backup_full_flash, backup_state_partitions, restore_full_flash_backup
+from .backupstore import (
+    DEFAULT_STORE_DIR,
+    add_snapshot,
+    list_snapshots,
+    prune_snapshots,
+    restore_snapshot,
+)
+from .baudrate import calibrate_baud
 from .codee import (
     FIRMWARE_SOURCES,
     decode_codee_savegame,
     flash_codee_firmware as flash_codee_firmware_flow,
 )
+from .deploy import DEFAULT_DEPLOY_DIR, DEFAULT_REMOTE_DIR, deploy_port_kit
 from .env import auto_load_env
 from .device import (
     detect_codee_candidates,
@@ -17,27 +29,63 @@ from .device import (
     macos_usb_summary,
     resolve_codee_port,
     serial_node_snapshot,
+    start_device_watcher,
 )
+from .extract import extract_partitions, extract_partitions_batch
 from .firmware import download_asset, latest_stock_asset
+from .fleet import DEFAULT_FLEET_LOG_DIR, DEFAULT_FLEET_WORKERS, FLEET_STEPS, run_fleet
 from .flash import enter_programmer_mode, write_flash_zero
+from .fwimage import inspect_firmware_image
 from .gamewatch import (
     codee_gamewatch_adaptation_report,
     download_gamewatch_assets as download_gamewatch_assets_flow,
     sync_gamewatch_source,
 )
 from .gamesync import sync_game_sources
+from .inventory import query_inventory, record_scan
 from .micropython import build_and_flash_micropython
+from .pastemode import PASTE_TIMEOUT
+from .pipeline import PIPELINE_STAGES, run_pipeline
+from .probe import PROBE_TIMEOUT, probe_devices
+from .progress import ProgressEvent
+from .repartition import DEFAULT_FLASH_SIZE, plan_repartition_offline, repartition_device
+from .replsession import repl_copy_file, repl_eval, repl_pool
+from .retention import DEFAULT_BACKUP_ROOT, RetentionPolicy, apply_retention, audit_backups
 from .runner import run_script, run_script_paste_mode
+from .sparseimage import convert_raw_to_sparse, export_sparse_to_raw
 from .util import format_cmd
+from .verify import verify_flash_image
 
 mcp = FastMCP("circuithack-codee")
 
 
+async def _run_with_progress(ctx: Context | None, fn: Callable[..., Any], **kwargs: Any) -> Any:
+    """Run a blocking flash flow in a worker thread, relaying its progress as MCP notifications."""
+
+    # Progress can arrive on plain threads (the subprocess pipe readers), which are not
+    # AnyIO workers, so the event loop is named explicitly.
+    token = anyio.lowlevel.current_token()
+
+    def relay(event: ProgressEvent) -> None:
+        if ctx is None:
+            return
+        try:
+            anyio.from_thread.run(
+                ctx.report_progress, event.percent, 100.0, event.message(), token=token
+            )
+        except Exception:  # noqa: BLE001 - a lost notification must not stop the flow or its reader
+            pass
+
+    return await anyio.to_thread.run_sync(functools.partial(fn, progress=relay, **kwargs))
+
+
 @mcp.tool()
 def scan_codee() -> dict:
     """List USB serial devices and highlight likely Codee candidates (macOS/Linux)."""
     devices = [x.to_dict() for x in list_serial_devices(only_likely_usb=True)]
-    candidates = [x.to_dict() for x in detect_codee_candidates()]
+    found = detect_codee_candidates()
+    record_scan(found)
+    candidates = [x.to_dict() for x in found]
     return {
         "devices": devices,
         "codee_candidates": candidates,
@@ -46,6 +94,28 @@ def scan_codee() -> dict:
     }
 
 
+@mcp.tool(description="Fingerprint Codee ports (chip, MAC, flash size) with parallel handshakes")
+async def probe_codee_devices(
+    ports: list[str] | None = None,
+    timeout: float = PROBE_TIMEOUT,
+    refresh: bool = False,
+) -> dict:
+    """Handshake candidate ports concurrently; fingerprints are cached per USB serial."""
+    return await anyio.to_thread.run_sync(
+        functools.partial(probe_devices, ports=ports, timeout=timeout, refresh=refresh)
+    )
+
+
+@mcp.tool(description="Wait until a Codee is plugged in and return its port")
+async def wait_for_codee(timeout: float = 60.0) -> dict:
+    """Block until a Codee candidate attaches after this call (not one already present)."""
+    watcher = start_device_watcher()
+    found = await anyio.to_thread.run_sync(functools.partial(watcher.wait_for_codee, timeout))
+    if found is None:
+        return {"ok": False, "error": f"No Codee was plugged in within {timeout}s."}
+    return {"ok": True, "port": found.path, "device": found.to_dict()}
+
+
 @mcp.tool(description="Download the latest stock Codee firmware asset")
 def download_codee_stock_firmware(out_dir: str = "downloads/codee") -> dict:
     """Download the latest stock Codee firmware release asset (returns path + metadata)."""
@@ -58,7 +128,7 @@ def download_codee_stock_firmware(out_dir: str = "downloads/codee") -> dict:
 
 
 @mcp.tool(description="Enter ESP32-S3 programmer/bootloader mode")
-def enter_codee_programmer_mode(port: str | None = None, baud: int = 460800) -> dict:
+def enter_codee_programmer_mode(port: str | None = None, baud: int | None = None) -> dict:
     """Toggle ESP32-S3 into programmer/bootloader mode using esptool handshakes."""
     resolved = resolve_codee_port(port)
     res = enter_programmer_mode(resolved, baud=baud)
@@ -71,11 +141,19 @@ def enter_codee_programmer_mode(port: str | None = None, baud: int = 460800) ->
     }
 
 
+@mcp.tool(description="Calibrate and cache the fastest stable esptool baud rate")
+def calibrate_codee_baud(port: str | None = None, save: bool = True) -> dict:
+    """Try increasing baud rates with a read-and-verify payload; cache the best per USB serial."""
+    resolved = resolve_codee_port(port)
+    return calibrate_baud(port=resolved, save=save)
+
+
 @mcp.tool(description="Flash official stock Codee firmware")
-def restore_codee_stock_firmware(
+async def restore_codee_stock_firmware(
     port: str | None = None,
     firmware_path: str | None = None,
-    baud: int = 460800,
+    baud: int | None = None,
+    ctx: Context | None = None,
 ) -> dict:
     resolved = resolve_codee_port(port)
     if firmware_path:
@@ -83,7 +161,13 @@ def restore_codee_stock_firmware(
     else:
         asset = latest_stock_asset("codee")
         fw = download_asset(asset, "downloads/codee")
-    res = write_flash_zero(port=resolved, firmware_bin=fw, baud=baud)
+    res = await _run_with_progress(
+        ctx,
+        write_flash_zero,
+        port=resolved,
+        firmware_bin=fw,
+        baud=baud,
+    )
     return {
         "ok": res.ok,
         "port": resolved,
@@ -95,16 +179,23 @@ def restore_codee_stock_firmware(
 
 
 @mcp.tool(description="Flash a provided MicroPython .bin to Codee")
-def install_codee_micropython_binary(
+async def install_codee_micropython_binary(
     port: str | None = None,
     micropython_bin_path: str = "",
-    baud: int = 460800,
+    baud: int | None = None,
+    ctx: Context | None = None,
 ) -> dict:
     """Flash a provided MicroPython .bin onto Codee (write_flash @0x0)."""
     if not micropython_bin_path:
         raise ValueError("micropython_bin_path is required")
     resolved = resolve_codee_port(port)
-    res = write_flash_zero(port=resolved, firmware_bin=micropython_bin_path, baud=baud)
+    res = await _run_with_progress(
+        ctx,
+        write_flash_zero,
+        port=resolved,
+        firmware_bin=micropython_bin_path,
+        baud=baud,
+    )
     return {
         "ok": res.ok,
         "port": resolved,
@@ -120,21 +211,27 @@ def build_and_install_codee_micropython(
     port: str | None = None,
     repo_dir: str = "third_party/circuitmess-micropython",
     board: str = "CM_Codee",
-    baud: int = 460800,
+    baud: int | None = None,
+    freeze_dir: str | None = None,
 ) -> dict:
-    """Build CircuitMess MicroPython (board=CM_Codee) and flash it."""
+    """Build CircuitMess MicroPython (board=CM_Codee) and flash it.
+
+    freeze_dir (e.g. ports/codee) is frozen into the image as bytecode. Builds are
+    cached per (MicroPython commit, board, port-kit hash).
+    """
     resolved = resolve_codee_port(port)
     return build_and_flash_micropython(
         port=resolved,
         repo_dir=repo_dir,
         board=board,
         baud=baud,
+        freeze_dir=freeze_dir,
     )
 
 
-@mcp.tool(description="Run a local MicroPython script on a real Codee via mpremote")
+@mcp.tool(description="Run a local MicroPython script on a real Codee over the raw REPL")
 def run_codee_script(port: str | None = None, script_path: str = "") -> dict:
-    """Run a local MicroPython script on Codee via mpremote (raw REPL)."""
+    """Run a local MicroPython script on Codee over the pooled raw-REPL session."""
     if not script_path:
         raise ValueError("script_path is required")
     resolved = resolve_codee_port(port)
@@ -149,15 +246,76 @@ def run_codee_script(port: str | None = None, script_path: str = "") -> dict:
     }
 
 
+@mcp.tool(description="Sync the Codee port kit to the device, sending only changed files")
+def deploy_codee_port_kit(
+    port: str | None = None,
+    src_dir: str = DEFAULT_DEPLOY_DIR,
+    remote_dir: str = DEFAULT_REMOTE_DIR,
+    prune: bool = True,
+    dry_run: bool = False,
+    mpy: bool = False,
+    measure: bool = False,
+) -> dict:
+    """Hash-compare device files in one round trip, upload changes, remove deploy orphans.
+
+    mpy=True ships .mpy precompiled for the firmware's bytecode version; measure=True
+    reports the package's import time and heap before and after.
+    """
+    return deploy_port_kit(
+        resolve_codee_port(port),
+        src_dir=src_dir,
+        remote_dir=remote_dir,
+        prune=prune,
+        dry_run=dry_run,
+        mpy=mpy,
+        measure=measure,
+    )
+
+
+@mcp.tool(description="Evaluate a MicroPython expression on a real Codee")
+def eval_codee_expression(expression: str, port: str | None = None) -> dict:
+    """Evaluate an expression over the pooled raw-REPL session; the value must be a literal."""
+    return repl_eval(resolve_codee_port(port), expression)
+
+
+@mcp.tool(description="Copy a local file to the Codee filesystem")
+def copy_file_to_codee(local_path: str, remote_path: str = "", port: str | None = None) -> dict:
+    """Write a local file to the device over the pooled raw-REPL session."""
+    resolved = resolve_codee_port(port)
+    remote = remote_path or Path(local_path).name
+    res = repl_copy_file(resolved, local_path, remote)
+    return {"ok": res.ok, "port": resolved, "remote_path": remote, "error": res.stderr or None}
+
+
+@mcp.tool(description="List or close the open raw-REPL sessions")
+def codee_repl_sessions(close: bool = False) -> dict:
+    """Show open sessions (port, operations, age); close=True releases every port."""
+    sessions = repl_pool().sessions()
+    if close:
+        repl_pool().close_all()
+    return {"ok": True, "sessions": sessions, "closed": close}
+
+
 @mcp.tool(description="Run a MicroPython script on Wokwi via RFC2217 paste-mode")
 def run_wokwi_script(
     script_path: str,
     port: str = "rfc2217://localhost:4000",
+    timeout: float = PASTE_TIMEOUT,
+    sentinel: str | None = None,
 ) -> dict:
-    """Run a MicroPython script on the Wokwi sim using paste-mode over RFC2217."""
+    """Run a MicroPython script on the Wokwi sim using paste-mode over RFC2217.
+
+    Returns as soon as the REPL prompt (or `sentinel`) comes back; stderr holds the
+    traceback, if any.
+    """
     if not script_path:
         raise ValueError("script_path is required")
-    res = run_script_paste_mode(port=port, script_path=script_path)
+    res = run_script_paste_mode(
+        port=port,
+        script_path=script_path,
+        read_timeout=timeout,
+        sentinel=sentinel,
+    )
     return {
         "ok": res.ok,
         "port": port,
@@ -169,75 +327,339 @@ def run_wokwi_script(
 
 
 @mcp.tool(description="Dump full Codee flash to file (esptool)")
-def backup_codee_full_flash(
+async def backup_codee_full_flash(
     port: str | None = None,
     out_dir: str = "backups",
     flash_size: int = 0x400000,
-    baud: int = 921600,
+    baud: int | None = None,
+    incremental: bool = False,
+    sparse: bool = False,
+    ctx: Context | None = None,
 ) -> dict:
-    """Dump full flash to file using esptool (default 4MB)."""
+    """Dump full flash to file using esptool (default 4MB).
+
+    incremental=True reads back only blocks whose device-side MD5 changed since the
+    newest snapshot in out_dir; sparse=True stores the image without erased sectors.
+    """
     resolved = resolve_codee_port(port)
-    return backup_full_flash(
+    return await _run_with_progress(
+        ctx,
+        backup_full_flash,
         port=resolved,
         out_dir=out_dir,
         flash_size=flash_size,
         baud=baud,
+        incremental=incremental,
+        sparse=sparse,
     )
 
 
 @mcp.tool(description="Backup Codee state partitions (SPIFFS/NVS)")
-def backup_codee_state(
+async def backup_codee_state(
     port: str | None = None,
     out_dir: str = "backups",
-    baud: int = 921600,
+    baud: int | None = None,
+    ctx: Context | None = None,
 ) -> dict:
     """Backup state partitions (SPIFFS/NVS) to files."""
     resolved = resolve_codee_port(port)
-    return backup_state_partitions(
+    return await _run_with_progress(
+        ctx,
+        backup_state_partitions,
         port=resolved,
         out_dir=out_dir,
         baud=baud,
     )
 
 
+@mcp.tool(description="Convert a raw full-flash dump to a sparse container or back")
+def convert_codee_flash_backup(
+    path: str,
+    to: str = "sparse",
+    out_path: str | None = None,
+    compress: bool = True,
+) -> dict:
+    """Convert between raw .bin dumps and sparse containers (to='sparse' or to='raw')."""
+    if to == "sparse":
+        return convert_raw_to_sparse(raw_path=path, out_path=out_path, compress=compress)
+    if to == "raw":
+        return export_sparse_to_raw(sparse_path=path, out_path=out_path)
+    raise ValueError(f"Invalid target '{to}', expected 'sparse' or 'raw'")
+
+
+@mcp.tool(description="Export partitions from full-flash dumps already on disk")
+def extract_codee_partitions(
+    path: str,
+    out_dir: str | None = None,
+    labels: list[str] | None = None,
+) -> dict:
+    """Slice partitions out of a dump (or every codee-fullflash-* dump in a directory) offline."""
+    if Path(path).is_dir():
+        return extract_partitions_batch(dump_dir=path, out_dir=out_dir, labels=labels)
+    return extract_partitions(dump_path=path, out_dir=out_dir, labels=labels)
+
+
+@mcp.tool(description="Add a backup image to the deduplicating sector store")
+def add_codee_backup_to_store(
+    image_path: str,
+    store_dir: str = DEFAULT_STORE_DIR,
+    device: str = "unknown",
+    label: str | None = None,
+) -> dict:
+    """Chunk a backup image into 4KB sectors, store unseen sectors once, record a manifest."""
+    return add_snapshot(store_dir=store_dir, image_path=image_path, device=device, label=label)
+
+
+@mcp.tool(description="List snapshots in the deduplicating backup store")
+def list_codee_backup_store(
+    store_dir: str = DEFAULT_STORE_DIR,
+    device: str | None = None,
+    label: str | None = None,
+) -> dict:
+    """List snapshot manifests plus unique-sector usage of the store."""
+    return list_snapshots(store_dir=store_dir, device=device, label=label)
+
+
+@mcp.tool(description="Rebuild a snapshot from the deduplicating backup store")
+def restore_codee_backup_from_store(
+    snapshot_id: str,
+    out_path: str,
+    store_dir: str = DEFAULT_STORE_DIR,
+) -> dict:
+    """Reassemble a stored snapshot into an image file (flash it with restore_codee_full_flash_backup)."""
+    return restore_snapshot(store_dir=store_dir, snapshot_id=snapshot_id, out_path=out_path)
+
+
+@mcp.tool(description="Prune the deduplicating backup store")
+def prune_codee_backup_store(
+    keep_last: int,
+    store_dir: str = DEFAULT_STORE_DIR,
+    dry_run: bool = False,
+) -> dict:
+    """Keep the newest snapshots per device/label and delete sectors nothing references."""
+    return prune_snapshots(store_dir=store_dir, keep_last=keep_last, dry_run=dry_run)
+
+
+@mcp.tool(description="Apply a last/daily/weekly retention policy to backups")
+def apply_codee_backup_retention(
+    keep_last: int = 0,
+    keep_daily: int = 0,
+    keep_weekly: int = 0,
+    root: str = DEFAULT_BACKUP_ROOT,
+    store_dir: str = DEFAULT_STORE_DIR,
+    dry_run: bool = True,
+) -> dict:
+    """Prune backups per device serial/label and store snapshots per device; report reclaimed bytes."""
+    policy = RetentionPolicy(keep_last=keep_last, keep_daily=keep_daily, keep_weekly=keep_weekly)
+    return apply_retention(root=root, policy=policy, store_dir=store_dir, dry_run=dry_run)
+
+
+@mcp.tool(description="Re-hash stored backups against their manifests")
+def audit_codee_backups(
+    root: str = DEFAULT_BACKUP_ROOT,
+    store_dir: str = DEFAULT_STORE_DIR,
+    workers: int | None = None,
+) -> dict:
+    """Check full-flash images, sparse containers and store sectors in parallel processes."""
+    return audit_backups(root=root, store_dir=store_dir, workers=workers)
+
+
+@mcp.tool(description="Query the device inventory (last firmware, last backup) without hardware")
+def query_codee_inventory(
+    device: str | None = None,
+    stale_days: int | None = None,
+    firmware_md5: str | None = None,
+) -> dict:
+    """Known devices by USB serial/MAC/port, or those not backed up within stale_days."""
+    return query_inventory(device=device, stale_days=stale_days, firmware_md5=firmware_md5)
+
+
 @mcp.tool(description="Restore a previously captured full flash backup")
-def restore_codee_full_flash_backup(
+async def restore_codee_full_flash_backup(
     backup_path: str,
     port: str | None = None,
-    baud: int = 921600,
+    baud: int | None = None,
+    diff: bool = False,
+    dry_run: bool = False,
+    ctx: Context | None = None,
 ) -> dict:
-    """Restore a previously captured full flash backup image."""
+    """Restore a previously captured full flash backup image.
+
+    diff=True rewrites only sectors whose device-side MD5 differs from the backup;
+    dry_run=True returns that plan without writing, with or without diff.
+    """
     resolved = resolve_codee_port(port)
-    return restore_full_flash_backup(
+    return await _run_with_progress(
+        ctx,
+        restore_full_flash_backup,
         port=resolved,
         backup_path=backup_path,
         baud=baud,
+        diff=diff,
+        dry_run=dry_run,
+    )
+
+
+@mcp.tool(description="Plan or apply a partition layout change with minimal rewrites")
+async def repartition_codee(
+    layout_path: str,
+    port: str | None = None,
+    table_path: str | None = None,
+    out_dir: str = "backups/repartition",
+    flash_size: int = DEFAULT_FLASH_SIZE,
+    baud: int | None = None,
+    apply: bool = False,
+    ctx: Context | None = None,
+) -> dict:
+    """Compare the current partition table with layout_path (CSV or .bin) and relocate.
+
+    With table_path the plan is computed offline from a saved table. Otherwise the device
+    table is read; apply=True backs up affected partitions, moves them in a safe order,
+    blanks new space and writes the new table.
+    """
+    if table_path:
+        return plan_repartition_offline(
+            current_table_path=table_path,
+            layout_path=layout_path,
+            flash_size=flash_size,
+            baud=baud,
+        )
+    resolved = resolve_codee_port(port)
+    return await _run_with_progress(
+        ctx,
+        repartition_device,
+        port=resolved,
+        layout_path=layout_path,
+        out_dir=out_dir,
+        flash_size=flash_size,
+        baud=baud,
+        dry_run=not apply,
     )
 
 
 @mcp.tool(description="Flash Codee firmware from official or local build")
-def flash_codee_firmware(
+async def flash_codee_firmware(
     port: str | None = None,
     source: str = "official",
     firmware_path: str | None = None,
     official_out_dir: str = "downloads/codee-official",
     build_dir: str = "third_party/Codee-Firmware/build",
-    baud: int = 460800,
+    baud: int | None = None,
+    verify: bool = False,
+    skip_unchanged: bool = False,
+    cached_payload: bool = False,
+    ctx: Context | None = None,
 ) -> dict:
-    """Flash Codee firmware from official release or local build directory."""
+    """Flash Codee firmware from official release or local build directory.
+
+    verify=True compares device-side MD5s of the written blocks with cached image hashes.
+    skip_unchanged=True writes only the plan extents (bootloader, partition table, apps and
+    data partitions) that differ.
+    cached_payload=True streams a once-compressed, cached payload instead of running esptool.
+    """
     if source not in FIRMWARE_SOURCES:
         raise ValueError(f"Invalid source '{source}', expected one of {FIRMWARE_SOURCES}")
     resolved = resolve_codee_port(port)
-    return flash_codee_firmware_flow(
+    return await _run_with_progress(
+        ctx,
+        flash_codee_firmware_flow,
         port=resolved,
         source=source,
         firmware_path=firmware_path,
         official_out_dir=official_out_dir,
         build_dir=build_dir,
         baud=baud,
+        verify=verify,
+        skip_unchanged=skip_unchanged,
+        cached_payload=cached_payload,
     )
 
 
+@mcp.tool(description="Backup/flash/verify many Codees in parallel")
+def provision_codee_fleet(
+    ports: list[str] | None = None,
+    steps: list[str] | None = None,
+    max_workers: int = DEFAULT_FLEET_WORKERS,
+    source: str = "official",
+    firmware_path: str | None = None,
+    out_dir: str = "backups/fleet",
+    log_dir: str = DEFAULT_FLEET_LOG_DIR,
+    baud: int | None = None,
+    skip_unchanged: bool = False,
+) -> dict:
+    """Provision a batch of devices with a bounded worker pool (ports=None: all detected).
+
+    Returns per-device step results and log paths plus an aggregate throughput/failure summary.
+    """
+    if source not in FIRMWARE_SOURCES:
+        raise ValueError(f"Invalid source '{source}', expected one of {FIRMWARE_SOURCES}")
+    return run_fleet(
+        ports=ports,
+        steps=tuple(steps) if steps else FLEET_STEPS,
+        max_workers=max_workers,
+        source=source,
+        firmware_path=firmware_path,
+        out_dir=out_dir,
+        log_dir=log_dir,
+        baud=baud,
+        skip_unchanged=skip_unchanged,
+    )
+
+
+@mcp.tool(description="Provision Codees through staged detect/backup/flash/deploy/smoke")
+def provision_codee_pipeline(
+    ports: list[str] | None = None,
+    stages: list[str] | None = None,
+    concurrency: dict[str, int] | None = None,
+    source: str = "official",
+    firmware_path: str | None = None,
+    out_dir: str = "backups/fleet",
+    deploy_dir: str = DEFAULT_DEPLOY_DIR,
+    smoke_script: str | None = None,
+    baud: int | None = None,
+    skip_unchanged: bool = False,
+    verify: bool = True,
+) -> dict:
+    """Run the staged provisioning pipeline (ports=None: all detected devices).
+
+    concurrency maps stage name to worker limit (e.g. {"flash": 2}); the result reports
+    per-stage queue depth, wait/service latency, utilization and the bottleneck stage.
+    """
+    if source not in FIRMWARE_SOURCES:
+        raise ValueError(f"Invalid source '{source}', expected one of {FIRMWARE_SOURCES}")
+    return run_pipeline(
+        ports=ports,
+        stages=tuple(stages) if stages else PIPELINE_STAGES,
+        concurrency=concurrency,
+        source=source,
+        firmware_path=firmware_path,
+        out_dir=out_dir,
+        deploy_dir=deploy_dir,
+        smoke_script=smoke_script,
+        baud=baud,
+        skip_unchanged=skip_unchanged,
+        verify=verify,
+    )
+
+
+@mcp.tool(description="Parse an ESP32-S3 firmware image into segments and a flash plan")
+def inspect_codee_firmware(image_path: str) -> dict:
+    """List the bootloader, partition table, app and data-partition extents of a firmware file."""
+    return inspect_firmware_image(image_path)
+
+
+@mcp.tool(description="Verify device flash against an image by MD5 (no read-back)")
+def verify_codee_flash(
+    image_path: str,
+    port: str | None = None,
+    offset: int = 0,
+    baud: int | None = None,
+) -> dict:
+    """Report regions where device flash differs from image_path placed at offset."""
+    resolved = resolve_codee_port(port)
+    return verify_flash_image(port=resolved, image_path=image_path, offset=offset, baud=baud)
+
+
 @mcp.tool(description="Decode a Codee NVS backup/savegame")
 def decode_codee_nvs_backup(
     nvs_path: str,
@@ -325,6 +747,8 @@ def codee_gamewatch_adaptation_plan() -> dict:
 
 def main() -> None:
     auto_load_env()
+    # Tools called with port=None then resolve from the live registry instead of enumerating.
+    start_device_watcher()
     mcp.run()
 
 
@@ -1,13 +1,17 @@
 from __future__ import annotations
 
 import glob
+import hashlib
+import os
+import shutil
 from pathlib import Path
 
 from .flash import write_flash_zero
-from .util import CommandResult, run_cmd
+from .util import CommandResult, cache_dir, run_cmd
 
 
 CM_MICROPYTHON_REPO = "https://github.com/CircuitMess/micropython.git"
+FROZEN_MANIFEST_NAME = "circuithack_frozen_manifest.py"
 
 
 def clone_or_update_micropython(repo_dir: str | Path) -> CommandResult:
@@ -21,62 +25,153 @@ def clone_or_update_micropython(repo_dir: str | Path) -> CommandResult:
     )
 
 
-def build_micropython_board(repo_dir: str | Path, board: str = "CM_Codee") -> CommandResult:
+def port_kit_hash(freeze_dir: str | Path) -> str:
+    """SHA-256 over the names and contents of the package's modules."""
+    digest = hashlib.sha256()
+    for path in sorted(Path(freeze_dir).glob("*.py")):
+        digest.update(path.name.encode() + b"\0" + path.read_bytes() + b"\0")
+    return digest.hexdigest()
+
+
+def write_frozen_manifest(repo_dir: str | Path, board: str, freeze_dir: str | Path) -> Path:
+    """Manifest that keeps the board's frozen modules and adds `freeze_dir` as a package."""
+    repo_dir = Path(repo_dir).resolve()
+    freeze_dir = Path(freeze_dir).resolve()
+    board_manifest = repo_dir / "ports" / "esp32" / "boards" / board / "manifest.py"
+    base = str(board_manifest) if board_manifest.exists() else "$(PORT_DIR)/boards/manifest.py"
+    path = repo_dir / "ports" / "esp32" / f"build-{board}-frozen" / FROZEN_MANIFEST_NAME
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        f"include({base!r})\n"
+        f"package({freeze_dir.name!r}, base_path={str(freeze_dir.parent)!r})\n",
+        encoding="utf-8",
+    )
+    return path
+
+
+def build_micropython_board(
+    repo_dir: str | Path,
+    board: str = "CM_Codee",
+    freeze_dir: str | Path | None = None,
+) -> CommandResult:
     repo_dir = Path(repo_dir)
     ports_esp32 = repo_dir / "ports" / "esp32"
     # Requires ESP-IDF configured in shell env.
     cmd = ["make", "-C", str(ports_esp32), f"BOARD={board}"]
+    if freeze_dir is not None:
+        # A separate build dir, so frozen and plain builds do not invalidate each other.
+        manifest = write_frozen_manifest(repo_dir, board, freeze_dir)
+        cmd += [f"BUILD=build-{board}-frozen", f"FROZEN_MANIFEST={manifest}"]
     return run_cmd(cmd, timeout=3600)
 
 
-def find_built_firmware(repo_dir: str | Path, board: str) -> Path | None:
+def find_built_firmware(repo_dir: str | Path, board: str, frozen: bool = False) -> Path | None:
     repo_dir = Path(repo_dir)
-    candidates = glob.glob(str(repo_dir / "ports" / "esp32" / f"build-{board}" / "firmware.bin"))
-    if not candidates:
+    build = f"build-{board}-frozen" if frozen else f"build-{board}"
+    candidates = glob.glob(str(repo_dir / "ports" / "esp32" / build / "firmware.bin"))
+    if not candidates and not frozen:
         candidates = glob.glob(str(repo_dir / "ports" / "esp32" / "build*" / "firmware.bin"))
     return Path(candidates[0]) if candidates else None
 
 
-def build_and_flash_micropython(
-    port: str,
+def repo_revision(repo_dir: str | Path) -> str | None:
+    """HEAD commit of a clean checkout; None when it has local changes or is not git."""
+    head = run_cmd(["git", "-C", str(repo_dir), "rev-parse", "HEAD"], timeout=30)
+    if not head.ok:
+        return None
+    status = run_cmd(
+        ["git", "-C", str(repo_dir), "status", "--porcelain", "--untracked-files=no"],
+        timeout=60,
+    )
+    return head.stdout.strip() if status.ok and not status.stdout.strip() else None
+
+
+def firmware_build_cache_path(commit: str, board: str, kit_hash: str) -> Path:
+    key = hashlib.sha256(f"{commit}\0{board}\0{kit_hash}".encode()).hexdigest()
+    return cache_dir() / "micropython-builds" / key / "firmware.bin"
+
+
+def build_micropython_cached(
     repo_dir: str | Path,
     board: str = "CM_Codee",
-    baud: int = 460800,
+    freeze_dir: str | Path | None = None,
 ) -> dict:
-    res_clone = clone_or_update_micropython(repo_dir)
-    if not res_clone.ok:
-        return {
-            "ok": False,
-            "stage": "clone_or_update",
-            "stdout": res_clone.stdout,
-            "stderr": res_clone.stderr,
-        }
+    """Build firmware once per (MicroPython commit, board, port-kit hash).
+
+    A repeat call with the same combination returns the stored firmware.bin without
+    running make. Checkouts with local changes are built every time.
+    """
+    commit = repo_revision(repo_dir)
+    kit_hash = port_kit_hash(freeze_dir) if freeze_dir is not None else ""
+    result: dict = {
+        "board": board,
+        "commit": commit,
+        "frozen": str(freeze_dir) if freeze_dir is not None else None,
+        "port_kit_hash": kit_hash or None,
+    }
+    cached = firmware_build_cache_path(commit, board, kit_hash) if commit else None
+    if cached is not None and cached.exists():
+        return {**result, "ok": True, "cached": True, "firmware_path": str(cached)}
 
-    res_build = build_micropython_board(repo_dir=repo_dir, board=board)
-    if not res_build.ok:
+    res = build_micropython_board(repo_dir=repo_dir, board=board, freeze_dir=freeze_dir)
+    if not res.ok:
         return {
+            **result,
             "ok": False,
             "stage": "build",
-            "stdout": res_build.stdout,
-            "stderr": res_build.stderr,
+            "stdout": res.stdout,
+            "stderr": res.stderr,
             "hint": "ESP-IDF environment is likely not configured in this shell.",
         }
-
-    fw = find_built_firmware(repo_dir=repo_dir, board=board)
+    fw = find_built_firmware(repo_dir=repo_dir, board=board, frozen=freeze_dir is not None)
     if fw is None:
         return {
+            **result,
             "ok": False,
             "stage": "locate_firmware",
             "stdout": "",
             "stderr": f"Could not find built firmware for board {board}",
         }
+    if cached is not None:
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        tmp = cached.with_name(cached.name + ".tmp")
+        shutil.copyfile(fw, tmp)
+        os.replace(tmp, cached)
+        fw = cached
+    return {**result, "ok": True, "cached": False, "firmware_path": str(fw)}
+
+
+def build_and_flash_micropython(
+    port: str,
+    repo_dir: str | Path,
+    board: str = "CM_Codee",
+    baud: int | None = None,
+    freeze_dir: str | Path | None = None,
+) -> dict:
+    """Update the fork, build (or reuse a cached build) and flash.
+
+    With `freeze_dir` (e.g. ports/codee) that package is frozen into the image, so
+    it runs from flash-mapped bytecode instead of being loaded onto the heap.
+    """
+    res_clone = clone_or_update_micropython(repo_dir)
+    if not res_clone.ok:
+        return {
+            "ok": False,
+            "stage": "clone_or_update",
+            "stdout": res_clone.stdout,
+            "stderr": res_clone.stderr,
+        }
 
-    res_flash = write_flash_zero(port=port, firmware_bin=fw, baud=baud)
+    build = build_micropython_cached(repo_dir=repo_dir, board=board, freeze_dir=freeze_dir)
+    if not build["ok"]:
+        return build
+
+    res_flash = write_flash_zero(port=port, firmware_bin=build["firmware_path"], baud=baud)
     return {
         "ok": res_flash.ok,
         "stage": "flash",
-        "firmware_path": str(fw),
+        "firmware_path": build["firmware_path"],
+        "build": {k: v for k, v in build.items() if k not in ("ok", "firmware_path")},
         "stdout": res_flash.stdout,
         "stderr": res_flash.stderr,
     }
-
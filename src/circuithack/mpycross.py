@@ -0,0 +1,190 @@
+from __future__ import annotations
+
+import ast
+import hashlib
+import importlib.util
+import os
+import re
+import shutil
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+from .replsession import repl_exec, repl_eval
+from .util import cache_dir, run_cmd
+
+DEFAULT_MPY_OUT_DIR = "build/codee-mpy"
+UNCOMPILED = ("boot.py", "main.py")  # the firmware only runs these as source
+# Index of the native architecture in sys.implementation._mpy (bits 10+), as in py/persistentcode.h.
+MPY_ARCHS = (
+    None,
+    "x86",
+    "x64",
+    "armv6",
+    "armv6m",
+    "armv7m",
+    "armv7em",
+    "armv7emsp",
+    "armv7emdp",
+    "xtensa",
+    "xtensawin",
+    "rv32imc",
+)
+_EMITS = re.compile(r"mpy v(\d+)(?:\.(\d+))?")
+
+# Runs on the device: import a package from scratch and report time and heap use.
+_MEASURE = """
+import gc, sys, time
+for _k in [k for k in sys.modules if k == {pkg!r} or k.startswith({pkg!r} + '.')]:
+    del sys.modules[_k]
+gc.collect()
+_f = gc.mem_free()
+_t = time.ticks_us()
+__import__({pkg!r})
+_t = time.ticks_diff(time.ticks_us(), _t)
+_a = _f - gc.mem_free()
+gc.collect()
+print({{'import_us': _t, 'heap_allocated': _a, 'heap_retained': _f - gc.mem_free()}})
+"""
+
+
+def mpy_cross_executable() -> list[str] | None:
+    if shutil.which("mpy-cross"):
+        return ["mpy-cross"]
+    if importlib.util.find_spec("mpy_cross") is not None:
+        return [sys.executable, "-m", "mpy_cross"]
+    return None
+
+
+@dataclass(frozen=True)
+class MpyTarget:
+    """Bytecode format a firmware loads: mpy version, sub-version and native arch."""
+
+    version: int
+    sub_version: int
+    arch: str | None
+
+    @classmethod
+    def from_sys_mpy(cls, value: int) -> MpyTarget:
+        arch = value >> 10
+        return cls(
+            version=value & 0xFF,
+            sub_version=(value >> 8) & 0x3,
+            arch=MPY_ARCHS[arch] if arch < len(MPY_ARCHS) else None,
+        )
+
+    def to_dict(self) -> dict:
+        return {"version": f"{self.version}.{self.sub_version}", "arch": self.arch}
+
+
+def device_mpy_target(port: str) -> MpyTarget | None:
+    """The device's bytecode format, or None when the firmware does not expose it."""
+    res = repl_eval(port, "getattr(__import__('sys').implementation, '_mpy', 0)")
+    if not res["ok"]:
+        raise RuntimeError(res["error"])
+    return MpyTarget.from_sys_mpy(res["value"]) if res["value"] else None
+
+
+def mpy_cross_version(exe: list[str]) -> tuple[str, tuple[int, int]]:
+    """(version banner, emitted (version, sub-version)) of an mpy-cross binary."""
+    res = run_cmd([*exe, "--version"], timeout=30)
+    match = _EMITS.search(res.stdout)
+    if not res.ok or not match:
+        raise RuntimeError(f"Could not read the mpy-cross version: {res.stdout}{res.stderr}")
+    return res.stdout.strip(), (int(match.group(1)), int(match.group(2) or 0))
+
+
+def mpy_cache_dir() -> Path:
+    path = cache_dir() / "mpy"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _compile_cached(exe: list[str], banner: str, flags: list[str], src: Path) -> tuple[Path, bool]:
+    source = src.read_bytes()
+    key = hashlib.sha256(
+        "\0".join([banner, *flags, src.name]).encode() + b"\0" + source
+    ).hexdigest()
+    cached = mpy_cache_dir() / f"{key}.mpy"
+    if cached.exists():
+        return cached, True
+    tmp = cached.with_name(cached.name + ".tmp")
+    res = run_cmd([*exe, *flags, "-s", src.name, "-o", str(tmp), str(src)], timeout=120)
+    if not res.ok:
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError(f"mpy-cross failed on {src.name}: {res.stderr or res.stdout}")
+    os.replace(tmp, cached)
+    return cached, False
+
+
+def compile_port_kit(
+    src_dir: str | Path,
+    out_dir: str | Path = DEFAULT_MPY_OUT_DIR,
+    target: MpyTarget | None = None,
+) -> dict:
+    """Precompile the port kit to .mpy in out_dir, recompiling only changed modules.
+
+    Outputs are cached by source hash, mpy-cross version and flags. With a `target`
+    (see `device_mpy_target`) the compiler must emit that bytecode version, and
+    native code is built for the device's architecture. boot.py and main.py are
+    copied as source.
+    """
+    exe = mpy_cross_executable()
+    if exe is None:
+        return {
+            "ok": False,
+            "error": "mpy-cross not found; `pip install mpy-cross` or build micropython/mpy-cross",
+        }
+    try:
+        banner, emits = mpy_cross_version(exe)
+    except RuntimeError as exc:
+        return {"ok": False, "error": str(exc)}
+    result: dict = {
+        "mpy_cross": banner,
+        "target": target.to_dict() if target else None,
+        "out_dir": str(out_dir),
+    }
+    if target and emits != (target.version, target.sub_version):
+        return {
+            **result,
+            "ok": False,
+            "error": f"mpy-cross emits mpy v{emits[0]}.{emits[1]}, "
+            f"the firmware loads v{target.version}.{target.sub_version}",
+        }
+    flags = [f"-march={target.arch}"] if target and target.arch else []
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    produced: set[str] = set()
+    compiled: list[str] = []
+    cached: list[str] = []
+    try:
+        for src in sorted(Path(src_dir).glob("*.py")):
+            if src.name in UNCOMPILED:
+                built, name = src, src.name
+            else:
+                built, hit = _compile_cached(exe, banner, flags, src)
+                name = src.with_suffix(".mpy").name
+                (cached if hit else compiled).append(src.name)
+            dest = out_dir / name
+            produced.add(name)
+            if not dest.exists() or dest.read_bytes() != built.read_bytes():
+                shutil.copyfile(built, dest)
+    except RuntimeError as exc:
+        return {**result, "ok": False, "error": str(exc), "compiled": compiled}
+    for stale in out_dir.iterdir():
+        if stale.is_file() and stale.name not in produced:
+            stale.unlink()
+    return {**result, "ok": True, "compiled": compiled, "cached": cached}
+
+
+def measure_import(port: str, package: str) -> dict:
+    """Import `package` from scratch on the device: microseconds and heap bytes used.
+
+    heap_allocated includes the compiler's garbage for .py sources; heap_retained is
+    what stays after a collection.
+    """
+    res = repl_exec(port, _MEASURE.format(pkg=package), cmd=["repl", port, "import", package])
+    if not res.ok:
+        return {"ok": False, "package": package, "error": res.stderr.strip()}
+    return {"ok": True, "package": package, **ast.literal_eval(res.stdout.strip())}
@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+import struct
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+PARTITION_TABLE_OFFSET = 0x10000
+PARTITION_TABLE_SIZE = 0x1000
+
+
+@dataclass
+class PartitionEntry:
+    label: str
+    type: int
+    subtype: int
+    offset: int
+    size: int
+    flags: int
+
+    def to_dict(self) -> dict:
+        d = asdict(self)
+        d["offset_hex"] = hex(self.offset)
+        d["size_hex"] = hex(self.size)
+        return d
+
+
+def parse_partition_table_bytes(data: bytes) -> list[PartitionEntry]:
+    out: list[PartitionEntry] = []
+    for i in range(0, len(data), 32):
+        entry = bytes(data[i : i + 32])
+        if len(entry) < 32:
+            break
+        if entry == b"\xFF" * 32:
+            continue
+        magic, ptype, subtype, offset, size, label_raw, flags = struct.unpack("<HBBII16sI", entry)
+        if magic != 0x50AA:
+            continue
+        label = label_raw.split(b"\x00", 1)[0].decode("ascii", errors="ignore")
+        out.append(
+            PartitionEntry(
+                label=label,
+                type=ptype,
+                subtype=subtype,
+                offset=offset,
+                size=size,
+                flags=flags,
+            )
+        )
+    return out
+
+
+def parse_partition_table(part_bin_path: str | Path) -> list[PartitionEntry]:
+    return parse_partition_table_bytes(Path(part_bin_path).read_bytes())
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import re
+import time
+from dataclasses import dataclass
+
+from serial import SerialBase
+
+PASTE_CHUNK_SIZE = 64  # bytes in flight before waiting for their echo
+PASTE_TIMEOUT = 10.0  # upper bound on waiting for the script to finish
+ECHO_TIMEOUT = 5.0
+REPL_PROMPT = b">>> "
+PASTE_PROMPT = b"=== "
+_LINE_ECHO = b"\r\n" + PASTE_PROMPT  # the device's answer to "\r" in paste mode
+_TRACEBACK = re.compile(r"^Traceback \(most recent call last\):", re.MULTILINE)
+
+
+@dataclass
+class PasteResult:
+    stdout: str
+    traceback: str
+    completed: bool  # the prompt or sentinel came back before the timeout
+    bytes_sent: int
+    seconds: float
+
+    @property
+    def ok(self) -> bool:
+        return self.completed and not self.traceback
+
+    @property
+    def error(self) -> str:
+        if self.traceback:
+            return self.traceback
+        if not self.completed:
+            return f"No REPL prompt after {self.seconds}s; the script may still be running"
+        return ""
+
+    def to_dict(self) -> dict:
+        return {
+            "ok": self.ok,
+            "error": self.error,
+            "stdout": self.stdout,
+            "traceback": self.traceback,
+            "completed": self.completed,
+            "bytes_sent": self.bytes_sent,
+            "seconds": self.seconds,
+        }
+
+
+def split_traceback(output: str) -> tuple[str, str]:
+    """(stdout, traceback) of friendly-REPL output; the traceback runs to the end."""
+    match = _TRACEBACK.search(output)
+    if match is None:
+        return output, ""
+    return output[: match.start()], output[match.start() :]
+
+
+class PasteTransport:
+    """Friendly-REPL paste mode (Ctrl-E) over an open serial port, paced by the echo.
+
+    Each chunk of a line is written only after the previous one has been echoed, and
+    each line ends with a carriage return, which the device answers with a new "=== "
+    prompt, so the REPL's input buffer never overruns. After Ctrl-D, reading stops as
+    soon as the ">>> " prompt (or an optional sentinel) arrives.
+    """
+
+    def __init__(self, ser: SerialBase, echo_timeout: float = ECHO_TIMEOUT) -> None:
+        self.ser = ser
+        self.echo_timeout = echo_timeout
+        self._buf = bytearray()
+
+    def _fill(self) -> bool:
+        chunk = self.ser.read(max(1, self.ser.in_waiting))
+        self._buf += chunk
+        return bool(chunk)
+
+    def _expect(self, marker: bytes, what: str) -> bytes:
+        deadline = time.monotonic() + self.echo_timeout
+        while (idx := self._buf.find(marker)) < 0:
+            if time.monotonic() >= deadline:
+                raise RuntimeError(f"No {what} from the REPL within {self.echo_timeout}s")
+            self._fill()
+        head = bytes(self._buf[:idx])
+        del self._buf[: idx + len(marker)]
+        return head
+
+    def _prompt_at_end(self) -> int:
+        # The prompt counts only at the start of a line with nothing after it, and only
+        # if no more output follows within one read timeout.
+        idx = self._buf.rfind(REPL_PROMPT)
+        if idx < 0 or idx + len(REPL_PROMPT) != len(self._buf):
+            return -1
+        if idx and self._buf[idx - 1 : idx] != b"\n":
+            return -1
+        return -1 if self._fill() else idx
+
+    def _read_output(self, timeout: float, sentinel: bytes | None) -> tuple[bytes, bool]:
+        deadline = time.monotonic() + timeout
+        while True:
+            if sentinel and (idx := self._buf.find(sentinel)) >= 0:
+                return bytes(self._buf[:idx]), True
+            if (idx := self._prompt_at_end()) >= 0:
+                return bytes(self._buf[:idx]), True
+            if time.monotonic() >= deadline:
+                return bytes(self._buf), False
+            self._fill()
+
+    def paste(
+        self,
+        source: str,
+        timeout: float = PASTE_TIMEOUT,
+        sentinel: str | None = None,
+    ) -> PasteResult:
+        """Paste and run `source`; stdout and the traceback come back separately."""
+        start = time.monotonic()
+        self.ser.reset_input_buffer()
+        self._buf.clear()
+        self.ser.write(b"\r\x03\x03")  # stop whatever is running
+        self._expect(REPL_PROMPT, "prompt")
+        self.ser.write(b"\x05")
+        self._expect(PASTE_PROMPT, "paste-mode banner")
+
+        sent = 0
+        for line in source.replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+            data = line.encode("utf-8")
+            for i in range(0, len(data), PASTE_CHUNK_SIZE):
+                chunk = data[i : i + PASTE_CHUNK_SIZE]
+                self.ser.write(chunk)
+                self._expect(chunk, "echo")
+            self.ser.write(b"\r")
+            self._expect(_LINE_ECHO, "line prompt")
+            sent += len(data) + 1
+        self.ser.write(b"\x04")
+        self._expect(b"\r\n", "end of paste")
+
+        output, completed = self._read_output(timeout, sentinel.encode() if sentinel else None)
+        text = output.decode("utf-8", errors="replace").replace("\r\n", "\n")
+        stdout, traceback = split_traceback(text)
+        return PasteResult(
+            stdout=stdout,
+            traceback=traceback,
+            completed=completed,
+            bytes_sent=sent,
+            seconds=round(time.monotonic() - start, 3),
+        )
@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+
+from .baudrate import DEFAULT_TRANSFER_BAUD, resolve_baud
+from .flashsession import open_flash_session
+from .progress import ProgressCallback, region_progress, tracker_for
+from .util import cache_dir
+
+COMPRESSION_LEVEL = 9
+_MEMORY_ENTRIES = 8
+PAYLOAD_CACHE_MAX_BYTES = 256 * 1024 * 1024  # on-disk payloads beyond this are evicted, LRU
+
+_memory: OrderedDict[str, bytes] = OrderedDict()
+_key_locks: dict[str, threading.Lock] = {}
+_guard = threading.Lock()
+
+
+def payload_cache_dir() -> Path:
+    path = cache_dir() / "payloads"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def payload_key(data: bytes, level: int = COMPRESSION_LEVEL) -> str:
+    """Cache key: the deflate stream depends only on the bytes and the zlib level.
+
+    The stub's write block size is not part of the key because the one stream is
+    sliced into blocks at send time, so it serves any block size.
+    """
+    return f"{hashlib.md5(data).hexdigest()}-z{level}"
+
+
+def prune_payload_cache(max_bytes: int | None = None) -> dict:
+    """Delete the least recently used payloads until the cache fits in `max_bytes`.
+
+    The limit defaults to PAYLOAD_CACHE_MAX_BYTES. Every cache hit refreshes the
+    file's mtime, so mtime order is use order.
+    """
+    max_bytes = PAYLOAD_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    entries = []
+    for path in payload_cache_dir().glob("*.zlib"):
+        try:
+            st = path.stat()
+        except OSError:
+            continue  # evicted by another writer meanwhile
+        entries.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    removed = reclaimed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            path.unlink()
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+        reclaimed += size
+    return {"removed": removed, "reclaimed_bytes": reclaimed, "cache_bytes": total}
+
+
+def _remember(key: str, payload: bytes) -> None:
+    with _guard:
+        _memory[key] = payload
+        _memory.move_to_end(key)
+        while len(_memory) > _MEMORY_ENTRIES:
+            _memory.popitem(last=False)
+
+
+def _lock_for(key: str) -> threading.Lock:
+    with _guard:
+        return _key_locks.setdefault(key, threading.Lock())
+
+
+def compressed_payload(data: bytes, level: int = COMPRESSION_LEVEL) -> tuple[bytes, bool]:
+    """(zlib stream of data, whether it came from cache).
+
+    Threads asking for the same payload wait on one compression instead of each
+    deflating it; results live in memory and under the cache dir across runs, where
+    the least recently used are evicted beyond PAYLOAD_CACHE_MAX_BYTES.
+    """
+    key = payload_key(data, level)
+    with _lock_for(key):
+        with _guard:
+            if key in _memory:
+                _memory.move_to_end(key)
+                return _memory[key], True
+        path = payload_cache_dir() / f"{key}.zlib"
+        try:
+            payload = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            pass  # not cached yet, or evicted meanwhile
+        else:
+            _remember(key, payload)
+            return payload, True
+        payload = zlib.compress(data, level)
+        tmp = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(payload)
+        os.replace(tmp, path)
+        _remember(key, payload)
+    prune_payload_cache()
+    return payload, False
+
+
+def write_image_cached(
+    port: str,
+    image_path: str | Path,
+    offset: int = 0,
+    baud: int | None = None,
+    progress: ProgressCallback | None = None,
+) -> dict:
+    """Write an image through the stub from a precompressed payload, then check its MD5.
+
+    This replaces an esptool subprocess per device: the deflate stream is built once
+    per image and streamed block by block to every port that needs it.
+    """
+    path = Path(image_path)
+    data = path.read_bytes()
+    compressed, cached = compressed_payload(data)
+    baud = resolve_baud(port, baud, DEFAULT_TRANSFER_BAUD)
+    result = {
+        "image_path": str(path),
+        "offset": offset,
+        "offset_hex": hex(offset),
+        "size": len(data),
+        "compressed_size": len(compressed),
+        "payload_cached": cached,
+    }
+    try:
+        with open_flash_session(port=port, baud=baud) as session:
+            mac = session.mac()
+            tracker = tracker_for("write", progress)
+            with session.stage("write") as timing:
+                session.write_compressed(
+                    offset,
+                    len(data),
+                    compressed,
+                    region_progress(tracker, 0, len(data), len(data)),
+                )
+                timing.bytes = len(compressed)
+            with session.stage("verify"):
+                matches = session.md5(offset, len(data)) == hashlib.md5(data).hexdigest()
+    except Exception as exc:  # noqa: BLE001 - esptool/serial failures are reported, not raised
+        return {**result, "ok": False, "error": str(exc)}
+    return {
+        **result,
+        "ok": matches,
+        "mac": mac,
+        "error": None if matches else "Flash MD5 does not match the image after writing",
+        "timings": session.timings_report(),
+    }
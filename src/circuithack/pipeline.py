@@ -0,0 +1,304 @@
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from .backup import backup_state_partitions
+from .codee import (
+    FIRMWARE_SOURCE_OFFICIAL,
+    FIRMWARE_SOURCE_PATH,
+    flash_codee_firmware,
+    resolve_codee_firmware_path,
+)
+from .deploy import DEFAULT_DEPLOY_DIR, DEFAULT_REMOTE_DIR, deploy_port_kit
+from .device import serial_number_for_port
+from .fleet import device_key, resolve_fleet_ports
+from .flash import enter_programmer_mode
+from .fwimage import build_flash_plan, planned_writes
+from .hashcache import image_hashes
+from .payloadcache import compressed_payload
+from .runner import run_script
+
+PIPELINE_STAGES = ("detect", "backup", "flash", "deploy", "smoke")
+DEFAULT_STAGE_CONCURRENCY = {"detect": 4, "backup": 4, "flash": 2, "deploy": 4, "smoke": 4}
+
+
+@dataclass
+class DeviceJob:
+    port: str
+    device: str
+    ok: bool = True
+    failed_stage: str | None = None
+    results: dict[str, dict] = field(default_factory=dict)
+    enqueued_at: float = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "port": self.port,
+            "device": self.device,
+            "ok": self.ok,
+            "failed_stage": self.failed_stage,
+            "results": self.results,
+        }
+
+
+@dataclass
+class StageMetrics:
+    """Queue and service latency for one stage; updated from its worker threads."""
+
+    name: str
+    concurrency: int
+    processed: int = 0
+    failed: int = 0
+    max_queue_depth: int = 0
+    wait_seconds: list[float] = field(default_factory=list)
+    service_seconds: list[float] = field(default_factory=list)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def enqueued(self, depth: int) -> None:
+        with self._lock:
+            self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def finished(self, waited: float, served: float, ok: bool) -> None:
+        with self._lock:
+            self.processed += 1
+            self.failed += 0 if ok else 1
+            self.wait_seconds.append(waited)
+            self.service_seconds.append(served)
+
+    def to_dict(self, wall_seconds: float) -> dict:
+        busy = sum(self.service_seconds)
+        capacity = wall_seconds * self.concurrency
+        return {
+            "stage": self.name,
+            "concurrency": self.concurrency,
+            "processed": self.processed,
+            "failed": self.failed,
+            "max_queue_depth": self.max_queue_depth,
+            "mean_wait_seconds": _mean(self.wait_seconds),
+            "max_wait_seconds": round(max(self.wait_seconds, default=0.0), 3),
+            "mean_service_seconds": _mean(self.service_seconds),
+            "max_service_seconds": round(max(self.service_seconds, default=0.0), 3),
+            "utilization": round(busy / capacity, 3) if capacity > 0 else 0.0,
+        }
+
+
+def _mean(values: list[float]) -> float:
+    return round(sum(values) / len(values), 3) if values else 0.0
+
+
+def find_bottleneck(stage_reports: list[dict]) -> str | None:
+    """The stage devices queue longest in front of; utilization breaks ties."""
+    busy = [r for r in stage_reports if r["processed"]]
+    if not busy:
+        return None
+    return max(busy, key=lambda r: (r["mean_wait_seconds"], r["utilization"]))["stage"]
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[[DeviceJob], dict]
+    concurrency: int = 1
+
+
+def run_stages(
+    jobs: list[DeviceJob],
+    stages: list[Stage],
+) -> tuple[list[DeviceJob], list[dict], float]:
+    """Push jobs through stages connected by queues, each stage with its own worker pool.
+
+    A job moves to the next stage as soon as it leaves the previous one, so different
+    devices occupy different stages at the same time. A failed stage drops the job
+    from the rest of the pipeline.
+    """
+    queues: list[queue.Queue] = [queue.Queue() for _ in stages]
+    metrics = [StageMetrics(name=s.name, concurrency=s.concurrency) for s in stages]
+
+    def hand_off(index: int, job: DeviceJob) -> None:
+        job.enqueued_at = time.monotonic()
+        queues[index].put(job)
+        metrics[index].enqueued(queues[index].qsize())
+
+    def worker(index: int) -> None:
+        stage = stages[index]
+        while True:
+            job = queues[index].get()
+            if job is None:
+                return
+            started = time.monotonic()
+            try:
+                result = stage.run(job)
+            except Exception as exc:  # noqa: BLE001 - one device failing must not stop the pipeline
+                result = {"ok": False, "error": str(exc)}
+            ok = bool(result.get("ok"))
+            metrics[index].finished(started - job.enqueued_at, time.monotonic() - started, ok)
+            job.results[stage.name] = result
+            if not ok:
+                job.ok, job.failed_stage = False, stage.name
+            elif index + 1 < len(stages):
+                hand_off(index + 1, job)
+
+    start = time.monotonic()
+    pools = [
+        [
+            threading.Thread(target=worker, args=(index,), daemon=True)
+            for _ in range(max(stage.concurrency, 1))
+        ]
+        for index, stage in enumerate(stages)
+    ]
+    for pool in pools:
+        for thread in pool:
+            thread.start()
+    for job in jobs:
+        hand_off(0, job)
+    # A stage is drained once every upstream worker has exited; then its own workers may stop.
+    for index, pool in enumerate(pools):
+        for _ in pool:
+            queues[index].put(None)
+        for thread in pool:
+            thread.join()
+    wall = time.monotonic() - start
+    return jobs, [m.to_dict(wall) for m in metrics], wall
+
+
+def _prepare_firmware(firmware_path: Path | None, skip_unchanged: bool) -> dict:
+    """Host-side CPU work for the flash stage: image hashes plus the deflate payloads."""
+    if firmware_path is None:
+        return {}
+    hashes = image_hashes(firmware_path)
+    data = firmware_path.read_bytes()
+    if skip_unchanged:
+        # Precompress what a device missing this firmware is sent: the non-blank sectors of
+        # every plan entry, which are the payload-cache keys flash_image_by_plan looks up.
+        plan = build_flash_plan(data)
+        writes = planned_writes(data, plan)
+        for extent in writes:
+            compressed_payload(data[extent.offset : extent.end])
+        return {"md5": hashes["md5"], "plan_extents": len(plan), "write_extents": len(writes)}
+    payload, cached = compressed_payload(data)
+    return {"md5": hashes["md5"], "compressed_size": len(payload), "payload_cached": cached}
+
+
+def _build_stages(
+    names: tuple[str, ...],
+    concurrency: dict[str, int],
+    firmware_path: Path | None,
+    prepared: Future,
+    out_dir: Path,
+    deploy_dir: Path,
+    smoke_script: str | None,
+    baud: int | None,
+    skip_unchanged: bool,
+    verify: bool,
+) -> list[Stage]:
+    def detect(job: DeviceJob) -> dict:
+        res = enter_programmer_mode(port=job.port, baud=baud)
+        return {"ok": res.ok, "stdout": res.stdout, "stderr": res.stderr}
+
+    def backup(job: DeviceJob) -> dict:
+        return backup_state_partitions(port=job.port, out_dir=out_dir / job.device, baud=baud)
+
+    def flash(job: DeviceJob) -> dict:
+        # Hashing/planning ran on the host while earlier devices were still in serial stages.
+        prepared.result()
+        return flash_codee_firmware(
+            port=job.port,
+            source=FIRMWARE_SOURCE_PATH,
+            firmware_path=str(firmware_path),
+            baud=baud,
+            verify=verify,
+            skip_unchanged=skip_unchanged,
+            cached_payload=True,
+        )
+
+    def deploy(job: DeviceJob) -> dict:
+        return deploy_port_kit(job.port, src_dir=deploy_dir, remote_dir=DEFAULT_REMOTE_DIR)
+
+    def smoke(job: DeviceJob) -> dict:
+        if not smoke_script:
+            return {"ok": True, "skipped": True}
+        res = run_script(port=job.port, script_path=smoke_script)
+        return {"ok": res.ok, "stdout": res.stdout, "stderr": res.stderr}
+
+    runners = {"detect": detect, "backup": backup, "flash": flash, "deploy": deploy, "smoke": smoke}
+    return [
+        Stage(name=name, run=runners[name], concurrency=concurrency.get(name, 1))
+        for name in names
+    ]
+
+
+def run_pipeline(
+    ports: list[str] | None = None,
+    stages: tuple[str, ...] = PIPELINE_STAGES,
+    concurrency: dict[str, int] | None = None,
+    source: str = FIRMWARE_SOURCE_OFFICIAL,
+    firmware_path: str | None = None,
+    official_out_dir: str = "downloads/codee-official",
+    build_dir: str = "third_party/Codee-Firmware/build",
+    out_dir: str | Path = "backups/fleet",
+    deploy_dir: str | Path = DEFAULT_DEPLOY_DIR,
+    smoke_script: str | None = None,
+    baud: int | None = None,
+    skip_unchanged: bool = False,
+    verify: bool = True,
+) -> dict:
+    """Provision devices through detect → backup → flash → deploy → smoke stages.
+
+    Each stage has its own concurrency limit (e.g. flash=2 to spare a shared USB hub)
+    and the result reports per-stage queue depth, wait and service latency so the
+    bottleneck stage is visible. Firmware hashing and compression run on a host
+    thread while the first devices are still in detect/backup, so the flash stage
+    finds hashes and deflate payloads already cached.
+    """
+    unknown = [s for s in stages if s not in PIPELINE_STAGES]
+    if unknown:
+        raise ValueError(f"Unknown pipeline stages {unknown}, expected a subset of {PIPELINE_STAGES}")
+    stages = tuple(s for s in PIPELINE_STAGES if s in stages)
+    limits = {**DEFAULT_STAGE_CONCURRENCY, **(concurrency or {})}
+    targets = resolve_fleet_ports(ports)
+    if not targets:
+        return {"ok": False, "error": "No Codee-like USB serial devices found.", "devices": []}
+
+    fw_path: Path | None = None
+    source_info: dict = {}
+    if "flash" in stages:
+        fw_path, source_info = resolve_codee_firmware_path(
+            source=source,
+            firmware_path=firmware_path,
+            official_out_dir=official_out_dir,
+            build_dir=build_dir,
+        )
+    jobs = [DeviceJob(port=p, device=device_key(p, serial_number_for_port(p))) for p in targets]
+
+    with ThreadPoolExecutor(max_workers=1) as host:
+        prepared = host.submit(_prepare_firmware, fw_path, skip_unchanged)
+        pipeline = _build_stages(
+            stages,
+            limits,
+            firmware_path=fw_path,
+            prepared=prepared,
+            out_dir=Path(out_dir),
+            deploy_dir=Path(deploy_dir),
+            smoke_script=smoke_script,
+            baud=baud,
+            skip_unchanged=skip_unchanged,
+            verify=verify,
+        )
+        jobs, stage_reports, wall = run_stages(jobs, pipeline)
+
+    return {
+        "ok": all(j.ok for j in jobs),
+        "stages": stage_reports,
+        "bottleneck": find_bottleneck(stage_reports),
+        "wall_seconds": round(wall, 3),
+        "firmware_path": str(fw_path) if fw_path else None,
+        "source_info": source_info,
+        "host_prepare": None if prepared.exception() else prepared.result(),
+        "devices": [j.to_dict() for j in jobs],
+    }
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from esptool.cmds import detect_chip, detect_flash_size, flash_size_bytes
+from serial import SerialBase, serial_for_url
+
+from .device import active_device_watcher, codee_candidates, list_serial_devices
+from .flashsession import close_loader
+from .util import cache_dir, load_json_cache, release_port, update_json_cache
+
+PROBE_TIMEOUT = 5.0
+DEFAULT_PROBE_WORKERS = 8
+ABANDON_GRACE = 1.0  # how long a timed-out handshake gets to unwind once its port is closed
+
+# Ports held by running handshakes, so a timed-out probe can be cut off by closing its port.
+_probe_lock = threading.Lock()
+_probe_ports: dict[str, SerialBase] = {}
+_abandoned: set[str] = set()
+
+
+@dataclass
+class DeviceFingerprint:
+    port: str
+    usb_serial: str | None
+    chip: str
+    mac: str
+    flash_size: int | None
+    plug: str | None  # identity of the port's device node; changes when the device is replugged
+    probed_at: float
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def fingerprint_cache_path() -> Path:
+    return cache_dir() / "fingerprints.json"
+
+
+def load_fingerprints() -> dict[str, dict]:
+    return load_json_cache(fingerprint_cache_path())
+
+
+def plug_token(port: str) -> str | None:
+    """Identity of the current plug-in: /dev nodes are recreated on every attach."""
+    try:
+        st = os.stat(port)
+    except OSError:
+        return None
+    return f"{st.st_ino}-{st.st_ctime_ns}"
+
+
+def _open_probe_port(port: str) -> SerialBase:
+    with _probe_lock:
+        if port in _abandoned:
+            raise RuntimeError(f"Probe of {port} was abandoned after its timeout")
+        ser = serial_for_url(port, exclusive=True, do_not_open=True)
+        ser.open()
+        _probe_ports[port] = ser
+    return ser
+
+
+def _close_probe_port(port: str, ser: SerialBase) -> None:
+    with _probe_lock:
+        if _probe_ports.get(port) is ser:
+            del _probe_ports[port]
+    ser.close()
+
+
+def _abandon(port: str) -> None:
+    """Close a timed-out probe's port: its blocked esptool read fails and the thread ends."""
+    with _probe_lock:
+        _abandoned.add(port)
+        ser = _probe_ports.pop(port, None)
+    if ser is not None:
+        ser.close()
+
+
+def _handshake(port: str) -> tuple[str, str, int | None]:
+    """ROM handshake only (no stub upload): chip description, base MAC and flash size."""
+    release_port(port)
+    ser = _open_probe_port(port)
+    try:
+        # esptool accepts an open serial object in place of a port name.
+        esp = detect_chip(port=ser, connect_mode="default-reset", connect_attempts=1)
+        try:
+            mac = ":".join(f"{b:02x}" for b in esp.read_mac())
+            size = detect_flash_size(esp)
+            return esp.get_chip_description(), mac, flash_size_bytes(size) if size else None
+        finally:
+            close_loader(esp, after="hard-reset")
+    finally:
+        _close_probe_port(port, ser)
+
+
+def _probe(port: str, usb_serial: str | None) -> DeviceFingerprint:
+    chip, mac, flash_size = _handshake(port)
+    return DeviceFingerprint(
+        port=port,
+        usb_serial=usb_serial,
+        chip=chip,
+        mac=mac,
+        flash_size=flash_size,
+        plug=plug_token(port),
+        probed_at=time.time(),
+    )
+
+
+def _cached(cache: dict[str, dict], port: str, usb_serial: str | None) -> DeviceFingerprint | None:
+    entry = cache.get(usb_serial or "")
+    if entry and entry["port"] == port and entry["plug"] == plug_token(port):
+        return DeviceFingerprint(**entry)
+    return None
+
+
+def probe_devices(
+    ports: list[str] | None = None,
+    timeout: float = PROBE_TIMEOUT,
+    refresh: bool = False,
+    workers: int = DEFAULT_PROBE_WORKERS,
+) -> dict:
+    """Fingerprint candidate ports (chip, MAC, flash size) with parallel ROM handshakes.
+
+    Fingerprints are cached per USB serial number and reused until the device is
+    replugged (its /dev node changes) or `refresh` is set, so a repeat scan opens no
+    port at all. A handshake still running after `timeout` seconds is reported as
+    timed out and its port is closed, which makes the blocked esptool read fail, so
+    the worker thread ends and the port is free again when this returns.
+    """
+    start = time.monotonic()
+    ports = list(dict.fromkeys(ports or [d.path for d in codee_candidates()]))
+    watcher = active_device_watcher()
+    known = watcher.devices() if watcher else list_serial_devices(only_likely_usb=False)
+    serials = {d.path: d.serial_number for d in known}
+    cache = load_fingerprints()
+    results: dict[str, dict] = {}
+    fresh: dict[str, dict] = {}
+    to_probe: list[str] = []
+    for port in ports:
+        hit = None if refresh else _cached(cache, port, serials.get(port))
+        if hit is None:
+            to_probe.append(port)
+        else:
+            results[port] = {"ok": True, "source": "cache", **hit.to_dict()}
+
+    if to_probe:
+        with _probe_lock:
+            _abandoned.difference_update(to_probe)
+        pool = ThreadPoolExecutor(max_workers=min(workers, len(to_probe)))
+        futures = {pool.submit(_probe, port, serials.get(port)): port for port in to_probe}
+        done, _ = wait(futures, timeout=timeout)
+        for future, port in futures.items():
+            if future not in done:
+                _abandon(port)
+        wait([f for f in futures if f not in done], timeout=ABANDON_GRACE)
+        pool.shutdown(wait=False, cancel_futures=True)
+        for future, port in futures.items():
+            if future not in done:
+                results[port] = {"ok": False, "port": port, "error": f"No answer in {timeout}s"}
+                continue
+            try:
+                fingerprint = future.result()
+            except Exception as exc:  # noqa: BLE001 - esptool/serial failures are reported, not raised
+                results[port] = {"ok": False, "port": port, "error": str(exc)}
+                continue
+            if fingerprint.usb_serial:
+                fresh[fingerprint.usb_serial] = fingerprint.to_dict()
+            results[port] = {"ok": True, "source": "probe", **fingerprint.to_dict()}
+        with update_json_cache(fingerprint_cache_path()) as stored:
+            stored.update(fresh)
+
+    devices = [results[port] for port in ports]
+    return {
+        "ok": all(d["ok"] for d in devices),
+        "probed": len(to_probe),
+        "cached": len(ports) - len(to_probe),
+        "seconds": round(time.monotonic() - start, 3),
+        "devices": devices,
+    }
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import re
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+# esptool v5: "Writing at 0x00010000 [====>    ]  45.3% 12345/400000 bytes..."
+# esptool v4: "Writing at 0x00010000... (45 %)"
+_ESPTOOL_PROGRESS = re.compile(
+    r"(?P<verb>Writing|Reading) (?:at|from) 0x[0-9a-fA-F]+"
+    r".*?(?P<percent>\d+(?:\.\d+)?)\s*%"
+    r"(?:\)?\s*(?P<done>\d+)/(?P<total>\d+) bytes)?"
+)
+_ESPTOOL_STAGES = {"Writing": "write", "Reading": "read"}
+
+
+@dataclass(frozen=True)
+class ProgressEvent:
+    stage: str
+    percent: float
+    bytes_done: int | None = None
+    bytes_total: int | None = None
+    bytes_per_second: float | None = None
+    eta_seconds: float | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.percent >= 100.0
+
+    def message(self) -> str:
+        parts = [f"{self.stage} {self.percent:.1f}%"]
+        if self.bytes_per_second:
+            parts.append(f"{self.bytes_per_second / 1024:.1f} KiB/s")
+        if self.eta_seconds is not None and not self.finished:
+            parts.append(f"ETA {self.eta_seconds:.0f}s")
+        return ", ".join(parts)
+
+    def to_dict(self) -> dict:
+        return {
+            "stage": self.stage,
+            "percent": round(self.percent, 1),
+            "bytes_done": self.bytes_done,
+            "bytes_total": self.bytes_total,
+            "bytes_per_second": round(self.bytes_per_second) if self.bytes_per_second else None,
+            "eta_seconds": round(self.eta_seconds, 1) if self.eta_seconds is not None else None,
+        }
+
+
+ProgressCallback = Callable[[ProgressEvent], None]
+
+
+class ProgressTracker:
+    """Turns raw (done, total) samples into throttled events with rate and ETA."""
+
+    def __init__(
+        self,
+        stage: str,
+        callback: ProgressCallback,
+        min_interval: float = 0.25,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.stage = stage
+        self._callback = callback
+        self._min_interval = min_interval
+        self._clock = clock
+        self._start: float | None = None
+        self._start_fraction = 0.0
+        self._last_emit: float | None = None
+
+    def update(self, done: int, total: int) -> None:
+        percent = 100.0 * done / total if total else 100.0
+        self._emit(percent, done, total)
+
+    def update_percent(self, percent: float) -> None:
+        self._emit(percent, None, None)
+
+    def _emit(self, percent: float, done: int | None, total: int | None) -> None:
+        now = self._clock()
+        if self._start is None:
+            # Rates are measured from the first sample so resumed work does not inflate them.
+            self._start, self._start_fraction = now, percent / 100.0
+        finished = percent >= 100.0
+        if not finished and self._last_emit is not None and now - self._last_emit < self._min_interval:
+            return
+        self._last_emit = now
+
+        elapsed = now - self._start
+        fraction_rate = (percent / 100.0 - self._start_fraction) / elapsed if elapsed > 0 else 0.0
+        bytes_per_second = fraction_rate * total if total and fraction_rate > 0 else None
+        eta = (1.0 - percent / 100.0) / fraction_rate if fraction_rate > 0 else None
+        self._callback(
+            ProgressEvent(
+                stage=self.stage,
+                percent=min(percent, 100.0),
+                bytes_done=done,
+                bytes_total=total,
+                bytes_per_second=bytes_per_second,
+                eta_seconds=eta,
+            )
+        )
+
+
+def tracker_for(stage: str, callback: ProgressCallback | None) -> ProgressTracker | None:
+    return ProgressTracker(stage, callback) if callback is not None else None
+
+
+def region_progress(
+    tracker: ProgressTracker | None,
+    done_before: int,
+    region_size: int,
+    total: int,
+) -> Callable[[int, int], None] | None:
+    """Map one region's (done, total) callback onto the whole operation's byte count."""
+    if tracker is None:
+        return None
+    return lambda done, size: tracker.update(done_before + region_size * done // max(size, 1), total)
+
+
+def parse_esptool_progress(line: str) -> tuple[str, float, int | None, int | None] | None:
+    """(stage, percent, bytes_done, bytes_total) from one esptool progress line."""
+    match = _ESPTOOL_PROGRESS.search(line)
+    if not match:
+        return None
+    done = int(match.group("done")) if match.group("done") else None
+    total = int(match.group("total")) if match.group("total") else None
+    return _ESPTOOL_STAGES[match.group("verb")], float(match.group("percent")), done, total
+
+
+def esptool_output_handler(callback: ProgressCallback) -> Callable[[str], None]:
+    """Line callback for `run_cmd` that forwards esptool progress as events."""
+    trackers: dict[str, ProgressTracker] = {}
+
+    def on_line(line: str) -> None:
+        parsed = parse_esptool_progress(line)
+        if parsed is None:
+            return
+        stage, percent, done, total = parsed
+        tracker = trackers.setdefault(stage, ProgressTracker(stage, callback))
+        if done is not None and total:
+            # esptool's byte count lags its percentage for compressed writes; trust the percent.
+            tracker.update(round(total * percent / 100.0), total)
+        else:
+            tracker.update_percent(percent)
+
+    return on_line
@@ -0,0 +1,489 @@
+from __future__ import annotations
+
+import csv
+import hashlib
+import io
+import struct
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Callable
+
+from .baudrate import DEFAULT_TRANSFER_BAUD, resolve_baud
+from .eraseplan import blank_target_sectors, plan_blank_aware
+from .flashmap import SECTOR_SIZE, Extent, estimate_transfer_seconds, subtract_extents, total_size
+from .flashsession import FlashSession, open_flash_session
+from .partitions import (
+    PARTITION_TABLE_OFFSET,
+    PARTITION_TABLE_SIZE,
+    PartitionEntry,
+    parse_partition_table,
+    parse_partition_table_bytes,
+)
+from .progress import ProgressCallback, region_progress, tracker_for
+from .resumable import read_flash_resumable
+
+DEFAULT_FLASH_SIZE = 0x400000
+APP_ALIGNMENT = 0x10000
+PARTITION_TYPES = {"app": 0x00, "data": 0x01}
+PARTITION_SUBTYPES = {
+    0x00: {"factory": 0x00, "test": 0x20, **{f"ota_{i}": 0x10 + i for i in range(16)}},
+    0x01: {
+        "ota": 0x00,
+        "phy": 0x01,
+        "nvs": 0x02,
+        "coredump": 0x03,
+        "nvs_keys": 0x04,
+        "efuse": 0x05,
+        "undefined": 0x06,
+        "esphttpd": 0x80,
+        "fat": 0x81,
+        "spiffs": 0x82,
+        "littlefs": 0x83,
+    },
+}
+PARTITION_FLAGS = {"encrypted": 0x01, "readonly": 0x02}
+
+_ENTRY = struct.Struct("<HBBII16sI")
+_ENTRY_MAGIC = 0x50AA
+_MD5_MAGIC = 0xEBEB
+
+
+class LayoutError(ValueError):
+    pass
+
+
+def _parse_size(text: str) -> int:
+    text = text.strip().upper()
+    for suffix, scale in (("K", 1024), ("M", 1024 * 1024)):
+        if text.endswith(suffix):
+            return int(text[:-1], 0) * scale
+    return int(text, 0)
+
+
+def _parse_code(text: str, names: dict[str, int], what: str) -> int:
+    text = text.strip().lower()
+    if text in names:
+        return names[text]
+    try:
+        return int(text, 0)
+    except ValueError:
+        raise LayoutError(f"Unknown partition {what} '{text}'") from None
+
+
+def _align_up(value: int, alignment: int) -> int:
+    return (value + alignment - 1) // alignment * alignment
+
+
+def parse_layout_csv(text: str) -> list[PartitionEntry]:
+    """Partitions from an ESP-IDF style CSV (Name, Type, SubType, Offset, Size, Flags).
+
+    Empty offsets are packed after the previous partition (apps on 64KB boundaries,
+    data on 4KB), the way gen_esp32part.py does.
+    """
+    entries: list[PartitionEntry] = []
+    cursor = PARTITION_TABLE_OFFSET + PARTITION_TABLE_SIZE
+    lines = [line for line in text.splitlines() if line.strip()[:1] not in ("", "#")]
+    for row in csv.reader(io.StringIO("\n".join(lines)), skipinitialspace=True):
+        row = [cell.strip() for cell in row] + [""] * (6 - len(row))
+        label, ptype_text, subtype_text, offset_text, size_text, flags_text = row[:6]
+        ptype = _parse_code(ptype_text, PARTITION_TYPES, "type")
+        subtype = _parse_code(subtype_text, PARTITION_SUBTYPES.get(ptype, {}), "subtype")
+        alignment = APP_ALIGNMENT if ptype == PARTITION_TYPES["app"] else SECTOR_SIZE
+        offset = _parse_size(offset_text) if offset_text else _align_up(cursor, alignment)
+        if not size_text:
+            raise LayoutError(f"Partition '{label}' has no size")
+        flags = 0
+        for flag in filter(None, (f.strip() for f in flags_text.split(":"))):
+            flags |= _parse_code(flag, PARTITION_FLAGS, "flag")
+        entries.append(
+            PartitionEntry(
+                label=label,
+                type=ptype,
+                subtype=subtype,
+                offset=offset,
+                size=_parse_size(size_text),
+                flags=flags,
+            )
+        )
+        cursor = offset + entries[-1].size
+    return entries
+
+
+def validate_layout(entries: list[PartitionEntry], flash_size: int = DEFAULT_FLASH_SIZE) -> None:
+    table_end = PARTITION_TABLE_OFFSET + PARTITION_TABLE_SIZE
+    labels = [e.label for e in entries]
+    duplicates = sorted({label for label in labels if labels.count(label) > 1})
+    if duplicates:
+        raise LayoutError(f"Duplicate partition labels: {', '.join(duplicates)}")
+    previous: PartitionEntry | None = None
+    for entry in sorted(entries, key=lambda e: e.offset):
+        alignment = APP_ALIGNMENT if entry.type == PARTITION_TYPES["app"] else SECTOR_SIZE
+        if entry.offset % alignment or entry.size % SECTOR_SIZE:
+            raise LayoutError(f"Partition '{entry.label}' is not aligned to {hex(alignment)}")
+        if entry.offset < table_end:
+            raise LayoutError(f"Partition '{entry.label}' overlaps the partition table")
+        if entry.offset + entry.size > flash_size:
+            raise LayoutError(f"Partition '{entry.label}' ends past the {hex(flash_size)} flash")
+        if previous and entry.offset < previous.offset + previous.size:
+            raise LayoutError(f"Partitions '{previous.label}' and '{entry.label}' overlap")
+        previous = entry
+
+
+def encode_partition_table(entries: list[PartitionEntry]) -> bytes:
+    """Binary partition table as the bootloader reads it: entries, an MD5 entry, 0xFF padding."""
+    body = b"".join(
+        _ENTRY.pack(
+            _ENTRY_MAGIC,
+            e.type,
+            e.subtype,
+            e.offset,
+            e.size,
+            e.label.encode("ascii")[:16],
+            e.flags,
+        )
+        for e in entries
+    )
+    md5_entry = struct.pack("<H", _MD5_MAGIC) + b"\xFF" * 14 + hashlib.md5(body).digest()
+    table = body + md5_entry
+    if len(table) > PARTITION_TABLE_SIZE:
+        raise LayoutError(f"{len(entries)} partitions do not fit in the partition table")
+    return table + b"\xFF" * (PARTITION_TABLE_SIZE - len(table))
+
+
+def _extent(entry: PartitionEntry) -> Extent:
+    return Extent(entry.offset, entry.size)
+
+
+def _overlaps(a: Extent, b: Extent) -> bool:
+    return a.offset < b.end and b.offset < a.end
+
+
+@dataclass(frozen=True)
+class Relocation:
+    """What happens to one partition label between the current and target tables."""
+
+    label: str
+    action: str  # keep | resize | move | create | drop
+    source: Extent | None
+    target: Extent | None
+
+    @property
+    def copy_size(self) -> int:
+        if self.action != "move" or self.source is None or self.target is None:
+            return 0
+        return min(self.source.size, self.target.size)
+
+    @property
+    def fill(self) -> list[Extent]:
+        """Target space that holds none of this partition's old bytes and must end up blank."""
+        if self.target is None or self.action in ("keep", "drop"):
+            return []
+        if self.action == "move":
+            kept = Extent(self.target.offset, self.copy_size)
+        elif self.action == "resize" and self.source is not None:
+            kept = self.source
+        else:
+            return [self.target]
+        return subtract_extents([self.target], [kept])
+
+    def to_dict(self) -> dict:
+        return {
+            "label": self.label,
+            "action": self.action,
+            "source": self.source.to_dict() if self.source else None,
+            "target": self.target.to_dict() if self.target else None,
+            "copy_size": self.copy_size,
+            "fill": [e.to_dict() for e in self.fill],
+        }
+
+
+@dataclass
+class RepartitionPlan:
+    relocations: list[Relocation]
+    moves: list[Relocation]
+    backups: list[Relocation]
+    table: bytes
+    baud: int
+    warnings: list[str] = field(default_factory=list)
+    order_has_cycle: bool = False
+
+    @property
+    def fill(self) -> list[Extent]:
+        return [e for r in self.relocations for e in r.fill]
+
+    @property
+    def bytes_to_read(self) -> int:
+        return PARTITION_TABLE_SIZE + total_size([r.source for r in self.backups if r.source])
+
+    @property
+    def bytes_to_write(self) -> int:
+        return PARTITION_TABLE_SIZE + sum(r.copy_size for r in self.moves)
+
+    @property
+    def changed(self) -> bool:
+        return any(r.action != "keep" for r in self.relocations)
+
+    def to_dict(self) -> dict:
+        transfer = self.bytes_to_read + self.bytes_to_write
+        return {
+            "changed": self.changed,
+            "relocations": [r.to_dict() for r in self.relocations],
+            "move_order": [r.label for r in self.moves],
+            "order_has_cycle": self.order_has_cycle,
+            "backups": [r.label for r in self.backups],
+            "bytes_to_read": self.bytes_to_read,
+            "bytes_to_write": self.bytes_to_write,
+            "bytes_to_blank": total_size(self.fill),
+            "baud": self.baud,
+            "estimated_seconds": round(estimate_transfer_seconds(transfer, self.baud), 2),
+            "warnings": self.warnings,
+        }
+
+
+def _relocation(label: str, old: PartitionEntry | None, new: PartitionEntry | None) -> Relocation:
+    source = _extent(old) if old else None
+    target = _extent(new) if new else None
+    if source is None:
+        action = "create"
+    elif target is None:
+        action = "drop"
+    elif source == target:
+        action = "keep"
+    elif source.offset == target.offset:
+        action = "resize"
+    else:
+        action = "move"
+    return Relocation(label=label, action=action, source=source, target=target)
+
+
+def _safe_move_order(moves: list[Relocation]) -> tuple[list[Relocation], bool]:
+    """Order moves so no write lands on a source that has not been moved yet.
+
+    Like memmove across partitions: a move is ready once its target no longer overlaps
+    any pending source. A cycle is broken arbitrarily; the data comes from the backup.
+    """
+    pending = list(moves)
+    ordered: list[Relocation] = []
+    cycle = False
+    while pending:
+        ready = [
+            m
+            for m in pending
+            if not any(o is not m and _overlaps(m.target, o.source) for o in pending)
+        ]
+        if not ready:
+            cycle, ready = True, pending[:1]
+        ordered.append(ready[0])
+        pending.remove(ready[0])
+    return ordered, cycle
+
+
+def plan_repartition(
+    current: list[PartitionEntry],
+    target: list[PartitionEntry],
+    flash_size: int = DEFAULT_FLASH_SIZE,
+    baud: int = DEFAULT_TRANSFER_BAUD,
+) -> RepartitionPlan:
+    """Compare two partition tables and plan the minimal rewrite between them.
+
+    Partitions keep their bytes by label: a moved partition is copied (up to the smaller
+    size) to its new offset, grown or new space is blanked, and every partition whose old
+    bytes are overwritten or moved is backed up first. The partition table is written last.
+    """
+    validate_layout(target, flash_size)
+    old = {e.label: e for e in current}
+    new = {e.label: e for e in target}
+    labels = [e.label for e in target] + [e.label for e in current if e.label not in new]
+    relocations = [_relocation(label, old.get(label), new.get(label)) for label in labels]
+
+    moves, cycle = _safe_move_order([r for r in relocations if r.action == "move"])
+    written = [r.target for r in moves] + [e for r in relocations for e in r.fill]
+    shrinking = [r for r in relocations if r.source and r.target and r.target.size < r.source.size]
+    backups = [
+        r
+        for r in relocations
+        if r.source is not None
+        and (
+            r.action == "move"
+            or r in shrinking
+            or any(_overlaps(r.source, w) for w in written)
+        )
+    ]
+
+    warnings: list[str] = []
+    for r in relocations:
+        if r in shrinking:
+            warnings.append(f"'{r.label}' shrinks from {hex(r.source.size)}; its tail is dropped")
+        if r.action == "drop":
+            warnings.append(f"'{r.label}' is not in the target layout; only its backup keeps it")
+        grows = r.source and r.target and r.target.size > r.source.size
+        if grows and old[r.label].type == PARTITION_TYPES["data"]:
+            warnings.append(
+                f"'{r.label}' grows to {hex(r.target.size)}; its filesystem keeps its old size "
+                "until it is reformatted"
+            )
+        if r.label in new and r.label in old and old[r.label].type != new[r.label].type:
+            warnings.append(f"'{r.label}' changes partition type")
+    return RepartitionPlan(
+        relocations=relocations,
+        moves=moves,
+        backups=backups,
+        table=encode_partition_table(target),
+        baud=baud,
+        warnings=warnings,
+        order_has_cycle=cycle,
+    )
+
+
+def load_layout(layout_path: str | Path) -> list[PartitionEntry]:
+    """Target layout from a CSV file or a binary partition table (e.g. a backup-state dump)."""
+    path = Path(layout_path)
+    if path.suffix.lower() == ".csv":
+        return parse_layout_csv(path.read_text())
+    return parse_partition_table_bytes(path.read_bytes())
+
+
+def _blank_regions(session: FlashSession, regions: list[Extent]) -> int:
+    """Erase the parts of `regions` that do not already read as blank; returns bytes erased."""
+    to_erase = subtract_extents(regions, session.blank_extents(regions))
+    for extent in to_erase:
+        session.erase(extent.offset, extent.size)
+    return total_size(to_erase)
+
+
+def _apply_plan(
+    session: FlashSession,
+    plan: RepartitionPlan,
+    out_dir: Path,
+    progress: ProgressCallback | None,
+) -> dict:
+    ts = datetime.now().strftime("%Y%m%d-%H%M%S")
+    backups: dict[str, Path] = {}
+    table_path = out_dir / f"codee-partitions-{ts}.bin"
+    with session.stage("backup") as timing:
+        read_flash_resumable(session, PARTITION_TABLE_OFFSET, PARTITION_TABLE_SIZE, table_path)
+        for r in plan.backups:
+            path = out_dir / f"codee-{r.label}-{ts}.bin"
+            read_flash_resumable(session, r.source.offset, r.source.size, path)
+            backups[r.label] = path
+        timing.bytes = plan.bytes_to_read
+
+    tracker = tracker_for("relocate", progress)
+    total = sum(r.copy_size for r in plan.moves)
+    with session.stage("relocate") as timing:
+        for r in plan.moves:
+            data = backups[r.label].read_bytes()[: r.copy_size]
+            region = Extent(r.target.offset, r.copy_size)
+            # Moved partitions are often mostly erased, so blank sectors are not rewritten.
+            candidates = blank_target_sectors(data, [region], base=region.offset)
+            device_blank = session.blank_extents(candidates)
+            writes = plan_blank_aware(data, [region], device_blank, base=region.offset)
+            for extent in writes.erase:
+                session.erase(extent.offset, extent.size)
+            for extent in writes.write:
+                session.write(
+                    extent.offset,
+                    data[extent.offset - region.offset : extent.end - region.offset],
+                    region_progress(tracker, timing.bytes, extent.size, total),
+                )
+                timing.bytes += extent.size
+
+    with session.stage("blank") as timing:
+        timing.bytes = _blank_regions(session, plan.fill)
+
+    with session.stage("write_table") as timing:
+        session.write(PARTITION_TABLE_OFFSET, plan.table)
+        timing.bytes = PARTITION_TABLE_SIZE
+
+    with session.stage("verify"):
+        expected = {
+            r.label: hashlib.md5(backups[r.label].read_bytes()[: r.copy_size]).hexdigest()
+            for r in plan.moves
+        }
+        failed = [
+            r.label
+            for r in plan.moves
+            if session.md5(r.target.offset, r.copy_size) != expected[r.label]
+        ]
+        table_md5 = session.md5(PARTITION_TABLE_OFFSET, PARTITION_TABLE_SIZE)
+        if table_md5 != hashlib.md5(plan.table).hexdigest():
+            failed.append("partition_table")
+    if failed:
+        raise RuntimeError(f"Relocated data does not match its backup: {', '.join(failed)}")
+    return {
+        "partition_table_backup": str(table_path),
+        "backups": {label: str(path) for label, path in backups.items()},
+    }
+
+
+def repartition_device(
+    port: str,
+    layout_path: str | Path,
+    out_dir: str | Path = "backups/repartition",
+    flash_size: int = DEFAULT_FLASH_SIZE,
+    baud: int | None = None,
+    dry_run: bool = True,
+    on_plan: Callable[[dict], None] | None = None,
+    progress: ProgressCallback | None = None,
+) -> dict:
+    """Move the device to a new partition layout, rewriting only partitions that change.
+
+    The current table is read from the device and compared with `layout_path`.
+    `on_plan` receives the relocation plan, including a transfer estimate at the
+    session baud, before anything is written; `dry_run` (the default) stops there.
+    Affected partitions and the old table are backed up into `out_dir` first.
+    """
+    try:
+        target = load_layout(layout_path)
+    except (OSError, ValueError) as exc:
+        return {"ok": False, "error": str(exc)}
+    baud = resolve_baud(port, baud, DEFAULT_TRANSFER_BAUD)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    plan: RepartitionPlan | None = None
+    applied: dict = {}
+    try:
+        with open_flash_session(port=port, baud=baud) as session:
+            with session.stage("read_partition_table"):
+                current = parse_partition_table_bytes(
+                    session.read(PARTITION_TABLE_OFFSET, PARTITION_TABLE_SIZE)
+                )
+            plan = plan_repartition(current, target, flash_size=flash_size, baud=baud)
+            if on_plan is not None:
+                on_plan(plan.to_dict())
+            if not dry_run and plan.changed:
+                applied = _apply_plan(session, plan, out_dir, progress)
+    except Exception as exc:  # noqa: BLE001 - esptool/serial failures are reported, not raised
+        return {
+            "ok": False,
+            "error": str(exc),
+            "plan": plan.to_dict() if plan else None,
+        }
+    return {
+        "ok": True,
+        "dry_run": dry_run,
+        "plan": plan.to_dict(),
+        **applied,
+        "timings": session.timings_report(),
+    }
+
+
+def plan_repartition_offline(
+    current_table_path: str | Path,
+    layout_path: str | Path,
+    flash_size: int = DEFAULT_FLASH_SIZE,
+    baud: int | None = None,
+) -> dict:
+    """Relocation plan from a saved table (e.g. codee-partitions-*.bin), no device needed."""
+    try:
+        current = parse_partition_table(current_table_path)
+        plan = plan_repartition(
+            current,
+            load_layout(layout_path),
+            flash_size=flash_size,
+            baud=baud or DEFAULT_TRANSFER_BAUD,
+        )
+    except (OSError, ValueError) as exc:
+        return {"ok": False, "error": str(exc)}
+    return {"ok": True, "plan": plan.to_dict()}
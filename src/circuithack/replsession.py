@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator
+
+from mpremote.transport import TransportError, TransportExecError
+from mpremote.transport_serial import SerialTransport
+from serial import SerialException
+
+from .util import CommandResult, register_port_releaser
+
+REPL_BAUD = 115200
+COPY_CHUNK_SIZE = 1024
+
+
+@dataclass
+class ReplSession:
+    """One open serial port held in raw REPL mode, reused across runs, copies and evals."""
+
+    port: str
+    transport: SerialTransport
+    opened_at: float = field(default_factory=time.monotonic)
+    operations: int = 0
+    soft_resets: int = 0
+
+    def ensure_raw_repl(self, soft_reset: bool = False) -> None:
+        """Enter the raw REPL if needed, soft-resetting on the session's first entry.
+
+        Like mpremote, the first entry starts from a clean interpreter; later calls
+        keep sys.modules and globals unless `soft_reset` asks for a fresh one.
+        """
+        first = self.soft_resets == 0
+        if soft_reset or first or not self.transport.in_raw_repl:
+            self.transport.enter_raw_repl(soft_reset=soft_reset or first)
+            if soft_reset or first:
+                self.soft_resets += 1
+
+    def exec(
+        self,
+        code: str | bytes,
+        timeout: float = 300,
+        soft_reset: bool = False,
+    ) -> tuple[str, str]:
+        """Run code in the raw REPL and return (stdout, traceback text)."""
+        self.ensure_raw_repl(soft_reset=soft_reset)
+        self.operations += 1
+        out, err = self.transport.exec_raw(code, timeout=timeout)
+        return out.decode("utf-8", errors="replace"), err.decode("utf-8", errors="replace")
+
+    def eval(self, expression: str) -> object:
+        self.ensure_raw_repl()
+        self.operations += 1
+        return self.transport.eval(expression)
+
+    def write_file(self, remote_path: str, data: bytes) -> None:
+        self.ensure_raw_repl()
+        self.operations += 1
+        self.transport.fs_writefile(remote_path, data, chunk_size=COPY_CHUNK_SIZE)
+
+    def soft_reset(self) -> None:
+        """Leave raw REPL and soft-reset from the friendly REPL so main.py runs."""
+        self.ensure_raw_repl()
+        self.operations += 1
+        self.transport.exit_raw_repl()
+        self.transport.serial.write(b"\x04")
+
+    def close(self) -> None:
+        try:
+            if self.transport.in_raw_repl:
+                self.transport.exit_raw_repl()
+        except (TransportError, SerialException, OSError):
+            pass
+        finally:
+            self.transport.close()
+
+    def to_dict(self) -> dict:
+        return {
+            "port": self.port,
+            "operations": self.operations,
+            "soft_resets": self.soft_resets,
+            "open_seconds": round(time.monotonic() - self.opened_at, 3),
+        }
+
+
+class ReplPool:
+    """Open raw-REPL sessions keyed by port, each guarded by its own lock.
+
+    A session stays open between calls, so the serial open and raw-REPL entry are
+    paid once per port rather than once per operation. A transport error closes the
+    session; the next call reconnects.
+    """
+
+    def __init__(self, baud: int = REPL_BAUD) -> None:
+        self.baud = baud
+        self._sessions: dict[str, ReplSession] = {}
+        self._locks: dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, port: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(port, threading.Lock())
+
+    def _open(self, port: str) -> ReplSession:
+        return ReplSession(port=port, transport=SerialTransport(port, baudrate=self.baud))
+
+    @contextmanager
+    def session(self, port: str) -> Iterator[ReplSession]:
+        with self._lock_for(port):
+            session = self._sessions.get(port)
+            if session is None:
+                session = self._sessions[port] = self._open(port)
+            try:
+                yield session
+            except TransportExecError:
+                raise  # the code failed on the device; the connection is fine
+            except (TransportError, SerialException, OSError):
+                self._sessions.pop(port, None)
+                session.close()
+                raise
+
+    def release(self, port: str) -> bool:
+        """Close the session on `port` (e.g. before esptool takes the port over)."""
+        with self._lock_for(port):
+            session = self._sessions.pop(port, None)
+            if session is None:
+                return False
+            session.close()
+            return True
+
+    def close_all(self) -> None:
+        for port in list(self._sessions):
+            self.release(port)
+
+    def sessions(self) -> list[dict]:
+        return [s.to_dict() for s in self._sessions.values()]
+
+
+_pool = ReplPool()
+atexit.register(_pool.close_all)
+register_port_releaser(lambda port: _pool.release(port))
+
+
+def repl_pool() -> ReplPool:
+    return _pool
+
+
+def release_repl_session(port: str) -> bool:
+    return _pool.release(port)
+
+
+def _result(cmd: list[str], stdout: str = "", stderr: str = "") -> CommandResult:
+    return CommandResult(cmd=cmd, returncode=1 if stderr else 0, stdout=stdout, stderr=stderr)
+
+
+def repl_exec(
+    port: str,
+    code: str | bytes,
+    cmd: list[str],
+    timeout: float = 300,
+    soft_reset: bool = False,
+) -> CommandResult:
+    """Run code on the pooled session for `port`; transport failures become a failed result."""
+    try:
+        with _pool.session(port) as session:
+            stdout, stderr = session.exec(code, timeout=timeout, soft_reset=soft_reset)
+    except (TransportError, SerialException, OSError) as exc:
+        return _result(cmd, stderr=str(exc))
+    return _result(cmd, stdout, stderr)
+
+
+def repl_copy_file(port: str, local_path: str | Path, remote_path: str) -> CommandResult:
+    cmd = ["repl", port, "cp", str(local_path), f":{remote_path}"]
+    try:
+        data = Path(local_path).read_bytes()
+        with _pool.session(port) as session:
+            session.write_file(remote_path, data)
+    except (TransportError, SerialException, OSError) as exc:
+        return _result(cmd, stderr=str(exc))
+    return _result(cmd)
+
+
+def repl_eval(port: str, expression: str) -> dict:
+    """Evaluate an expression on the device; the value must be a Python literal."""
+    try:
+        with _pool.session(port) as session:
+            value = session.eval(expression)
+    except (TransportError, SerialException, OSError, ValueError, SyntaxError) as exc:
+        return {"ok": False, "port": port, "expression": expression, "error": str(exc)}
+    return {"ok": True, "port": port, "expression": expression, "value": value}
@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+from .flashmap import split_blocks
+from .flashsession import FlashSession
+
+DEFAULT_CHUNK_SIZE = 0x40000
+CHECKPOINT_SUFFIX = ".ckpt.json"
+
+
+@dataclass
+class ReadProgress:
+    chunks_done: int
+    chunks_total: int
+    bytes_done: int
+    bytes_total: int
+    resumed_chunks: int = 0
+    bytes_transferred: int = 0
+    seconds: float = 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        # Throughput counts only bytes that crossed the wire in this run.
+        return self.bytes_transferred / self.seconds if self.seconds > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "chunks_done": self.chunks_done,
+            "chunks_total": self.chunks_total,
+            "bytes_done": self.bytes_done,
+            "bytes_total": self.bytes_total,
+            "resumed_chunks": self.resumed_chunks,
+            "seconds": round(self.seconds, 3),
+            "bytes_per_second": round(self.bytes_per_second),
+        }
+
+
+class ResumableReadError(RuntimeError):
+    """A chunked read stopped early; `progress` says how far it got."""
+
+    def __init__(self, message: str, progress: ReadProgress) -> None:
+        super().__init__(message)
+        self.progress = progress
+
+
+def checkpoint_path(out_path: str | Path) -> Path:
+    out_path = Path(out_path)
+    return out_path.with_name(out_path.name + CHECKPOINT_SUFFIX)
+
+
+def find_resumable_read(
+    out_dir: str | Path,
+    pattern: str,
+    offset: int,
+    size: int,
+    device: str,
+) -> Path | None:
+    """Newest unfinished output in out_dir from `device` covering the same flash range."""
+    for ckpt in sorted(Path(out_dir).glob(pattern + CHECKPOINT_SUFFIX), reverse=True):
+        state = json.loads(ckpt.read_text(encoding="utf-8"))
+        if (state.get("offset"), state.get("size"), state.get("device")) == (offset, size, device):
+            return ckpt.with_name(ckpt.name[: -len(CHECKPOINT_SUFFIX)])
+    return None
+
+
+def _load_verified_chunks(
+    out_path: Path,
+    offset: int,
+    size: int,
+    chunk_size: int,
+    device: str,
+) -> dict[int, str]:
+    """Chunk index -> md5 for checkpointed chunks whose bytes on disk still match."""
+    ckpt = checkpoint_path(out_path)
+    if not ckpt.exists() or not out_path.exists():
+        return {}
+    state = json.loads(ckpt.read_text(encoding="utf-8"))
+    if state.get("device") != device:
+        raise ValueError(
+            f"{out_path.name} is a partial read from device {state.get('device') or 'unknown'}, "
+            f"not {device}; delete {ckpt.name} to start over"
+        )
+    geometry = (state.get("offset"), state.get("size"), state.get("chunk_size"))
+    if geometry != (offset, size, chunk_size):
+        return {}
+    verified: dict[int, str] = {}
+    with out_path.open("rb") as f:
+        for index, digest in state.get("chunks", {}).items():
+            f.seek(int(index) * chunk_size)
+            if hashlib.md5(f.read(chunk_size)).hexdigest() == digest:
+                verified[int(index)] = digest
+    return verified
+
+
+def _save_checkpoint(
+    out_path: Path,
+    offset: int,
+    size: int,
+    chunk_size: int,
+    chunks: dict[int, str],
+    device: str,
+) -> None:
+    ckpt = checkpoint_path(out_path)
+    tmp = ckpt.with_name(ckpt.name + ".tmp")
+    state = {
+        "device": device,
+        "offset": offset,
+        "size": size,
+        "chunk_size": chunk_size,
+        "chunks": {str(i): digest for i, digest in sorted(chunks.items())},
+    }
+    tmp.write_text(json.dumps(state), encoding="utf-8")
+    os.replace(tmp, ckpt)
+
+
+def read_flash_resumable(
+    session: FlashSession,
+    offset: int,
+    size: int,
+    out_path: str | Path,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    on_progress: Callable[[ReadProgress], None] | None = None,
+) -> ReadProgress:
+    """Read a flash range chunk by chunk, checkpointing each verified chunk.
+
+    esptool's stub read already checks an MD5 digest per transfer; the checkpoint
+    records the device MAC and each chunk's MD5. A rerun only resumes on the same
+    device, and keeps a chunk only if the bytes on disk and the device's flash
+    (hashed by the stub) both still match it. Everything else is read again. The
+    checkpoint is removed once the whole range is on disk; on failure it stays and
+    ResumableReadError carries the partial progress.
+    """
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    chunks = split_blocks(offset, size, chunk_size)
+    device = session.mac()
+    try:
+        on_disk = _load_verified_chunks(out_path, offset, size, chunk_size, device)
+    except ValueError as exc:
+        raise ResumableReadError(str(exc), ReadProgress(0, len(chunks), 0, size)) from exc
+    done = {
+        index: digest
+        for index, digest in on_disk.items()
+        if session.md5(chunks[index].offset, chunks[index].size) == digest
+    }
+    progress = ReadProgress(
+        chunks_done=len(done),
+        chunks_total=len(chunks),
+        bytes_done=sum(chunks[i].size for i in done),
+        bytes_total=size,
+        resumed_chunks=len(done),
+    )
+    if not out_path.exists() or not done:
+        out_path.write_bytes(b"")
+    if on_progress is not None:
+        # Report the resumed starting point so rate and ETA only count new transfers.
+        on_progress(progress)
+    start = time.monotonic()
+    with out_path.open("r+b") as f:
+        for index, chunk in enumerate(chunks):
+            if index in done:
+                continue
+            try:
+                data = session.read(chunk.offset, chunk.size)
+            except Exception as exc:
+                progress.seconds = time.monotonic() - start
+                raise ResumableReadError(
+                    f"Read failed at {hex(chunk.offset)}: {exc}", progress
+                ) from exc
+            f.seek(chunk.offset - offset)
+            f.write(data)
+            f.flush()
+            done[index] = hashlib.md5(data).hexdigest()
+            _save_checkpoint(out_path, offset, size, chunk_size, done, device)
+            progress.chunks_done += 1
+            progress.bytes_done += chunk.size
+            progress.bytes_transferred += chunk.size
+            progress.seconds = time.monotonic() - start
+            if on_progress is not None:
+                on_progress(progress)
+        f.truncate(size)
+    progress.seconds = time.monotonic() - start
+    checkpoint_path(out_path).unlink(missing_ok=True)
+    return progress
@@ -0,0 +1,327 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from .backupstore import DEFAULT_STORE_DIR, load_snapshots, remove_snapshots, sector_files
+from .flashmap import block_md5s
+from .inventory import backup_owners
+from .resumable import CHECKPOINT_SUFFIX
+from .sparseimage import SPARSE_SUFFIX, is_sparse_image, load_flash_image, read_sparse_image
+
+DEFAULT_BACKUP_ROOT = "backups"
+AUDIT_SECTOR_BATCH = 1024
+_BACKUP_FILE = re.compile(
+    r"^codee-(?P<label>[A-Za-z0-9_]+)-(?P<ts>\d{8}-\d{6})(?P<suffix>\.bin|\.sparse)$"
+)
+# Repartition safety copies and extraction output are not retention-managed backups.
+EXCLUDED_DIRS = frozenset({"repartition", "extracted"})
+FLEET_DIR = "fleet"  # fleet/pipeline back up into <FLEET_DIR>/<usb-serial>/
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """Grandfather-father-son retention: newest N, plus the newest per day/week in a window."""
+
+    keep_last: int = 0
+    keep_daily: int = 0
+    keep_weekly: int = 0
+
+    def __post_init__(self) -> None:
+        if min(self.keep_last, self.keep_daily, self.keep_weekly) < 0:
+            raise ValueError("Retention counts must not be negative")
+        if not (self.keep_last or self.keep_daily or self.keep_weekly):
+            raise ValueError("A retention policy must keep something (keep_last, daily or weekly)")
+
+    def to_dict(self) -> dict:
+        return {
+            "keep_last": self.keep_last,
+            "keep_daily": self.keep_daily,
+            "keep_weekly": self.keep_weekly,
+        }
+
+
+def select_retained(created: list[datetime], policy: RetentionPolicy, now: datetime) -> set[int]:
+    """Indices into `created` that the policy keeps; everything else has expired."""
+    newest_first = sorted(range(len(created)), key=lambda i: created[i], reverse=True)
+    keep = set(newest_first[: policy.keep_last])
+
+    first_day = now.date() - timedelta(days=policy.keep_daily - 1)
+    first_week = now.date() - timedelta(days=now.weekday(), weeks=policy.keep_weekly - 1)
+    days: set = set()
+    weeks: set = set()
+    for i in newest_first:
+        day = created[i].date()
+        if policy.keep_daily and day >= first_day and day not in days:
+            days.add(day)
+            keep.add(i)
+        week = day.isocalendar()[:2]
+        if policy.keep_weekly and day >= first_week and week not in weeks:
+            weeks.add(week)
+            keep.add(i)
+    return keep
+
+
+@dataclass
+class BackupSet:
+    """One backup image plus the sidecar files that live and die with it."""
+
+    image: Path
+    device: str | None  # USB serial; None when no manifest, inventory or fleet dir says
+    label: str
+    created: datetime
+    files: list[Path] = field(default_factory=list)
+
+    @property
+    def size(self) -> int:
+        return sum(p.stat().st_size for p in self.files if p.exists())
+
+    @property
+    def manifest(self) -> Path | None:
+        path = self.image.with_suffix(".json")
+        return path if path.exists() else None
+
+    @property
+    def in_progress(self) -> bool:
+        return any(p.name.endswith(CHECKPOINT_SUFFIX) for p in self.files)
+
+
+def _manifest_serial(manifest: Path) -> str | None:
+    try:
+        return json.loads(manifest.read_text(encoding="utf-8")).get("usb_serial")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _device_for(backup: BackupSet, root: Path, owners: dict[str, str]) -> str | None:
+    """USB serial from the block manifest, else the inventory, else a fleet/<serial>/ directory."""
+    serial = _manifest_serial(backup.manifest) if backup.manifest else None
+    serial = serial or owners.get(str(backup.image.resolve()))
+    if serial:
+        return serial
+    # Any folder other than fleet/<usb-serial>/ is the user's; its name is not a device.
+    parent = backup.image.parent
+    return parent.name if parent != root and parent.parent.name == FLEET_DIR else None
+
+
+def scan_backups(root: str | Path, exclude: list[Path] | None = None) -> list[BackupSet]:
+    """Every codee-<label>-<timestamp> image below root with its manifest and checkpoint.
+
+    Directories named in EXCLUDED_DIRS and those in `exclude` are not scanned.
+    """
+    root = Path(root)
+    skip = {p.resolve() for p in exclude or []}
+    owners = backup_owners()
+    sets: list[BackupSet] = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        here = Path(dirpath)
+        dirnames[:] = [
+            d
+            for d in dirnames
+            if d not in EXCLUDED_DIRS and (here / d).resolve() not in skip
+        ]
+        names = set(filenames)
+        for name in filenames:
+            match = _BACKUP_FILE.match(name)
+            if not match:
+                continue
+            image = here / name
+            files = [image]
+            stem = name[: -len(match.group("suffix"))]
+            # A sparse backup keeps the manifest written for its raw .bin under the same stem.
+            for extra in (f"{stem}.json", name + CHECKPOINT_SUFFIX):
+                if extra in names:
+                    files.append(here / extra)
+            backup = BackupSet(
+                image=image,
+                device=None,
+                label=match.group("label"),
+                created=datetime.strptime(match.group("ts"), "%Y%m%d-%H%M%S"),
+                files=files,
+            )
+            backup.device = _device_for(backup, root, owners)
+            sets.append(backup)
+    return sets
+
+
+def _expired_sets(sets: list[BackupSet], policy: RetentionPolicy, now: datetime) -> list[BackupSet]:
+    groups: dict[tuple[str, str], list[BackupSet]] = {}
+    for backup in sets:
+        # A backup that cannot be tied to a device might be some unit's only copy.
+        if backup.device is not None:
+            groups.setdefault((backup.device, backup.label), []).append(backup)
+    expired: list[BackupSet] = []
+    for members in groups.values():
+        kept = select_retained([m.created for m in members], policy, now)
+        # Unfinished reads are resumable and are never pruned.
+        expired.extend(m for i, m in enumerate(members) if i not in kept and not m.in_progress)
+    return expired
+
+
+def _expired_snapshot_ids(store_dir: Path, policy: RetentionPolicy, now: datetime) -> set[str]:
+    groups: dict[tuple[str, str], list[dict]] = {}
+    for snapshot in load_snapshots(store_dir):
+        groups.setdefault((snapshot["device"], snapshot["label"]), []).append(snapshot)
+    expired: set[str] = set()
+    for members in groups.values():
+        kept = select_retained([datetime.fromisoformat(m["created"]) for m in members], policy, now)
+        expired.update(m["id"] for i, m in enumerate(members) if i not in kept)
+    return expired
+
+
+def apply_retention(
+    root: str | Path = DEFAULT_BACKUP_ROOT,
+    policy: RetentionPolicy = RetentionPolicy(keep_last=7),
+    store_dir: str | Path | None = DEFAULT_STORE_DIR,
+    dry_run: bool = True,
+    now: datetime | None = None,
+) -> dict:
+    """Prune timestamped backups per device serial and label, and store snapshots per device.
+
+    Only reports what would go unless `dry_run=False`. Each expired image is removed
+    with its block manifest. Unfinished (checkpointed) reads and backups whose device
+    is unknown are kept. The result reports reclaimed bytes overall and per device.
+    """
+    root = Path(root)
+    now = now or datetime.now()
+    store = Path(store_dir) if store_dir else None
+    sets = scan_backups(root, exclude=[store] if store else None)
+    expired = _expired_sets(sets, policy, now)
+
+    per_device: dict[str, int] = {}
+    removed: list[str] = []
+    reclaimed = 0
+    for backup in expired:
+        size = backup.size
+        reclaimed += size
+        per_device[backup.device] = per_device.get(backup.device, 0) + size
+        removed.extend(str(p) for p in backup.files)
+        if not dry_run:
+            for path in backup.files:
+                path.unlink(missing_ok=True)
+
+    store_result = None
+    if store is not None and store.exists():
+        store_result = remove_snapshots(
+            store,
+            _expired_snapshot_ids(store, policy, now),
+            dry_run=dry_run,
+        )
+        reclaimed += store_result["reclaimed_bytes"]
+    return {
+        "ok": True,
+        "dry_run": dry_run,
+        "root": str(root),
+        "policy": policy.to_dict(),
+        "backups_total": len(sets),
+        "backups_removed": len(expired),
+        "kept_in_progress": sum(1 for s in sets if s.in_progress),
+        "kept_unidentified": sum(1 for s in sets if s.device is None),
+        "removed_files": removed,
+        "reclaimed_bytes": reclaimed,
+        "reclaimed_bytes_by_device": per_device,
+        "store": store_result,
+    }
+
+
+def _audit_image(image: str, manifest: str | None) -> dict:
+    """Worker: re-hash one backup image against its block manifest (or its sparse extent MD5s)."""
+    result: dict = {"path": image, "ok": True}
+    try:
+        if manifest is None:
+            read_sparse_image(image).to_bytes()  # every extent checks its own MD5
+            return {**result, "checked": "sparse_extents"}
+        state = json.loads(Path(manifest).read_text(encoding="utf-8"))
+        data = load_flash_image(image)
+        if len(data) != state["flash_size"]:
+            return {**result, "ok": False, "error": f"size {len(data)} != {state['flash_size']}"}
+        actual = block_md5s(data, state["block_size"])
+        bad = [i for i, (a, b) in enumerate(zip(actual, state["block_md5"])) if a != b]
+        if bad:
+            return {**result, "ok": False, "error": "block MD5 mismatch", "bad_blocks": bad}
+        return {**result, "checked": "manifest"}
+    except Exception as exc:  # noqa: BLE001 - a damaged file is an audit finding, not a crash
+        return {**result, "ok": False, "error": str(exc)}
+
+
+def _audit_sectors(paths: list[str]) -> list[str]:
+    """Worker: sector files whose decompressed bytes no longer hash to their name."""
+    bad: list[str] = []
+    for path in paths:
+        try:
+            data = zlib.decompress(Path(path).read_bytes())
+        except (OSError, zlib.error):
+            bad.append(path)
+            continue
+        if hashlib.sha256(data).hexdigest() != Path(path).name:
+            bad.append(path)
+    return bad
+
+
+def audit_backups(
+    root: str | Path = DEFAULT_BACKUP_ROOT,
+    store_dir: str | Path | None = DEFAULT_STORE_DIR,
+    workers: int | None = None,
+) -> dict:
+    """Re-hash stored backups on a process pool.
+
+    Full-flash images are checked against their per-block MD5 manifests, sparse
+    containers against their extent MD5s, and store sectors against the SHA-256 in
+    their names (in batches, so tens of thousands of sectors cost a few hundred
+    tasks). Snapshot manifests that reference missing sectors are reported too.
+    Partition dumps without a manifest are counted as unverified.
+    """
+    root = Path(root)
+    store = Path(store_dir) if store_dir else None
+    sets = scan_backups(root, exclude=[store] if store else None)
+    images = [
+        (str(s.image), str(s.manifest) if s.manifest else None)
+        for s in sets
+        if not s.in_progress and (s.manifest or s.image.suffix == SPARSE_SUFFIX)
+    ]
+    unverified = [
+        str(s.image)
+        for s in sets
+        if not s.in_progress and not s.manifest and not is_sparse_image(s.image)
+    ]
+    sectors = [str(p) for p in sector_files(store)] if store and store.exists() else []
+    batches = [
+        sectors[i : i + AUDIT_SECTOR_BATCH] for i in range(0, len(sectors), AUDIT_SECTOR_BATCH)
+    ]
+
+    image_results: list[dict] = []
+    bad_sectors: list[str] = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_audit_image, image, manifest) for image, manifest in images]
+        sector_futures = [pool.submit(_audit_sectors, batch) for batch in batches]
+        for future in as_completed(futures):
+            image_results.append(future.result())
+        for future in as_completed(sector_futures):
+            bad_sectors.extend(future.result())
+
+    missing: dict[str, int] = {}
+    if store and store.exists():
+        present = {Path(p).name for p in sectors}
+        for snapshot in load_snapshots(store):
+            gone = sum(1 for digest in snapshot["sectors"] if digest not in present)
+            if gone:
+                missing[snapshot["id"]] = gone
+    failed = sorted((r for r in image_results if not r["ok"]), key=lambda r: r["path"])
+    return {
+        "ok": not failed and not bad_sectors and not missing,
+        "root": str(root),
+        "images_checked": len(image_results),
+        "images_failed": failed,
+        "images_unverified": len(unverified),
+        "in_progress": sum(1 for s in sets if s.in_progress),
+        "sectors_checked": len(sectors),
+        "sectors_bad": sorted(bad_sectors),
+        "snapshots_missing_sectors": missing,
+    }
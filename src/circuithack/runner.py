@@ -1,73 +1,68 @@
 from __future__ import annotations
 
-import shutil
-import time
 from pathlib import Path
 
 import serial
-
-from .util import CommandResult, run_cmd
-
-
-def mpremote_executable() -> list[str]:
-    if shutil.which("mpremote"):
-        return ["mpremote"]
-    return ["python3", "-m", "mpremote"]
-
-
-def run_script(port: str, script_path: str | Path) -> CommandResult:
-    script_path = str(Path(script_path))
-    cmd = [*mpremote_executable(), "connect", port, "run", script_path]
-    return run_cmd(cmd, timeout=300)
+from mpremote.transport import TransportError
+from serial import SerialException
+
+from .pastemode import PASTE_TIMEOUT, PasteTransport
+from .replsession import (
+    release_repl_session,
+    repl_copy_file,
+    repl_eval,
+    repl_exec,
+    repl_pool,
+)
+from .util import CommandResult
+
+
+def run_script(port: str, script_path: str | Path, soft_reset: bool = True) -> CommandResult:
+    """Run a local script over the pooled raw-REPL session for `port`.
+
+    By default the device soft-resets first, so each run starts from a clean
+    interpreter as `mpremote run` does; `soft_reset=False` keeps modules and globals
+    from earlier runs.
+    """
+    script_path = Path(script_path)
+    cmd = ["repl", port, "run", str(script_path)]
+    return repl_exec(port, script_path.read_bytes(), cmd=cmd, timeout=300, soft_reset=soft_reset)
 
 
 def run_script_paste_mode(
     port: str,
     script_path: str | Path,
     baud: int = 115200,
-    read_timeout: int = 3,
+    read_timeout: float = PASTE_TIMEOUT,
+    sentinel: str | None = None,
 ) -> CommandResult:
+    """Copy to main.py and soft-reset, or paste the script when the raw REPL fails.
+
+    In paste mode stdout and the traceback come back separately (as stdout and
+    stderr). Reading ends at the REPL prompt or at `sentinel` if the script prints
+    it; a script still running after `read_timeout` seconds is reported as failed,
+    with the output so far.
+    """
     script_path = Path(script_path)
     cmd = ["paste", port, str(script_path)]
     payload = script_path.read_text(encoding="utf-8").replace("\r\n", "\n").replace("\r", "\n")
 
-    # Try mpremote fs cp first (works even when raw REPL is blocked)
+    # Try copying to :main.py over the pooled session first, then soft-reset to run it
+    fs_cmd = ["repl", port, "cp", str(script_path), ":main.py"]
     try:
-        fs_cmd = [*mpremote_executable(), "connect", port, "fs", "cp", str(script_path), ":main.py"]
-        res = run_cmd(fs_cmd, timeout=30)
-        if res.ok:
-            # Soft reset to run :main.py
-            run_cmd([*mpremote_executable(), "connect", port, "soft-reset"], timeout=10)
-            return CommandResult(cmd=fs_cmd, returncode=0, stdout=res.stdout, stderr=res.stderr)
-    except Exception:
+        with repl_pool().session(port) as session:
+            session.write_file("main.py", payload.encode("utf-8"))
+            session.soft_reset()
+        return CommandResult(cmd=fs_cmd, returncode=0, stdout="", stderr="")
+    except (TransportError, SerialException, OSError):
         pass  # fall back to paste mode
 
-    # Paste mode fallback
+    # Paste mode fallback, on its own connection
+    release_repl_session(port)
     try:
-        ser = serial.serial_for_url(port, baudrate=baud, timeout=1)
+        ser = serial.serial_for_url(port, baudrate=baud, timeout=0.1)
         try:
-            ser.reset_input_buffer()
-            ser.write(b"\x05")  # Ctrl-E paste mode
-            for line in payload.split("\n"):
-                # trim overly long lines to reduce echo wrapping in REPL
-                chunks = [line[i : i + 120] for i in range(0, len(line), 120)] or [""]
-                for chunk in chunks:
-                    ser.write(chunk.encode("utf-8") + b"\n")
-            ser.write(b"\x04")  # Ctrl-D to execute
-
-            start = time.time()
-            output = b""
-            while time.time() - start < read_timeout:
-                chunk = ser.read(400)
-                if chunk:
-                    output += chunk
-
-            return CommandResult(
-                cmd=cmd,
-                returncode=0,
-                stdout=output.decode("utf-8", errors="replace"),
-                stderr="",
-            )
+            res = PasteTransport(ser).paste(payload, timeout=read_timeout, sentinel=sentinel)
         finally:
             ser.close()
     except Exception as exc:  # pragma: no cover - transport errors are environment-specific
@@ -77,10 +72,47 @@ def run_script_paste_mode(
             stdout="",
             stderr=str(exc),
         )
+    return CommandResult(
+        cmd=cmd,
+        returncode=0 if res.ok else 1,
+        stdout=res.stdout,
+        stderr=res.error,
+    )
 
 
 def copy_file(port: str, local_path: str | Path, remote_path: str) -> CommandResult:
-    local_path = str(Path(local_path))
-    cmd = [*mpremote_executable(), "connect", port, "cp", local_path, f":{remote_path}"]
-    return run_cmd(cmd, timeout=300)
-
+    return repl_copy_file(port, local_path, remote_path)
+
+
+REPL_OPS = ("run", "cp", "eval")
+
+
+def run_repl_ops(port: str, ops: list[tuple[str, str]], soft_reset: bool = True) -> dict:
+    """Run ("run", script), ("cp", "local:remote") and ("eval", expr) steps in order.
+
+    All steps share the pooled raw-REPL session for `port`, so a batch costs one
+    connection. Each run starts with a soft reset unless `soft_reset` is False. The
+    batch stops at the first failed step.
+    """
+    results: list[dict] = []
+    for kind, arg in ops:
+        if kind == "run":
+            res = run_script(port, arg, soft_reset=soft_reset)
+            step = {"ok": res.ok, "stdout": res.stdout, "stderr": res.stderr}
+        elif kind == "cp":
+            local, _, remote = arg.partition(":")
+            res = copy_file(port, local, remote or Path(local).name)
+            step = {"ok": res.ok, "stderr": res.stderr}
+        elif kind == "eval":
+            step = repl_eval(port, arg)
+        else:
+            raise ValueError(f"Unknown REPL step '{kind}', expected one of {REPL_OPS}")
+        results.append({"step": kind, "arg": arg, **step})
+        if not step["ok"]:
+            break
+    return {
+        "ok": len(results) == len(ops) and all(r["ok"] for r in results),
+        "port": port,
+        "steps": results,
+        "sessions": repl_pool().sessions(),
+    }
@@ -0,0 +1,228 @@
+from __future__ import annotations
+
+import hashlib
+import struct
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+
+from .flashmap import SECTOR_SIZE, Extent, coalesce_extents, is_erased, split_blocks, total_size
+from .partitions import PARTITION_TABLE_OFFSET, PARTITION_TABLE_SIZE, parse_partition_table_bytes
+
+SPARSE_MAGIC = b"CHSPARSE"
+SPARSE_VERSION = 1
+SPARSE_SUFFIX = ".sparse"
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+
+# magic, version, reserved, flash_size, extent_count
+_HEADER = struct.Struct("<8sHHII")
+# offset, size, stored_size, compression, md5 of raw bytes, region label
+_EXTENT = struct.Struct("<IIIB3x16s16s")
+
+
+class SparseImageError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class SparseExtent:
+    label: str
+    offset: int
+    size: int
+    stored_size: int
+    compression: int
+    md5: str
+    data_offset: int
+
+    def to_dict(self) -> dict:
+        return {
+            "label": self.label,
+            "offset": self.offset,
+            "offset_hex": hex(self.offset),
+            "size": self.size,
+            "stored_size": self.stored_size,
+            "compressed": self.compression == COMPRESSION_ZLIB,
+            "md5": self.md5,
+        }
+
+
+@dataclass(frozen=True)
+class SparseImage:
+    path: Path
+    flash_size: int
+    extents: list[SparseExtent]
+
+    def read_extent(self, extent: SparseExtent) -> bytes:
+        with self.path.open("rb") as f:
+            f.seek(extent.data_offset)
+            stored = f.read(extent.stored_size)
+        data = zlib.decompress(stored) if extent.compression == COMPRESSION_ZLIB else stored
+        if hashlib.md5(data).hexdigest() != extent.md5:
+            raise SparseImageError(f"Extent at {hex(extent.offset)} failed its MD5 check")
+        return data
+
+    def erased_extents(self) -> list[Extent]:
+        """Flash regions not covered by any stored extent (all 0xFF in the original dump)."""
+        gaps: list[Extent] = []
+        cursor = 0
+        for extent in self.extents:
+            if extent.offset > cursor:
+                gaps.append(Extent(offset=cursor, size=extent.offset - cursor))
+            cursor = extent.offset + extent.size
+        if cursor < self.flash_size:
+            gaps.append(Extent(offset=cursor, size=self.flash_size - cursor))
+        return gaps
+
+    def to_bytes(self) -> bytes:
+        image = bytearray(b"\xFF" * self.flash_size)
+        for extent in self.extents:
+            image[extent.offset : extent.offset + extent.size] = self.read_extent(extent)
+        return bytes(image)
+
+
+def flash_regions(data: bytes) -> list[tuple[str, Extent]]:
+    """Label flash by the dump's own partition table; unlisted space is 'unmapped'."""
+    table = data[PARTITION_TABLE_OFFSET : PARTITION_TABLE_OFFSET + PARTITION_TABLE_SIZE]
+    named = [("bootloader", Extent(0, PARTITION_TABLE_OFFSET))]
+    named.append(("partition_table", Extent(PARTITION_TABLE_OFFSET, PARTITION_TABLE_SIZE)))
+    for entry in parse_partition_table_bytes(table):
+        end = min(entry.offset + entry.size, len(data))
+        if entry.offset < end:
+            named.append((entry.label, Extent(entry.offset, end - entry.offset)))
+    named.sort(key=lambda item: item[1].offset)
+
+    regions: list[tuple[str, Extent]] = []
+    cursor = 0
+    for label, extent in named:
+        if extent.offset < cursor:
+            continue
+        if extent.offset > cursor:
+            regions.append(("unmapped", Extent(cursor, extent.offset - cursor)))
+        regions.append((label, extent))
+        cursor = extent.end
+    if cursor < len(data):
+        regions.append(("unmapped", Extent(cursor, len(data) - cursor)))
+    return regions
+
+
+def data_extents(data: bytes) -> list[tuple[str, Extent]]:
+    """Sector-aligned runs that are not fully erased, split at partition boundaries."""
+    view = memoryview(data)
+    out: list[tuple[str, Extent]] = []
+    for label, region in flash_regions(data):
+        used = [
+            sector
+            for sector in split_blocks(region.offset, region.size, SECTOR_SIZE)
+            if not is_erased(view[sector.offset : sector.end])
+        ]
+        out.extend((label, extent) for extent in coalesce_extents(used))
+    return out
+
+
+def encode_sparse_image(data: bytes, compress: bool = True) -> bytes:
+    extents = data_extents(data)
+    payloads: list[bytes] = []
+    index: list[bytes] = []
+    for label, extent in extents:
+        raw = data[extent.offset : extent.end]
+        stored, compression = raw, COMPRESSION_NONE
+        if compress:
+            packed = zlib.compress(raw, 9)
+            if len(packed) < len(raw):
+                stored, compression = packed, COMPRESSION_ZLIB
+        index.append(
+            _EXTENT.pack(
+                extent.offset,
+                extent.size,
+                len(stored),
+                compression,
+                hashlib.md5(raw).digest(),
+                label.encode("ascii", errors="ignore")[:16],
+            )
+        )
+        payloads.append(stored)
+    header = _HEADER.pack(SPARSE_MAGIC, SPARSE_VERSION, 0, len(data), len(extents))
+    return header + b"".join(index) + b"".join(payloads)
+
+
+def is_sparse_image(path: str | Path) -> bool:
+    with Path(path).open("rb") as f:
+        return f.read(len(SPARSE_MAGIC)) == SPARSE_MAGIC
+
+
+def read_sparse_image(path: str | Path) -> SparseImage:
+    path = Path(path)
+    with path.open("rb") as f:
+        header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            raise SparseImageError(f"Truncated sparse image header: {path}")
+        magic, version, _, flash_size, count = _HEADER.unpack(header)
+        if magic != SPARSE_MAGIC:
+            raise SparseImageError(f"Not a sparse flash image: {path}")
+        if version != SPARSE_VERSION:
+            raise SparseImageError(f"Unsupported sparse image version {version}: {path}")
+        raw_index = f.read(_EXTENT.size * count)
+    if len(raw_index) < _EXTENT.size * count:
+        raise SparseImageError(f"Truncated sparse image index: {path}")
+
+    extents: list[SparseExtent] = []
+    data_offset = _HEADER.size + _EXTENT.size * count
+    for i in range(count):
+        offset, size, stored_size, compression, md5, label = _EXTENT.unpack_from(
+            raw_index, i * _EXTENT.size
+        )
+        extents.append(
+            SparseExtent(
+                label=label.split(b"\x00", 1)[0].decode("ascii", errors="ignore"),
+                offset=offset,
+                size=size,
+                stored_size=stored_size,
+                compression=compression,
+                md5=md5.hex(),
+                data_offset=data_offset,
+            )
+        )
+        data_offset += stored_size
+    return SparseImage(path=path, flash_size=flash_size, extents=extents)
+
+
+def load_flash_image(path: str | Path) -> bytes:
+    """Raw flash bytes from either a plain .bin dump or a sparse container."""
+    if is_sparse_image(path):
+        return read_sparse_image(path).to_bytes()
+    return Path(path).read_bytes()
+
+
+def convert_raw_to_sparse(
+    raw_path: str | Path,
+    out_path: str | Path | None = None,
+    compress: bool = True,
+) -> dict:
+    raw_path = Path(raw_path)
+    out_path = Path(out_path) if out_path else raw_path.with_suffix(SPARSE_SUFFIX)
+    data = raw_path.read_bytes()
+    out_path.write_bytes(encode_sparse_image(data, compress=compress))
+    image = read_sparse_image(out_path)
+    return {
+        "ok": True,
+        "raw_path": str(raw_path),
+        "sparse_path": str(out_path),
+        "flash_size": image.flash_size,
+        "data_bytes": total_size([Extent(e.offset, e.size) for e in image.extents]),
+        "stored_bytes": out_path.stat().st_size,
+        "extents": [e.to_dict() for e in image.extents],
+    }
+
+
+def export_sparse_to_raw(sparse_path: str | Path, out_path: str | Path | None = None) -> dict:
+    sparse_path = Path(sparse_path)
+    out_path = Path(out_path) if out_path else sparse_path.with_suffix(".bin")
+    image = read_sparse_image(sparse_path)
+    out_path.write_bytes(image.to_bytes())
+    return {
+        "ok": True,
+        "sparse_path": str(sparse_path),
+        "raw_path": str(out_path),
+        "flash_size": image.flash_size,
+    }
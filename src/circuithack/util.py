@@ -1,9 +1,14 @@
 from __future__ import annotations
 
+import json
+import os
 import shlex
 import subprocess
+import threading
+from contextlib import contextmanager
 from dataclasses import dataclass
-from typing import Sequence
+from pathlib import Path
+from typing import IO, Callable, Iterator, Sequence
 
 
 @dataclass
@@ -18,7 +23,13 @@ class CommandResult:
         return self.returncode == 0
 
 
-def run_cmd(cmd: Sequence[str], timeout: int = 180) -> CommandResult:
+def run_cmd(
+    cmd: Sequence[str],
+    timeout: int = 180,
+    on_line: Callable[[str], None] | None = None,
+) -> CommandResult:
+    if on_line is not None:
+        return _run_cmd_streaming(cmd, timeout, on_line)
     proc = subprocess.run(
         list(cmd),
         stdout=subprocess.PIPE,
@@ -35,6 +46,120 @@ def run_cmd(cmd: Sequence[str], timeout: int = 180) -> CommandResult:
     )
 
 
+def _pump_lines(stream: IO[str], sink: list[str], on_line: Callable[[str], None]) -> None:
+    # esptool redraws progress with '\r', so split on both line endings.
+    pending = ""
+    for chunk in iter(lambda: stream.read(1), ""):
+        sink.append(chunk)
+        if chunk in "\r\n":
+            if pending:
+                on_line(pending)
+            pending = ""
+        else:
+            pending += chunk
+    if pending:
+        on_line(pending)
+
+
+def _run_cmd_streaming(
+    cmd: Sequence[str],
+    timeout: int,
+    on_line: Callable[[str], None],
+) -> CommandResult:
+    """Like run_cmd, but hands every stdout/stderr line to `on_line` as it arrives."""
+    proc = subprocess.Popen(
+        list(cmd),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        bufsize=1,
+    )
+    stdout: list[str] = []
+    stderr: list[str] = []
+    lock = threading.Lock()
+
+    def emit(line: str) -> None:
+        # Both pipes report through one callback; keep it single-threaded for the caller.
+        with lock:
+            on_line(line)
+
+    readers = [
+        threading.Thread(target=_pump_lines, args=(proc.stdout, stdout, emit), daemon=True),
+        threading.Thread(target=_pump_lines, args=(proc.stderr, stderr, emit), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+    try:
+        returncode = proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        for reader in readers:
+            reader.join()
+    return CommandResult(
+        cmd=list(cmd),
+        returncode=returncode,
+        stdout="".join(stdout),
+        stderr="".join(stderr),
+    )
+
+
 def format_cmd(cmd: Sequence[str]) -> str:
     return " ".join(shlex.quote(x) for x in cmd)
 
+
+def cache_dir() -> Path:
+    """Per-user cache root for calibration, hash and build caches."""
+    override = os.environ.get("CIRCUITHACK_CACHE_DIR")
+    path = Path(override) if override else Path.home() / ".cache" / "circuithack"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+_json_cache_locks: dict[Path, threading.Lock] = {}
+_json_cache_guard = threading.Lock()
+
+
+def load_json_cache(path: Path) -> dict:
+    """A JSON cache file as a dict; a missing or corrupt file reads as empty."""
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+@contextmanager
+def update_json_cache(path: Path) -> Iterator[dict]:
+    """Load, modify and atomically save a JSON cache, one writer at a time per process.
+
+    Each writer uses its own tmp file, so concurrent processes never rename each
+    other's half-written files; the last complete write wins.
+    """
+    with _json_cache_guard:
+        lock = _json_cache_locks.setdefault(path, threading.Lock())
+    with lock:
+        cache = load_json_cache(path)
+        yield cache
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp.write_text(json.dumps(cache, indent=2), encoding="utf-8")
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+
+_port_releasers: list[Callable[[str], object]] = []
+
+
+def register_port_releaser(release: Callable[[str], object]) -> None:
+    """Register a callback that gives up anything holding a serial port open."""
+    _port_releasers.append(release)
+
+
+def release_port(port: str) -> None:
+    """Free `port` for a tool that needs it exclusively, such as esptool."""
+    for release in _port_releasers:
+        release(port)
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from .baudrate import DEFAULT_TRANSFER_BAUD, resolve_baud
+from .flashmap import HASH_BLOCK_SIZE, Extent, coalesce_extents, split_blocks, total_size
+from .flashsession import FlashSession, open_flash_session
+from .hashcache import image_hashes
+
+
+def mismatched_regions(
+    session: FlashSession,
+    offset: int,
+    size: int,
+    expected: list[str],
+    block_size: int = HASH_BLOCK_SIZE,
+) -> list[Extent]:
+    """Blocks whose device-side MD5 differs from the expected host hashes, coalesced."""
+    blocks = split_blocks(offset, size, block_size)
+    return coalesce_extents(
+        [
+            block
+            for block, digest in zip(blocks, expected)
+            if session.md5(block.offset, block.size) != digest
+        ]
+    )
+
+
+def verify_flash_image(
+    port: str,
+    image_path: str | Path,
+    offset: int = 0,
+    baud: int | None = None,
+    block_size: int = HASH_BLOCK_SIZE,
+) -> dict:
+    """Check that flash at `offset` holds `image_path` without reading the image back.
+
+    The stub hashes each block on the device; host hashes come from the image hash
+    cache, so repeated provisioning runs hash a given firmware file only once.
+    """
+    path = Path(image_path)
+    if not path.exists():
+        return {"ok": False, "error": f"Image file not found: {path}"}
+    hashes = image_hashes(path, block_size)
+    baud = resolve_baud(port, baud, DEFAULT_TRANSFER_BAUD)
+    result = {
+        "image_path": str(path),
+        "offset": offset,
+        "offset_hex": hex(offset),
+        "size": hashes["size"],
+        "md5": hashes["md5"],
+        "host_hash_cached": hashes["cached"],
+        "blocks_checked": len(hashes["block_md5"]),
+    }
+    try:
+        with open_flash_session(port=port, baud=baud) as session:
+            with session.stage("hash_device"):
+                mismatched = mismatched_regions(
+                    session,
+                    offset,
+                    hashes["size"],
+                    hashes["block_md5"],
+                    block_size=block_size,
+                )
+    except Exception as exc:  # noqa: BLE001 - esptool/serial failures are reported, not raised
+        return {**result, "ok": False, "error": str(exc)}
+    return {
+        **result,
+        "ok": not mismatched,
+        "mismatched": [e.to_dict() for e in mismatched],
+        "mismatched_bytes": total_size(mismatched),
+        "timings": session.timings_report(),
+    }
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import hashlib
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import pytest
+
+from circuithack.flashsession import FlashSession
+
+
+class FakeEsp:
+    """In-memory stand-in for a stub-running esptool loader."""
+
+    FLASH_WRITE_SIZE = 0x4000
+    MAC = b"\xdc\x54\x75\xc0\xff\xee"
+    IS_STUB = True
+
+    def __init__(self, image: bytes) -> None:
+        self.flash = bytearray(image)
+        self.reads: list[tuple[int, int]] = []
+        self.md5_calls: list[tuple[int, int]] = []
+        self.erases: list[tuple[int, int]] = []
+        self.writes: list[tuple[int, int]] = []
+        self.bauds: list[int] = []
+        self.block_timeouts: list[float] = []
+        self._pending: tuple[int, int, bytearray] | None = None
+
+    def read_mac(self) -> bytes:
+        return self.MAC
+
+    def change_baud(self, baud: int) -> None:
+        self.bauds.append(baud)
+
+    def read_flash(self, offset: int, length: int, progress_fn=None) -> bytes:
+        self.reads.append((offset, length))
+        if progress_fn is not None:
+            progress_fn(length, length)
+        return bytes(self.flash[offset : offset + length])
+
+    def flash_md5sum(self, addr: int, size: int) -> str:
+        self.md5_calls.append((addr, size))
+        return hashlib.md5(self.flash[addr : addr + size]).hexdigest()
+
+    def erase_region(self, offset: int, size: int) -> None:
+        self.erases.append((offset, size))
+        self.flash[offset : offset + size] = b"\xff" * size
+
+    def flash_defl_begin(self, size: int, compsize: int, offset: int) -> int:
+        self._pending = (offset, size, bytearray())
+        return (compsize + self.FLASH_WRITE_SIZE - 1) // self.FLASH_WRITE_SIZE
+
+    def flash_defl_block(self, data: bytes, seq: int, timeout: float = 3.0) -> None:
+        assert self._pending is not None
+        self.block_timeouts.append(timeout)
+        self._pending[2].extend(data)
+
+    def flash_defl_finish(self, reboot: bool = False) -> None:
+        assert self._pending is not None
+        offset, size, compressed = self._pending
+        data = zlib.decompress(bytes(compressed))
+        assert len(data) == size
+        self.flash[offset : offset + size] = data
+        self.writes.append((offset, size))
+        self._pending = None
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache_dir(monkeypatch, tmp_path_factory):
+    """Keep calibration/hash/payload caches out of the real user cache during tests."""
+    monkeypatch.setenv("CIRCUITHACK_CACHE_DIR", str(tmp_path_factory.mktemp("cache")))
+    monkeypatch.setattr("circuithack.payloadcache._memory", OrderedDict())
+
+
+@pytest.fixture
+def fake_esp():
+    return FakeEsp
+
+
+@pytest.fixture
+def fake_session_opener():
+    """Build an `open_flash_session` replacement backed by a FakeEsp."""
+
+    def make(esp: FakeEsp):
+        @contextmanager
+        def opener(port: str, baud: int = 921600, **_kwargs):
+            yield FlashSession(esp=esp, port=port, baud=baud)
+
+        return opener
+
+    return make
@@ -43,3 +43,195 @@ def test_select_state_partitions_filters_expected_labels(tmp_path: Path) -> None
     parts = parse_partition_table(p)
     state_parts = select_state_partitions(parts)
     assert [x.label for x in state_parts] == ["nvs", "factory", "storage"]
+
+
+def test_backup_state_partitions_uses_single_session(
+    monkeypatch, tmp_path: Path, fake_esp, fake_session_opener
+) -> None:
+    from circuithack.backup import PARTITION_TABLE_OFFSET, backup_state_partitions
+
+    table = b"".join(
+        [
+            _entry("nvs", 0x01, 0x02, 0x11000, 0x1000),
+            _entry("otadata", 0x01, 0x00, 0x12000, 0x1000),
+            _entry("storage", 0x01, 0x82, 0x13000, 0x2000),
+        ]
+    )
+    image = bytearray(b"\xff" * 0x20000)
+    image[PARTITION_TABLE_OFFSET : PARTITION_TABLE_OFFSET + len(table)] = table
+    image[0x11000:0x12000] = b"\x01" * 0x1000
+    esp = fake_esp(bytes(image))
+    opened: list[str] = []
+
+    def opener(port: str, baud: int = 921600, **kwargs):
+        opened.append(port)
+        return fake_session_opener(esp)(port, baud, **kwargs)
+
+    monkeypatch.setattr("circuithack.backup.open_flash_session", opener)
+
+    result = backup_state_partitions(port="/dev/ttyACM0", out_dir=tmp_path)
+
+    assert result["ok"] is True
+    assert opened == ["/dev/ttyACM0"]
+    assert [b["label"] for b in result["backups"]] == ["nvs", "storage"]
+    assert Path(result["backups"][0]["path"]).read_bytes() == b"\x01" * 0x1000
+    assert [t["name"] for t in result["timings"]] == [
+        "read_partition_table",
+        "backup_nvs",
+        "backup_storage",
+    ]
+
+
+def test_incremental_full_backup_reads_only_changed_blocks(
+    monkeypatch, tmp_path: Path, fake_esp, fake_session_opener
+) -> None:
+    from circuithack.backup import backup_full_flash
+
+    flash_size = 0x40000
+    esp = fake_esp(bytes(range(256)) * (flash_size // 256))
+    monkeypatch.setattr("circuithack.backup.open_flash_session", fake_session_opener(esp))
+    stamps = iter(["20260101-000000", "20260102-000000"])
+    monkeypatch.setattr("circuithack.backup._ts", lambda: next(stamps))
+
+    first = backup_full_flash(port="p", out_dir=tmp_path, flash_size=flash_size, incremental=True)
+    assert first["ok"] is True
+    assert first["base_path"] is None
+    assert first["bytes_read"] == flash_size
+
+    esp.flash[0x21000:0x21010] = b"\x00" * 16
+    esp.reads.clear()
+    second = backup_full_flash(port="p", out_dir=tmp_path, flash_size=flash_size, incremental=True)
+
+    assert second["ok"] is True
+    assert second["base_path"] == first["path"]
+    assert second["blocks_changed"] == 1
+    assert esp.reads == [(0x20000, 0x10000)]
+    assert Path(second["path"]).read_bytes() == bytes(esp.flash)
+
+
+def test_diff_restore_writes_only_mismatched_sectors(
+    monkeypatch, tmp_path: Path, fake_esp, fake_session_opener
+) -> None:
+    from circuithack.backup import restore_full_flash_backup
+
+    backup = bytes(range(256)) * (0x40000 // 256)
+    device = bytearray(backup)
+    device[0x23000:0x23004] = b"\x00\x00\x00\x00"
+    esp = fake_esp(bytes(device))
+    monkeypatch.setattr("circuithack.backup.open_flash_session", fake_session_opener(esp))
+    backup_path = tmp_path / "codee-fullflash.bin"
+    backup_path.write_bytes(backup)
+    plans: list[dict] = []
+
+    result = restore_full_flash_backup(
+        port="p",
+        backup_path=backup_path,
+        diff=True,
+        on_plan=plans.append,
+    )
+
+    assert result["ok"] is True
+    assert plans[0]["bytes_to_write"] == 0x1000
+    assert plans[0]["regions"][0]["offset"] == 0x23000
+    assert plans[0]["estimated_seconds"] > 0
+    assert esp.writes == [(0x23000, 0x1000)]
+    assert bytes(esp.flash) == backup
+
+
+def test_diff_restore_dry_run_does_not_write(
+    monkeypatch, tmp_path: Path, fake_esp, fake_session_opener
+) -> None:
+    from circuithack.backup import restore_full_flash_backup
+
+    esp = fake_esp(b"\x00" * 0x20000)
+    monkeypatch.setattr("circuithack.backup.open_flash_session", fake_session_opener(esp))
+    backup_path = tmp_path / "codee-fullflash.bin"
+    backup_path.write_bytes(b"\x01" * 0x20000)
+
+    result = restore_full_flash_backup(port="p", backup_path=backup_path, diff=True, dry_run=True)
+
+    assert result["ok"] is True
+    assert result["plan"]["bytes_to_write"] == 0x20000
+    assert esp.writes == []
+
+
+def test_dry_run_restore_never_writes_without_diff(
+    monkeypatch, tmp_path: Path, fake_esp, fake_session_opener
+) -> None:
+    from circuithack.backup import restore_full_flash_backup
+    from circuithack.sparseimage import convert_raw_to_sparse
+
+    raw = bytearray(b"\xff" * 0x20000)
+    raw[0x3000:0x4000] = b"\x42" * 0x1000
+    raw_path = tmp_path / "codee-fullflash.bin"
+    raw_path.write_bytes(bytes(raw))
+    sparse_path = convert_raw_to_sparse(raw_path)["sparse_path"]
+    esp = fake_esp(b"\x00" * 0x20000)
+    monkeypatch.setattr("circuithack.backup.open_flash_session", fake_session_opener(esp))
+
+    def no_write(**kwargs):
+        raise AssertionError("dry run must not write")
+
+    monkeypatch.setattr("circuithack.backup.write_flash_at", no_write)
+
+    for path in (raw_path, sparse_path):
+        result = restore_full_flash_backup(port="p", backup_path=path, dry_run=True)
+        assert result["ok"] is True
+        assert result["dry_run"] is True
+        assert result["plan"]["bytes_to_write"] == 0x1000
+    assert esp.writes == []
+    assert esp.erases == []
+    assert bytes(esp.flash) == b"\x00" * 0x20000
+
+
+def test_restore_sparse_backup_skips_erased_extents(
+    monkeypatch, tmp_path: Path, fake_esp, fake_session_opener
+) -> None:
+    from circuithack.backup import restore_full_flash_backup
+    from circuithack.sparseimage import convert_raw_to_sparse
+
+    raw = bytearray(b"\xff" * 0x20000)
+    raw[0x3000:0x4000] = b"\x42" * 0x1000
+    raw_path = tmp_path / "codee-fullflash.bin"
+    raw_path.write_bytes(bytes(raw))
+    sparse_path = convert_raw_to_sparse(raw_path)["sparse_path"]
+    esp = fake_esp(b"\x00" * 0x20000)
+    monkeypatch.setattr("circuithack.backup.open_flash_session", fake_session_opener(esp))
+
+    result = restore_full_flash_backup(port="p", backup_path=sparse_path)
+
+    assert result["ok"] is True
+    assert esp.writes == [(0x3000, 0x1000)]
+    assert bytes(esp.flash) == bytes(raw)
+
+
+def test_full_backup_resumes_interrupted_read_into_same_file(
+    monkeypatch, tmp_path: Path, fake_esp, fake_session_opener
+) -> None:
+    from circuithack.backup import backup_full_flash
+
+    flash_size = 0x80000
+    esp = fake_esp(b"\x33" * flash_size)
+    original_read = esp.read_flash
+    calls = {"n": 0}
+
+    def flaky_read(offset: int, length: int, progress_fn=None) -> bytes:
+        calls["n"] += 1
+        if calls["n"] == 2:
+            raise OSError("USB hiccup")
+        return original_read(offset, length, progress_fn)
+
+    esp.read_flash = flaky_read
+    monkeypatch.setattr("circuithack.backup.open_flash_session", fake_session_opener(esp))
+    stamps = iter(["20260101-000000", "20260101-000100"])
+    monkeypatch.setattr("circuithack.backup._ts", lambda: next(stamps))
+
+    failed = backup_full_flash(port="p", out_dir=tmp_path, flash_size=flash_size)
+    assert failed["ok"] is False
+    assert failed["read"]["chunks_done"] == 1
+
+    resumed = backup_full_flash(port="p", out_dir=tmp_path, flash_size=flash_size)
+    assert resumed["ok"] is True
+    assert resumed["path"] == str(tmp_path / "codee-fullflash-20260101-000000.bin")
+    assert resumed["read"]["resumed_chunks"] == 1
+    assert Path(resumed["path"]).read_bytes() == b"\x33" * flash_size
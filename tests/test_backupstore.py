@@ -0,0 +1,49 @@
+from pathlib import Path
+
+from circuithack.backupstore import (
+    add_snapshot,
+    label_from_backup_name,
+    list_snapshots,
+    prune_snapshots,
+    restore_snapshot,
+)
+
+
+def _image(tmp_path: Path, name: str, tail: bytes) -> Path:
+    path = tmp_path / name
+    path.write_bytes(b"\x10" * 0x3000 + tail.ljust(0x1000, b"\xff"))
+    return path
+
+
+def test_label_from_backup_name_parses_codee_naming() -> None:
+    assert label_from_backup_name("backups/codee-nvs-20260101-120000.bin") == "nvs"
+    assert label_from_backup_name("custom.bin") == "custom"
+
+
+def test_store_dedupes_shared_sectors_and_restores(tmp_path: Path) -> None:
+    store = tmp_path / "store"
+    first = add_snapshot(store, _image(tmp_path, "codee-fullflash-20260101-000000.bin", b"a"), device="A")
+    second = add_snapshot(store, _image(tmp_path, "codee-fullflash-20260102-000000.bin", b"b"), device="A")
+
+    assert first["sectors_new"] == 2
+    assert second["sectors_new"] == 1
+    listing = list_snapshots(store)
+    assert listing["unique_sectors"] == 3
+    assert [s["label"] for s in listing["snapshots"]] == ["fullflash", "fullflash"]
+
+    out = tmp_path / "restored.bin"
+    assert restore_snapshot(store, second["id"], out)["ok"] is True
+    assert out.read_bytes() == (tmp_path / "codee-fullflash-20260102-000000.bin").read_bytes()
+
+
+def test_prune_keeps_newest_and_collects_unreferenced_sectors(tmp_path: Path) -> None:
+    store = tmp_path / "store"
+    old = add_snapshot(store, _image(tmp_path, "codee-nvs-20260101-000000.bin", b"old"), device="A")
+    new = add_snapshot(store, _image(tmp_path, "codee-nvs-20260102-000000.bin", b"new"), device="A")
+
+    result = prune_snapshots(store, keep_last=1)
+
+    assert result["removed_snapshots"] == [old["id"]]
+    assert result["removed_sectors"] == 1
+    assert result["reclaimed_bytes"] > 0
+    assert [s["id"] for s in list_snapshots(store)["snapshots"]] == [new["id"]]
@@ -0,0 +1,49 @@
+from circuithack.baudrate import (
+    BaudTrial,
+    calibrate_baud,
+    pick_stable_baud,
+    record_baud,
+    resolve_baud,
+)
+
+
+def test_pick_stable_baud_stops_at_first_failure() -> None:
+    trials = [
+        BaudTrial(baud=921600, ok=True, seconds=0.1),
+        BaudTrial(baud=115200, ok=True, seconds=0.5),
+        BaudTrial(baud=1500000, ok=False, seconds=0.1),
+        BaudTrial(baud=2000000, ok=True, seconds=0.1),
+    ]
+    assert pick_stable_baud(trials) == 921600
+    assert pick_stable_baud([BaudTrial(baud=115200, ok=False, seconds=0.1)]) is None
+
+
+def test_resolve_baud_prefers_explicit_then_cached_then_default(monkeypatch) -> None:
+    monkeypatch.setattr("circuithack.baudrate.serial_number_for_port", lambda port: "SN123")
+    assert resolve_baud("/dev/ttyACM0", None, 460800) == 460800
+
+    record_baud("SN123", 1500000, "/dev/ttyACM0")
+    assert resolve_baud("/dev/ttyACM0", None, 460800) == 1500000
+    assert resolve_baud("/dev/ttyACM0", 115200, 460800) == 115200
+
+
+def test_calibrate_baud_caches_fastest_stable_rate(monkeypatch, fake_esp) -> None:
+    esp = fake_esp(bytes(range(256)) * 256)
+    original_read = esp.read_flash
+
+    def read_flash(offset: int, length: int, progress_fn=None) -> bytes:
+        data = original_read(offset, length, progress_fn)
+        # Corrupt reads above 921600 baud like a marginal USB hub would.
+        return data[::-1] if esp.bauds and esp.bauds[-1] > 921600 else data
+
+    esp.read_flash = read_flash
+    monkeypatch.setattr("circuithack.baudrate.connect_loader", lambda port, baud: esp)
+    monkeypatch.setattr("circuithack.baudrate.close_loader", lambda esp: None)
+    monkeypatch.setattr("circuithack.baudrate.serial_number_for_port", lambda port: "SN123")
+
+    result = calibrate_baud("/dev/ttyACM0")
+
+    assert result["baud"] == 921600
+    assert result["saved"] is True
+    assert [t["ok"] for t in result["trials"]][-1] is False
+    assert resolve_baud("/dev/ttyACM0", None, 460800) == 921600
@@ -74,7 +74,12 @@ def test_flash_codee_firmware_end_to_end_local_build(monkeypatch, tmp_path: Path
 
     captured: dict = {}
 
-    def fake_write_flash_zero(port: str, firmware_bin: str | Path, baud: int = 460800) -> CommandResult:
+    def fake_write_flash_zero(
+        port: str,
+        firmware_bin: str | Path,
+        baud: int = 460800,
+        progress=None,
+    ) -> CommandResult:
         captured["port"] = port
         captured["firmware_bin"] = str(firmware_bin)
         captured["baud"] = baud
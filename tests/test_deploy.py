@@ -0,0 +1,140 @@
+import contextlib
+import io
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+from circuithack import replsession
+from circuithack.deploy import DEPLOY_MANIFEST, deploy_port_kit, plan_deploy
+from circuithack.replsession import ReplPool
+
+
+class ExecTransport:
+    """Runs raw-REPL code with CPython in the current directory, standing in for the device."""
+
+    def __init__(self, port: str, baudrate: int) -> None:
+        self.in_raw_repl = False
+        self.execs = 0
+        self.globals: dict = {}  # raw-REPL globals persist between execs
+
+    def enter_raw_repl(self, soft_reset: bool = True) -> None:
+        self.in_raw_repl = True
+
+    def exec_raw(self, code: str, timeout: float = 10) -> tuple[bytes, bytes]:
+        self.execs += 1
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            exec(code, self.globals)
+        return out.getvalue().encode(), b""
+
+    def exit_raw_repl(self) -> None:
+        self.in_raw_repl = False
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture
+def device(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    root = tmp_path / "device"
+    root.mkdir()
+    monkeypatch.chdir(root)
+    monkeypatch.setattr(replsession, "SerialTransport", ExecTransport)
+    monkeypatch.setattr(replsession, "_pool", ReplPool())
+    return root
+
+
+def test_plan_deploy_only_removes_files_it_deployed() -> None:
+    plan = plan_deploy(
+        local={"a.py": "1", "b.py": "2", "c.py": "3"},
+        remote={"a.py": "1", "b.py": "old", "c.py": None, "gone.py": "4", "main.py": "5"},
+        managed=["a.py", "b.py", "gone.py"],
+    )
+    assert plan.upload == ["b.py", "c.py"]
+    assert plan.unchanged == ["a.py"]
+    assert plan.remove == ["gone.py"]
+
+
+def test_deploy_sends_only_changes_and_prunes_orphans(tmp_path: Path, device: Path) -> None:
+    src = tmp_path / "codee"
+    src.mkdir()
+    (src / "game_2048.py").write_bytes(os.urandom(10_000))
+    (src / "codee_input.py").write_text("BUTTONS = 4\n")
+    (src / "old_game.py").write_text("pass\n")
+    (src / "wokwi").mkdir()
+    (src / "wokwi" / "main.py").write_text("import codee\n")
+    (device / "main.py").write_text("import codee.game_launcher\n")
+
+    first = deploy_port_kit("/dev/ttyACM0", src_dir=src)
+    assert first["ok"] and first["uploaded"] == 3
+    kit = device / "codee"  # the default remote_dir is the package
+    assert (kit / "game_2048.py").read_bytes() == (src / "game_2048.py").read_bytes()
+
+    (src / "codee_input.py").write_text("BUTTONS = 5\n")
+    (src / "old_game.py").unlink()
+    second = deploy_port_kit("/dev/ttyACM0", src_dir=src)
+    assert second["plan"] == {
+        "upload": ["codee/codee_input.py"],
+        "unchanged": ["codee/game_2048.py"],
+        "remove": ["codee/old_game.py"],
+    }
+    assert second["bytes_sent"] == len("BUTTONS = 5\n")
+    assert (device / "main.py").exists()
+    assert sorted(os.listdir(device)) == sorted([DEPLOY_MANIFEST, "codee", "main.py"])
+    assert sorted(os.listdir(kit)) == ["codee_input.py", "game_2048.py"]
+
+    with replsession.repl_pool().session("/dev/ttyACM0") as session:
+        before = session.transport.execs
+    third = deploy_port_kit("/dev/ttyACM0", src_dir=src)
+    assert third["uploaded"] == 0 and third["removed"] == 0
+    assert session.transport.execs - before == 1  # the hash listing, nothing else
+
+
+def test_prune_only_touches_its_own_remote_dir(tmp_path: Path, device: Path) -> None:
+    games, lib = tmp_path / "games", tmp_path / "lib"
+    games.mkdir()
+    lib.mkdir()
+    (games / "snake.py").write_text("pass\n")
+    (lib / "codee_input.py").write_text("BUTTONS = 4\n")
+    (lib / "old_util.py").write_text("pass\n")
+    # A manifest from before remote_dir keys: one flat list for the whole device.
+    (device / "games").mkdir()
+    (device / "games" / "tetris.py").write_text("pass\n")
+    (device / DEPLOY_MANIFEST).write_text(json.dumps(["games/tetris.py"]))
+
+    assert deploy_port_kit("/dev/ttyACM0", src_dir=lib, remote_dir="lib")["ok"]
+    (lib / "old_util.py").unlink()
+    pruned = deploy_port_kit("/dev/ttyACM0", src_dir=lib, remote_dir="/lib/")
+    assert pruned["plan"]["remove"] == ["lib/old_util.py"]
+    assert (device / "games" / "tetris.py").exists()
+
+    again = deploy_port_kit("/dev/ttyACM0", src_dir=games, remote_dir="games")
+    assert again["plan"]["remove"] == ["games/tetris.py"]
+    assert sorted(os.listdir(device / "lib")) == ["codee_input.py"]
+    assert json.loads((device / DEPLOY_MANIFEST).read_text()) == {
+        "games": ["games/snake.py"],
+        "lib": ["lib/codee_input.py"],
+    }
+
+
+def test_mpy_deploy_removes_the_py_it_replaces_even_without_prune(
+    tmp_path: Path,
+    device: Path,
+) -> None:
+    src = tmp_path / "codee"
+    src.mkdir()
+    (src / "game_2048.py").write_text("pass\n")
+    (src / "boot_menu.py").write_text("pass\n")
+    assert deploy_port_kit("/dev/ttyACM0", src_dir=src, remote_dir="lib")["ok"]
+
+    compiled = tmp_path / "mpy"
+    compiled.mkdir()
+    (compiled / "game_2048.mpy").write_bytes(b"M\x06")
+    result = deploy_port_kit("/dev/ttyACM0", src_dir=compiled, remote_dir="lib", prune=False)
+    assert result["plan"]["remove"] == ["lib/game_2048.py"]
+    assert sorted(os.listdir(device / "lib")) == ["boot_menu.py", "game_2048.mpy"]
+    assert json.loads((device / DEPLOY_MANIFEST).read_text()) == {
+        "lib": ["lib/boot_menu.py", "lib/game_2048.mpy"],
+    }
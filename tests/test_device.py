@@ -1,6 +1,7 @@
 import pytest
 
-from circuithack.device import SerialDevice, resolve_codee_port
+from circuithack import device
+from circuithack.device import DeviceWatcher, SerialDevice, resolve_codee_port
 
 
 def test_resolve_codee_port_prefers_explicit_port() -> None:
@@ -29,3 +30,66 @@ def test_resolve_codee_port_raises_when_no_candidates(monkeypatch) -> None:
     monkeypatch.setattr("circuithack.device.detect_codee_candidates", lambda: [])
     with pytest.raises(RuntimeError, match="No Codee-like USB serial device found."):
         resolve_codee_port(None)
+
+
+def _codee(path: str, serial: str) -> SerialDevice:
+    return SerialDevice(
+        path=path,
+        description="USB JTAG/serial debug unit",
+        manufacturer="Espressif",
+        product=None,
+        serial_number=serial,
+        vid=0x303A,
+        pid=0x1001,
+    )
+
+
+def test_watcher_reports_attach_and_detach_and_skips_unchanged_nodes(tmp_path) -> None:
+    attached: list[SerialDevice] = []
+    calls: list[int] = []
+
+    def enumerate_devices() -> list[SerialDevice]:
+        calls.append(1)
+        return list(attached)
+
+    watcher = DeviceWatcher(dev_dir=str(tmp_path), enumerate_devices=enumerate_devices)
+    assert watcher.poll() == []
+    assert watcher.poll() == [] and len(calls) == 1  # no node changes, no enumeration
+
+    attached.append(_codee("/dev/ttyACM0", "AA"))
+    (tmp_path / "ttyACM0").touch()
+    assert [(e.kind, e.device.path) for e in watcher.poll()] == [("attach", "/dev/ttyACM0")]
+    assert watcher.first_candidate().serial_number == "AA"
+
+    attached.clear()
+    (tmp_path / "ttyACM0").unlink()
+    assert [e.kind for e in watcher.poll()] == ["detach"]
+    assert watcher.first_candidate() is None
+
+
+def test_wait_for_codee_ignores_devices_already_attached(tmp_path) -> None:
+    attached = [_codee("/dev/ttyACM0", "AA")]
+    (tmp_path / "ttyACM0").touch()
+    watcher = DeviceWatcher(
+        interval=0.01,
+        dev_dir=str(tmp_path),
+        enumerate_devices=lambda: list(attached),
+    )
+    with watcher:
+        assert watcher.wait_for_codee(timeout=0.05) is None
+        attached.append(_codee("/dev/ttyACM1", "BB"))
+        (tmp_path / "ttyACM1").touch()
+        assert watcher.wait_for_codee(timeout=2).serial_number == "BB"
+
+
+def test_resolve_codee_port_answers_from_running_watcher(monkeypatch, tmp_path) -> None:
+    watcher = DeviceWatcher(
+        dev_dir=str(tmp_path),
+        enumerate_devices=lambda: [_codee("/dev/x", "A")],
+    )
+    monkeypatch.setattr(device, "_watcher", watcher.start())
+    monkeypatch.setattr(device, "detect_codee_candidates", lambda: [])
+    try:
+        assert resolve_codee_port(None) == "/dev/x"
+    finally:
+        watcher.stop()
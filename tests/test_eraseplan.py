@@ -0,0 +1,60 @@
+from pathlib import Path
+
+from circuithack.eraseplan import blank_target_sectors, plan_blank_aware
+from circuithack.flashmap import Extent, subtract_extents
+from circuithack.flashsession import FlashSession
+
+
+def test_plan_blank_aware_splits_write_erase_and_skipped_sectors() -> None:
+    data = bytearray(b"\x42" * 0x6000 + b"\xff" * 0x800)
+    data[0x1000:0x3000] = b"\xff" * 0x2000
+    data = bytes(data)
+    regions = [Extent(0, len(data))]
+
+    # The trailing partial sector is 0xFF but shares its erase unit, so it is still written.
+    assert blank_target_sectors(data, regions) == [Extent(0x1000, 0x2000)]
+    plan = plan_blank_aware(data, regions, device_blank=[Extent(0x2000, 0x1000)])
+
+    assert plan.write == [Extent(0, 0x1000), Extent(0x3000, 0x3800)]
+    assert plan.erase == [Extent(0x1000, 0x1000)]
+    assert plan.skipped == [Extent(0x2000, 0x1000)]
+    assert plan.to_dict()["sectors_skipped_blank"] == 1
+
+
+def test_subtract_extents_cuts_holes() -> None:
+    holes = [Extent(0x1000, 0x1000), Extent(0x3000, 0x2000)]
+    assert subtract_extents([Extent(0, 0x4000)], holes) == [Extent(0, 0x1000), Extent(0x2000, 0x1000)]
+
+
+def test_blank_extents_refines_dirty_blocks_to_sectors(fake_esp) -> None:
+    flash = bytearray(b"\xff" * 0x30000)
+    flash[0x12000] = 0
+    session = FlashSession(esp=fake_esp(bytes(flash)))
+
+    blank = session.blank_extents([Extent(0, 0x30000)])
+
+    assert blank == [Extent(0, 0x12000), Extent(0x13000, 0x1D000)]
+
+
+def test_restore_sparse_erases_only_sectors_not_already_blank(
+    monkeypatch, tmp_path: Path, fake_esp, fake_session_opener
+) -> None:
+    from circuithack.backup import restore_full_flash_backup
+    from circuithack.sparseimage import convert_raw_to_sparse
+
+    raw = bytearray(b"\xff" * 0x20000)
+    raw[0x3000:0x4000] = b"\x42" * 0x1000
+    raw_path = tmp_path / "codee-fullflash.bin"
+    raw_path.write_bytes(bytes(raw))
+    sparse_path = convert_raw_to_sparse(raw_path)["sparse_path"]
+    device = bytearray(b"\xff" * 0x20000)
+    device[0x15000] = 0
+    esp = fake_esp(bytes(device))
+    monkeypatch.setattr("circuithack.backup.open_flash_session", fake_session_opener(esp))
+
+    result = restore_full_flash_backup(port="p", backup_path=sparse_path)
+
+    assert result["ok"] is True
+    assert esp.erases == [(0x15000, 0x1000)]
+    assert result["bytes_skipped_blank"] == 0x20000 - 0x1000 - 0x1000
+    assert bytes(esp.flash) == bytes(raw)
@@ -0,0 +1,51 @@
+import struct
+from pathlib import Path
+
+from circuithack.extract import extract_partitions, extract_partitions_batch, read_dump_partition
+from circuithack.partitions import PARTITION_TABLE_OFFSET
+from circuithack.sparseimage import convert_raw_to_sparse
+
+
+def _entry(label: str, ptype: int, subtype: int, offset: int, size: int) -> bytes:
+    return struct.pack("<HBBII16sI", 0x50AA, ptype, subtype, offset, size, label.encode(), 0)
+
+
+def _dump() -> bytes:
+    data = bytearray(b"\xff" * 0x40000)
+    table = _entry("nvs", 1, 2, 0x11000, 0x6000) + _entry("factory", 0, 0, 0x20000, 0x30000)
+    data[PARTITION_TABLE_OFFSET : PARTITION_TABLE_OFFSET + len(table)] = table
+    data[0x11000:0x11010] = b"savegame-bytes!!"
+    data[0x20000:0x20004] = b"\xe9\x01\x02\x03"
+    return bytes(data)
+
+
+def test_extract_partitions_slices_raw_and_sparse_dumps(tmp_path: Path) -> None:
+    data = _dump()
+    raw = tmp_path / "codee-fullflash-20260101-120000.bin"
+    raw.write_bytes(data)
+
+    result = extract_partitions(raw, labels=["nvs"])
+
+    assert result["ok"] is True
+    [nvs] = result["partitions"]
+    assert Path(nvs["path"]).name == "codee-nvs-20260101-120000.bin"
+    assert Path(nvs["path"]).read_bytes() == data[0x11000:0x17000]
+    assert Path(result["partition_table"]["path"]).name == "codee-partitions-20260101-120000.bin"
+
+    # The factory partition runs past the end of this 256KB dump.
+    full = extract_partitions(raw, out_dir=tmp_path / "all")
+    factory = next(p for p in full["partitions"] if p["label"] == "factory")
+    assert (factory["size"], factory["truncated"]) == (0x20000, True)
+
+    sparse = convert_raw_to_sparse(raw)["sparse_path"]
+    assert read_dump_partition(sparse, "nvs") == data[0x11000:0x17000]
+
+
+def test_extract_partitions_batch_reports_bad_dumps_separately(tmp_path: Path) -> None:
+    (tmp_path / "codee-fullflash-20260101-120000.bin").write_bytes(_dump())
+    (tmp_path / "codee-fullflash-20260102-120000.bin").write_bytes(b"\xff" * 0x100)
+
+    result = extract_partitions_batch(tmp_path, labels=["nvs"])
+
+    assert (result["dumps"], result["failed"], result["ok"]) == (2, 1, False)
+    assert (tmp_path / "extracted" / "codee-nvs-20260101-120000.bin").exists()
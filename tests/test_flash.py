@@ -1,4 +1,8 @@
-from circuithack.flash import build_esptool_base
+import pytest
+
+from circuithack import flash
+from circuithack.flash import build_esptool_base, enter_programmer_mode, write_flash_zero
+from circuithack.util import CommandResult
 
 
 def test_build_esptool_base_contains_expected_flags() -> None:
@@ -16,3 +20,24 @@ def test_build_esptool_base_contains_expected_flags() -> None:
     assert "--before default_reset" in s
     assert "--after hard_reset" in s
 
+
+def test_esptool_commands_release_the_port_and_stream_progress(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    released, calls, events = [], [], []
+    monkeypatch.setattr(flash, "release_port", released.append)
+
+    def run_cmd(cmd, timeout=180, on_line=None) -> CommandResult:
+        calls.append((cmd, timeout))
+        if on_line is not None:
+            on_line("Writing at 0x00000000 [====>   ]  50.0% 512/1024 bytes...")
+        return CommandResult(cmd=list(cmd), returncode=0, stdout="", stderr="")
+
+    monkeypatch.setattr(flash, "run_cmd", run_cmd)
+    assert enter_programmer_mode("/dev/ttyACM0", baud=115200).ok
+    assert write_flash_zero("/dev/ttyACM0", "fw.bin", baud=115200, progress=events.append).ok
+
+    assert released == ["/dev/ttyACM0", "/dev/ttyACM0"]
+    assert calls[0][0][-1] == "chip-id"
+    assert calls[1][0][-3:] == ["write_flash", "0x0", "fw.bin"] and calls[1][1] == 900
+    assert [e.percent for e in events] == [50.0]
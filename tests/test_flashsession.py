@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from circuithack import flashsession
+from circuithack.flashsession import FlashSession, connect_loader
+
+
+def test_flash_session_write_roundtrips_through_compressed_blocks(fake_esp) -> None:
+    esp = fake_esp(b"\xff" * 0x20000)
+    session = FlashSession(esp=esp, port="/dev/ttyACM0", baud=921600)
+    payload = bytes(range(256)) * 64
+
+    session.write(0x1000, payload)
+
+    assert session.read(0x1000, len(payload)) == payload
+    assert esp.writes == [(0x1000, len(payload))]
+
+
+def test_flash_session_stage_records_timing_and_bytes(fake_esp) -> None:
+    session = FlashSession(esp=fake_esp(b"\x00" * 0x1000))
+    with session.stage("read_nvs") as timing:
+        timing.bytes = len(session.read(0, 0x1000))
+
+    report = session.timings_report()
+    assert report[0]["name"] == "read_nvs"
+    assert report[0]["bytes"] == 0x1000
+    assert report[0]["seconds"] >= 0
+
+
+def test_block_timeout_scales_with_decompressed_size(fake_esp) -> None:
+    esp = fake_esp(b"\xff" * 0x420000)
+    session = FlashSession(esp=esp)
+    # 4 MiB of zeros compress into the first block; the random tail needs more blocks.
+    payload = bytes(0x400000) + random.Random(0).randbytes(0x8000)
+
+    session.write(0, payload)
+
+    assert bytes(esp.flash[: len(payload)]) == payload
+    assert len(esp.block_timeouts) > 2
+    # The stub writes a block while the next one arrives, so its timeout applies there.
+    assert esp.block_timeouts[0] == 3.0
+    assert esp.block_timeouts[1] > 100
+    assert esp.block_timeouts[-1] == 3.0
+
+
+def test_connect_loader_closes_port_when_stub_setup_fails(monkeypatch) -> None:
+    class Port:
+        closed = False
+
+        def close(self) -> None:
+            self.closed = True
+
+    class Rom:
+        CHIP_NAME = "ESP32-S3"
+        _port = Port()
+
+    monkeypatch.setattr(flashsession, "detect_chip", lambda **kwargs: Rom())
+
+    def failing_stub(esp):
+        raise OSError("stub upload failed")
+
+    monkeypatch.setattr(flashsession, "run_stub", failing_stub)
+
+    with pytest.raises(OSError):
+        connect_loader("/dev/ttyACM0", baud=921600)
+    assert Rom._port.closed
@@ -0,0 +1,75 @@
+import json
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from circuithack.fleet import DeviceRun, device_key, run_fleet, summarize_fleet
+
+
+def test_device_key_prefers_serial_and_is_filesystem_safe() -> None:
+    assert device_key("/dev/cu.usbmodem1101", "F4:12:FA:00") == "F4_12_FA_00"
+    assert device_key("/dev/cu.usbmodem1101", None) == "dev_cu.usbmodem1101"
+
+
+def test_summarize_fleet_counts_failures_and_throughput() -> None:
+    runs = [
+        DeviceRun(port="a", device="a", log_path="", bytes=3000, seconds=2.0),
+        DeviceRun(port="b", device="b", log_path="", ok=False, failed_step="flash", seconds=1.0),
+    ]
+    summary = summarize_fleet(runs, wall_seconds=2.0)
+    assert (summary["succeeded"], summary["failed"]) == (1, 1)
+    assert summary["failures_by_step"] == {"flash": 1}
+    assert summary["bytes_per_second"] == 1500
+
+
+def test_run_fleet_runs_devices_concurrently_and_isolates_failures(tmp_path: Path, monkeypatch) -> None:
+    firmware = tmp_path / "Codee.bin"
+    firmware.write_bytes(b"\x00" * 1000)
+    active = {"now": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def fake_flash(port: str, **kwargs) -> dict:
+        with lock:
+            active["now"] += 1
+            active["peak"] = max(active["peak"], active["now"])
+        time.sleep(0.05)
+        with lock:
+            active["now"] -= 1
+        if port == "/dev/bad":
+            return {"ok": False, "error": "sync failed"}
+        return {"ok": True, "stdout": "", "stderr": ""}
+
+    monkeypatch.setattr("circuithack.fleet.flash_codee_firmware", fake_flash)
+    monkeypatch.setattr("circuithack.fleet.serial_number_for_port", lambda port: None)
+    verified = []
+    monkeypatch.setattr(
+        "circuithack.fleet.verify_flash_image",
+        lambda port, image_path, baud: verified.append(port) or {"ok": True},
+    )
+
+    result = run_fleet(
+        ports=["/dev/a", "/dev/bad", "/dev/c"],
+        steps=("flash", "verify"),
+        max_workers=3,
+        source="path",
+        firmware_path=str(firmware),
+        out_dir=tmp_path / "backups",
+        log_dir=tmp_path / "logs",
+    )
+
+    assert result["ok"] is False
+    assert active["peak"] > 1
+    assert sorted(verified) == ["/dev/a", "/dev/c"]
+    assert result["summary"]["failures_by_step"] == {"flash": 1}
+    assert result["summary"]["bytes"] == 2000
+    bad = next(d for d in result["devices"] if d["port"] == "/dev/bad")
+    assert bad["error"] == "sync failed"
+    events = [json.loads(line)["event"] for line in Path(bad["log_path"]).read_text().splitlines()]
+    assert events == ["step_start", "step_done", "device_done"]
+
+
+def test_run_fleet_rejects_unknown_steps() -> None:
+    with pytest.raises(ValueError):
+        run_fleet(ports=["/dev/a"], steps=("flash", "reboot"))
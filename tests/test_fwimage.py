@@ -0,0 +1,130 @@
+import hashlib
+import struct
+from pathlib import Path
+
+import pytest
+
+from circuithack.fwimage import (
+    FirmwareImageError,
+    build_flash_plan,
+    flash_image_by_plan,
+    parse_app_image,
+)
+from circuithack.partitions import PARTITION_TABLE_OFFSET
+from circuithack.payloadcache import compressed_payload
+from circuithack.pipeline import _prepare_firmware
+
+
+def make_app_image(segments: list[bytes], chip_id: int = 9, hash_appended: bool = True) -> bytes:
+    out = bytearray(struct.pack("<BBBBI", 0xE9, len(segments), 2, 0x20, 0x40378000))
+    out += struct.pack(
+        "<B3sHBHH4sB", 0xEE, b"\x00" * 3, chip_id, 0, 0, 0xFFFF, b"\x00" * 4, int(hash_appended)
+    )
+    checksum = 0xEF
+    for i, payload in enumerate(segments):
+        out += struct.pack("<II", 0x3FC80000 + i * 0x1000, len(payload)) + payload
+        for byte in payload:
+            checksum ^= byte
+    out += b"\x00" * (15 - len(out) % 16) + bytes([checksum])
+    if hash_appended:
+        out += hashlib.sha256(out).digest()
+    return bytes(out)
+
+
+def make_partition_entry(label: str, ptype: int, subtype: int, offset: int, size: int) -> bytes:
+    return struct.pack("<HBBII16sI", 0x50AA, ptype, subtype, offset, size, label.encode(), 0)
+
+
+def make_merged_image() -> bytes:
+    bootloader = make_app_image([b"\x11" * 0x300, b"\x22" * 0x41])
+    app = make_app_image([b"\x33" * 0x2000, b"\x44" * 0x123])
+    image = bytearray(b"\xff" * 0x30000)
+    image[: len(bootloader)] = bootloader
+    table = make_partition_entry("nvs", 1, 2, 0x11000, 0x6000)
+    table += make_partition_entry("otadata", 1, 0, 0x17000, 0x2000)
+    table += make_partition_entry("factory", 0, 0, 0x20000, 0x100000)
+    image[PARTITION_TABLE_OFFSET : PARTITION_TABLE_OFFSET + len(table)] = table
+    image[0x20000 : 0x20000 + len(app)] = app
+    return bytes(image)
+
+
+def test_parse_app_image_reads_segments_and_validates_digests() -> None:
+    data = make_app_image([b"\x01" * 100, b"\x02" * 7])
+    image = parse_app_image(data)
+    assert image.size == len(data)
+    assert image.chip_id == 9
+    assert [s.size for s in image.segments] == [100, 7]
+
+    corrupted = bytearray(data)
+    corrupted[40] ^= 0xFF
+    with pytest.raises(FirmwareImageError):
+        parse_app_image(bytes(corrupted))
+
+
+def test_build_flash_plan_lists_bootloader_table_and_apps() -> None:
+    data = make_merged_image()
+    plan = build_flash_plan(data)
+    assert [(e.label, e.kind, e.offset, e.size) for e in plan[:4]] == [
+        ("bootloader", "bootloader", 0, plan[0].size),
+        ("partition_table", "partition_table", PARTITION_TABLE_OFFSET, 0x1000),
+        ("nvs", "data", 0x11000, 0x6000),
+        ("otadata", "data", 0x17000, 0x2000),
+    ]
+    assert (plan[4].label, plan[4].kind, plan[4].offset) == ("factory", "app", 0x20000)
+    assert plan[4].md5 == hashlib.md5(data[0x20000 : 0x20000 + plan[4].size]).hexdigest()
+
+    with pytest.raises(FirmwareImageError):
+        build_flash_plan(make_app_image([b"\x01" * 16], chip_id=0))
+
+
+def test_flash_image_by_plan_writes_only_changed_extents(
+    tmp_path: Path,
+    monkeypatch,
+    fake_esp,
+    fake_session_opener,
+) -> None:
+    data = make_merged_image()
+    path = tmp_path / "Codee.bin"
+    path.write_bytes(data)
+    flash = bytearray(data + b"\xff" * 0x10000)
+    flash[0x20100] ^= 0xFF
+    flash[0x17000:0x17020] = b"\x01" * 0x20  # otadata selecting a stale OTA slot
+    esp = fake_esp(bytes(flash))
+    monkeypatch.setattr("circuithack.fwimage.open_flash_session", fake_session_opener(esp))
+
+    result = flash_image_by_plan("/dev/null", path)
+
+    assert result["ok"] is True
+    assert [e["label"] for e in result["to_write"]] == ["otadata", "factory"]
+    assert [e["label"] for e in result["skipped"]] == ["bootloader", "partition_table", "nvs"]
+    assert esp.erases == [(0x17000, 0x1000)]  # blank in the image, so erased, not written
+    assert esp.writes == [(0x20000, result["to_write"][1]["size"])]
+    assert bytes(esp.flash[: len(data)]) == data
+
+    again = flash_image_by_plan("/dev/null", path)
+    assert again["to_write"] == [] and again["bytes_written"] == 0
+
+
+def test_pipeline_precompresses_the_extents_a_fresh_device_is_sent(
+    tmp_path: Path,
+    monkeypatch,
+    fake_esp,
+    fake_session_opener,
+) -> None:
+    path = tmp_path / "Codee.bin"
+    path.write_bytes(make_merged_image())
+    prepared = _prepare_firmware(path, skip_unchanged=True)
+    assert prepared["write_extents"] > 0
+
+    hits = []
+
+    def recording_payload(data: bytes) -> tuple[bytes, bool]:
+        payload, cached = compressed_payload(data)
+        hits.append(cached)
+        return payload, cached
+
+    esp = fake_esp(b"\xff" * 0x40000)
+    monkeypatch.setattr("circuithack.fwimage.open_flash_session", fake_session_opener(esp))
+    monkeypatch.setattr("circuithack.fwimage.compressed_payload", recording_payload)
+    assert flash_image_by_plan("/dev/null", path)["ok"]
+    assert len(hits) == prepared["write_extents"] and all(hits)
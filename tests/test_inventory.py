@@ -0,0 +1,89 @@
+from pathlib import Path
+
+import pytest
+
+from circuithack import inventory
+from circuithack.backup import backup_full_flash
+from circuithack.device import SerialDevice
+from circuithack.inventory import (
+    mac_from_esptool_output,
+    query_inventory,
+    record_backup,
+    record_flash,
+    record_scan,
+)
+
+
+def _device(path: str, serial: str) -> SerialDevice:
+    return SerialDevice(
+        path=path,
+        description="USB JTAG/serial debug unit",
+        manufacturer="Espressif",
+        product=None,
+        serial_number=serial,
+        vid=0x303A,
+        pid=0x1001,
+    )
+
+
+def test_scan_flash_and_backup_are_recorded_per_device(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    a = _device("/dev/ttyACM0", "DC:54:75:C0:FF:EE")
+    b = _device("/dev/ttyACM1", "DC:54:75:C0:00:01")
+    assert record_scan([a, b]) == 2
+
+    firmware = tmp_path / "Codee.bin"
+    firmware.write_bytes(b"\xE9" + bytes(0x3FFF))
+    # Unit b is replugged and now enumerates on a's old port.
+    moved = _device("/dev/ttyACM0", b.serial_number)
+    monkeypatch.setattr(inventory, "_port_info", lambda port: moved)
+    assert record_flash("/dev/ttyACM0", firmware)
+    assert record_backup("/dev/ttyACM0", tmp_path / "codee-fullflash-20260101-120000.bin")
+
+    by_mac = query_inventory(device="dc-54-75-c0-00-01")["devices"]
+    assert len(by_mac) == 1
+    assert by_mac[0]["port"] == "/dev/ttyACM0"
+    assert by_mac[0]["firmware_path"] == str(firmware)
+    assert [e["kind"] for e in by_mac[0]["events"]][-1] == "scan"
+    assert {e["kind"] for e in by_mac[0]["events"]} == {"scan", "flash", "backup"}
+
+    by_port = query_inventory(device="/dev/ttyACM0")["devices"]
+    assert [d["usb_serial"] for d in by_port] == [b.serial_number]
+    stale = query_inventory(stale_days=1)["devices"]
+    assert [d["usb_serial"] for d in stale] == [a.serial_number]
+    md5 = by_mac[0]["firmware_md5"]
+    assert [d["usb_serial"] for d in query_inventory(firmware_md5=md5)["devices"]] == [
+        b.serial_number
+    ]
+
+
+def test_recording_is_skipped_for_ports_without_a_usb_serial(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(inventory, "_port_info", lambda port: None)
+    assert not record_backup("rfc2217://localhost:4000", tmp_path / "state")
+    assert query_inventory()["devices"] == []
+
+
+def test_chip_mac_is_recorded_when_the_usb_serial_is_not_one(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+    fake_esp,
+    fake_session_opener,
+) -> None:
+    unit = _device("/dev/ttyUSB0", "0001A2B3")  # a USB-UART bridge with its own serial
+    monkeypatch.setattr(inventory, "_port_info", lambda port: unit)
+    esp = fake_esp(bytes(range(256)) * 0x100)
+    monkeypatch.setattr("circuithack.backup.open_flash_session", fake_session_opener(esp))
+
+    result = backup_full_flash("/dev/ttyUSB0", tmp_path, flash_size=len(esp.flash))
+    assert result["ok"] and result["mac"] == "dc:54:75:c0:ff:ee"
+
+    found = query_inventory(device="DC-54-75-C0-FF-EE")["devices"]
+    assert [d["usb_serial"] for d in found] == ["0001A2B3"]
+    assert mac_from_esptool_output("Chip type: ESP32-S3\nMAC:  DC:54:75:C0:FF:EE\n") == (
+        "dc:54:75:c0:ff:ee"
+    )
@@ -0,0 +1,77 @@
+from pathlib import Path
+
+import pytest
+
+from circuithack import micropython
+from circuithack.micropython import build_micropython_cached, write_frozen_manifest
+from circuithack.util import CommandResult
+
+
+def _repo(tmp_path: Path) -> Path:
+    repo = tmp_path / "micropython"
+    (repo / "ports" / "esp32" / "boards" / "CM_Codee").mkdir(parents=True)
+    (repo / "ports" / "esp32" / "boards" / "CM_Codee" / "manifest.py").write_text("")
+    return repo
+
+
+def _kit(tmp_path: Path) -> Path:
+    kit = tmp_path / "ports" / "codee"
+    kit.mkdir(parents=True)
+    (kit / "__init__.py").write_text("from .game import run\n")
+    (kit / "game.py").write_text("def run():\n    pass\n")
+    return kit
+
+
+def test_frozen_manifest_keeps_board_modules_and_adds_the_package(tmp_path: Path) -> None:
+    repo, kit = _repo(tmp_path), _kit(tmp_path)
+    manifest = write_frozen_manifest(repo, "CM_Codee", kit)
+
+    calls: list[tuple] = []
+    namespace = {
+        "include": lambda path: calls.append(("include", path)),
+        "package": lambda name, base_path: calls.append(("package", name, base_path)),
+    }
+    exec(manifest.read_text(), namespace)
+    board = repo.resolve() / "ports" / "esp32" / "boards" / "CM_Codee" / "manifest.py"
+    assert calls == [
+        ("include", str(board)),
+        ("package", "codee", str(kit.resolve().parent)),
+    ]
+
+
+def test_build_is_reused_until_commit_or_port_kit_changes(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    repo, kit = _repo(tmp_path), _kit(tmp_path)
+    revision = {"commit": "a" * 40}
+    builds: list[list[str]] = []
+
+    def fake_run_cmd(cmd: list[str], timeout: int = 0) -> CommandResult:
+        assert cmd[0] == "make"
+        builds.append(cmd)
+        firmware = repo / "ports" / "esp32" / "build-CM_Codee-frozen" / "firmware.bin"
+        firmware.write_bytes(b"\xE9" + bytes([len(builds)]))
+        return CommandResult(cmd=cmd, returncode=0, stdout="", stderr="")
+
+    monkeypatch.setattr(micropython, "repo_revision", lambda repo_dir: revision["commit"])
+    monkeypatch.setattr(micropython, "run_cmd", fake_run_cmd)
+
+    first = build_micropython_cached(repo, freeze_dir=kit)
+    assert first["ok"] and not first["cached"]
+    assert any(arg.startswith("FROZEN_MANIFEST=") for arg in builds[0])
+    again = build_micropython_cached(repo, freeze_dir=kit)
+    assert again["cached"] and again["firmware_path"] == first["firmware_path"]
+    assert Path(again["firmware_path"]).read_bytes() == b"\xE9\x01"
+    assert len(builds) == 1
+
+    (kit / "game.py").write_text("def run():\n    return 1\n")
+    assert not build_micropython_cached(repo, freeze_dir=kit)["cached"]
+    revision["commit"] = "b" * 40
+    assert not build_micropython_cached(repo, freeze_dir=kit)["cached"]
+    assert len(builds) == 3
+
+    revision["commit"] = None  # local changes in the checkout: always rebuild
+    assert not build_micropython_cached(repo, freeze_dir=kit)["cached"]
+    assert not build_micropython_cached(repo, freeze_dir=kit)["cached"]
+    assert len(builds) == 5
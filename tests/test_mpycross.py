@@ -0,0 +1,62 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+from circuithack import mpycross
+from circuithack.mpycross import MpyTarget, compile_port_kit
+
+FAKE_MPY_CROSS = """
+import sys
+args = sys.argv[1:]
+if args == ["--version"]:
+    print("MicroPython v1.22.2 on 2024-02-22; mpy-cross emitting mpy v6.2")
+    sys.exit(0)
+out = args[args.index("-o") + 1]
+with open(args[-1], "rb") as src, open(out, "wb") as dst:
+    dst.write(b"M\\x06" + " ".join(a for a in args if a.startswith("-march")).encode() + src.read())
+with open(__file__ + ".calls", "a") as log:
+    log.write(args[-1] + "\\n")
+"""
+
+
+@pytest.fixture
+def fake_mpy_cross(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    script = tmp_path / "mpy_cross.py"
+    script.write_text(FAKE_MPY_CROSS)
+    monkeypatch.setattr(mpycross, "mpy_cross_executable", lambda: [sys.executable, str(script)])
+    return Path(str(script) + ".calls")
+
+
+def test_from_sys_mpy_decodes_version_and_arch() -> None:
+    # ESP32-S3 MicroPython 1.22: mpy v6.2, native arch xtensawin.
+    target = MpyTarget.from_sys_mpy(6 | 2 << 8 | 10 << 10)
+    assert target == MpyTarget(version=6, sub_version=2, arch="xtensawin")
+
+
+def test_compile_port_kit_recompiles_only_changed_modules(
+    tmp_path: Path,
+    fake_mpy_cross: Path,
+) -> None:
+    src = tmp_path / "codee"
+    src.mkdir()
+    (src / "game_2048.py").write_text("SIZE = 4\n")
+    (src / "game_chess.py").write_text("BOARD = 8\n")
+    (src / "main.py").write_text("import codee\n")
+    out = tmp_path / "out"
+    target = MpyTarget(version=6, sub_version=2, arch="xtensawin")
+
+    first = compile_port_kit(src, out_dir=out, target=target)
+    assert first["ok"] and first["compiled"] == ["game_2048.py", "game_chess.py"]
+    assert sorted(p.name for p in out.iterdir()) == ["game_2048.mpy", "game_chess.mpy", "main.py"]
+    assert b"-march=xtensawin" in (out / "game_2048.mpy").read_bytes()
+
+    (src / "game_2048.py").write_text("SIZE = 5\n")
+    (src / "game_chess.py").unlink()
+    second = compile_port_kit(src, out_dir=out, target=target)
+    assert second["compiled"] == ["game_2048.py"] and second["cached"] == []
+    assert sorted(p.name for p in out.iterdir()) == ["game_2048.mpy", "main.py"]
+    assert len(fake_mpy_cross.read_text().splitlines()) == 3
+
+    mismatch = compile_port_kit(src, out_dir=out, target=MpyTarget(6, 3, "xtensawin"))
+    assert not mismatch["ok"] and "v6.2" in mismatch["error"]
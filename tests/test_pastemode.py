@@ -0,0 +1,117 @@
+import contextlib
+import io
+
+from circuithack.pastemode import PASTE_CHUNK_SIZE, PasteTransport
+
+
+class FriendlyRepl:
+    """Friendly REPL with paste mode and a small UART buffer that drops overflow.
+
+    The device only drains its receive buffer while the host is reading, so a host
+    that writes without waiting for the echo loses input.
+    """
+
+    RX_BUFFER = 2 * PASTE_CHUNK_SIZE
+
+    def __init__(self) -> None:
+        self.rx = bytearray()
+        self.out = bytearray()
+        self.paste: bytearray | None = None
+        self.dropped = 0
+        self.globals: dict = {}
+
+    @property
+    def in_waiting(self) -> int:
+        self._process()
+        return len(self.out)
+
+    def reset_input_buffer(self) -> None:
+        self.out.clear()
+
+    def write(self, data: bytes) -> int:
+        room = self.RX_BUFFER - len(self.rx)
+        self.rx += data[:room]
+        self.dropped += max(0, len(data) - room)
+        return len(data)
+
+    def read(self, size: int = 1) -> bytes:
+        self._process()
+        data = bytes(self.out[:size])
+        del self.out[:size]
+        return data
+
+    def _process(self) -> None:
+        while self.rx:
+            c = self.rx[:1]
+            del self.rx[:1]
+            if self.paste is None:
+                if c == b"\x03":
+                    self.out += b"\r\n>>> "
+                elif c == b"\x05":
+                    self.out += b"\r\npaste mode; Ctrl-C to cancel, Ctrl-D to finish\r\n=== "
+                    self.paste = bytearray()
+            elif c == b"\x04":
+                self.out += b"\r\n"
+                finished = self._run(self.paste.decode())
+                self.paste = None
+                if finished:
+                    self.out += b">>> "
+            elif c == b"\r":
+                self.paste += b"\n"
+                self.out += b"\r\n=== "
+            else:
+                self.paste += c
+                self.out += c
+
+    def _run(self, source: str) -> bool:
+        if source.startswith("while True:"):
+            self.out += b"tick\r\n"
+            return False  # still running, so no prompt comes back
+        stdout = io.StringIO()
+        try:
+            with contextlib.redirect_stdout(stdout):
+                exec(source, self.globals)
+        except Exception as exc:  # noqa: BLE001 - reported like the device does
+            stdout.write(f"Traceback (most recent call last):\n{type(exc).__name__}: {exc}\n")
+        self.out += stdout.getvalue().replace("\n", "\r\n").encode()
+        return True
+
+
+def test_large_script_is_paced_by_the_echo_and_ends_at_the_prompt() -> None:
+    repl = FriendlyRepl()
+    lines = [f"x{i} = {i}  # {'padding ' * 20}" for i in range(200)]
+    names = ", ".join(f"x{i}" for i in range(200))
+    source = "\n".join([*lines, f"print('>>> total', sum([{names}]))"])
+
+    result = PasteTransport(repl, echo_timeout=1).paste(source, timeout=30)
+
+    assert repl.dropped == 0
+    assert result.completed and result.ok
+    assert result.stdout == f">>> total {sum(range(200))}\n"
+    assert result.traceback == ""
+    assert result.seconds < 5  # no fixed read window
+
+
+def test_traceback_and_sentinel_are_split_from_stdout() -> None:
+    repl = FriendlyRepl()
+    transport = PasteTransport(repl, echo_timeout=1)
+
+    failed = transport.paste("print('before')\nraise ValueError('boom')\n")
+    assert failed.completed and not failed.ok
+    assert failed.stdout == "before\n"
+    assert failed.traceback == "Traceback (most recent call last):\nValueError: boom\n"
+
+    script = "print('ready')\nprint('@@done@@')\nprint('game loop')\n"
+    done = transport.paste(script, sentinel="@@done@@")
+    assert done.completed and done.ok
+    assert done.stdout == "ready\n"
+
+
+def test_script_still_running_at_the_timeout_is_not_ok() -> None:
+    repl = FriendlyRepl()
+
+    result = PasteTransport(repl, echo_timeout=1).paste("while True:\n    pass\n", timeout=0.2)
+
+    assert not result.completed and not result.ok
+    assert result.stdout == "tick\n"
+    assert "still be running" in result.error
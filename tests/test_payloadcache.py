@@ -0,0 +1,66 @@
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import circuithack.payloadcache as payloadcache
+from circuithack.payloadcache import compressed_payload, payload_key, write_image_cached
+
+
+def test_compressed_payload_compresses_once_across_threads_and_runs(monkeypatch) -> None:
+    data = bytes(range(256)) * 512
+    calls = []
+    real_compress = zlib.compress
+    monkeypatch.setattr(
+        "circuithack.payloadcache.zlib.compress",
+        lambda raw, level: calls.append(level) or real_compress(raw, level),
+    )
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: compressed_payload(data), range(8)))
+    assert len(calls) == 1
+    assert sum(1 for _, cached in results if not cached) == 1
+    assert zlib.decompress(results[0][0]) == data
+
+    # A fresh process only has the on-disk copy.
+    payloadcache._memory.clear()
+    payload, cached = compressed_payload(data)
+    assert cached is True and len(calls) == 1
+    assert payload == results[0][0]
+
+
+def test_write_image_cached_streams_payload_and_checks_md5(
+    tmp_path: Path,
+    monkeypatch,
+    fake_esp,
+    fake_session_opener,
+) -> None:
+    image = tmp_path / "Codee.bin"
+    image.write_bytes(bytes(range(256)) * 0x100)
+    esps = [fake_esp(b"\xff" * 0x20000) for _ in range(2)]
+
+    results = []
+    for esp in esps:
+        monkeypatch.setattr("circuithack.payloadcache.open_flash_session", fake_session_opener(esp))
+        results.append(write_image_cached("/dev/null", image))
+
+    assert [r["ok"] for r in results] == [True, True]
+    assert [r["payload_cached"] for r in results] == [False, True]
+    assert all(bytes(esp.flash[: 0x10000]) == image.read_bytes() for esp in esps)
+
+
+def test_payload_cache_evicts_least_recently_used_beyond_its_cap(monkeypatch) -> None:
+    blobs = [os.urandom(4096) for _ in range(3)]  # incompressible, so ~4 KiB each on disk
+    monkeypatch.setattr(payloadcache, "PAYLOAD_CACHE_MAX_BYTES", 10_000)
+    paths = []
+    for age, blob in enumerate(blobs[:2]):
+        compressed_payload(blob)
+        paths.append(payloadcache.payload_cache_dir() / f"{payload_key(blob)}.zlib")
+        os.utime(paths[-1], (1000 + age, 1000 + age))
+    payloadcache._memory.clear()
+    assert compressed_payload(blobs[0])[1] is True  # a hit makes the older one most recent
+
+    compressed_payload(blobs[2])
+
+    assert paths[0].exists() and not paths[1].exists()
+    assert payloadcache.prune_payload_cache(max_bytes=0)["cache_bytes"] == 0
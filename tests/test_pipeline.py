@@ -0,0 +1,83 @@
+import threading
+import time
+
+import pytest
+
+from circuithack.pipeline import DeviceJob, Stage, find_bottleneck, run_pipeline, run_stages
+
+
+def test_run_stages_overlaps_devices_and_respects_limits() -> None:
+    lock = threading.Lock()
+    active = {"fast": 0, "slow": 0}
+    peak = {"fast": 0, "slow": 0}
+    order: list[tuple[str, str]] = []
+
+    def make(name: str, delay: float):
+        def run(job: DeviceJob) -> dict:
+            with lock:
+                active[name] += 1
+                peak[name] = max(peak[name], active[name])
+                order.append((name, job.port))
+            time.sleep(delay)
+            with lock:
+                active[name] -= 1
+            return {"ok": job.port != "bad" or name != "fast"}
+
+        return run
+
+    jobs = [DeviceJob(port=p, device=p) for p in ("a", "b", "bad", "c")]
+    stages = [
+        Stage("fast", make("fast", 0.01), concurrency=4),
+        Stage("slow", make("slow", 0.03), concurrency=1),
+    ]
+    jobs, reports, _ = run_stages(jobs, stages)
+
+    assert peak["slow"] == 1
+    assert peak["fast"] > 1
+    bad = next(j for j in jobs if j.port == "bad")
+    assert (bad.ok, bad.failed_stage) == (False, "fast")
+    assert ("slow", "bad") not in order
+    by_stage = {r["stage"]: r for r in reports}
+    assert by_stage["fast"]["processed"] == 4 and by_stage["fast"]["failed"] == 1
+    assert by_stage["slow"]["processed"] == 3
+    assert by_stage["slow"]["max_queue_depth"] >= 1
+    assert find_bottleneck(reports) == "slow"
+
+
+def test_run_pipeline_runs_selected_stages_per_device(tmp_path, monkeypatch) -> None:
+    deploy_dir = tmp_path / "codee"
+    deploy_dir.mkdir()
+    (deploy_dir / "codee_display.py").write_text("x = 1\n")
+    copied: list[tuple[str, str]] = []
+
+    class Ok:
+        ok = True
+        stdout = ""
+        stderr = ""
+
+    monkeypatch.setattr("circuithack.pipeline.serial_number_for_port", lambda port: None)
+    monkeypatch.setattr("circuithack.pipeline.enter_programmer_mode", lambda port, baud: Ok())
+    monkeypatch.setattr(
+        "circuithack.pipeline.deploy_port_kit",
+        lambda port, src_dir, remote_dir: {
+            "ok": True,
+            "uploaded": [copied.append((port, p.name)) for p in sorted(src_dir.glob("*.py"))],
+        },
+    )
+
+    result = run_pipeline(
+        ports=["/dev/a", "/dev/b"],
+        stages=("deploy", "detect"),
+        deploy_dir=deploy_dir,
+        out_dir=tmp_path / "backups",
+    )
+
+    assert result["ok"] is True
+    assert [r["stage"] for r in result["stages"]] == ["detect", "deploy"]
+    assert sorted(copied) == [("/dev/a", "codee_display.py"), ("/dev/b", "codee_display.py")]
+    assert result["firmware_path"] is None
+
+
+def test_run_pipeline_rejects_unknown_stages() -> None:
+    with pytest.raises(ValueError):
+        run_pipeline(ports=["/dev/a"], stages=("flash", "reboot"))
@@ -0,0 +1,96 @@
+import threading
+from pathlib import Path
+
+import pytest
+
+from circuithack import probe
+from circuithack.device import SerialDevice
+from circuithack.probe import probe_devices
+
+
+class FakePort:
+    def __init__(self, port: str) -> None:
+        self.port = port
+        self.closed = threading.Event()
+
+    def open(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed.set()
+
+
+def _device(path: Path, serial: str | None) -> SerialDevice:
+    return SerialDevice(
+        path=str(path),
+        description="USB JTAG/serial debug unit",
+        manufacturer="Espressif",
+        product=None,
+        serial_number=serial,
+        vid=0x303A,
+        pid=0x1001,
+    )
+
+
+def test_probe_runs_in_parallel_and_caches_until_replug(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    ports = [tmp_path / "ttyACM0", tmp_path / "ttyACM1"]
+    for port in ports:
+        port.touch()
+    devices = [_device(ports[0], "AA"), _device(ports[1], "BB")]
+    monkeypatch.setattr(probe, "codee_candidates", lambda: devices)
+    monkeypatch.setattr(probe, "list_serial_devices", lambda only_likely_usb: devices)
+    both_connected = threading.Barrier(2, timeout=2)
+    handshakes: list[str] = []
+
+    def handshake(port: str) -> tuple[str, str, int]:
+        handshakes.append(port)
+        both_connected.wait()  # deadlocks unless both ports are probed at once
+        return "ESP32-S3 (QFN56) (revision v0.2)", f"dc:54:75:00:00:{port[-1]}0", 0x400000
+
+    monkeypatch.setattr(probe, "_handshake", handshake)
+    first = probe_devices()
+    assert first["ok"] and first["probed"] == 2
+    assert [d["flash_size"] for d in first["devices"]] == [0x400000, 0x400000]
+
+    again = probe_devices()
+    assert again["probed"] == 0 and again["cached"] == 2
+    assert {d["source"] for d in again["devices"]} == {"cache"}
+
+    ports[1].unlink()
+    ports[1].touch()  # replugged: a fresh device node
+    monkeypatch.setattr(probe, "_handshake", lambda port: ("ESP32-S3", "dc:54:75:00:00:01", None))
+    replugged = probe_devices()
+    assert [d["source"] for d in replugged["devices"]] == ["cache", "probe"]
+
+
+def test_probe_reports_failures_and_timeouts_per_port(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(probe, "list_serial_devices", lambda only_likely_usb: [])
+    opened: dict[str, FakePort] = {}
+
+    def serial_for_url(port: str, **kwargs) -> FakePort:
+        opened[port] = FakePort(port)
+        return opened[port]
+
+    def detect_chip(port: FakePort, **kwargs) -> None:
+        if port.port == "slow":
+            port.closed.wait(5)  # a handshake that never answers until its port is closed
+            raise OSError("Attempting to use a port that is not open")
+        raise RuntimeError("Failed to connect to ESP32-S3: No serial data received.")
+
+    monkeypatch.setattr(probe, "serial_for_url", serial_for_url)
+    monkeypatch.setattr(probe, "detect_chip", detect_chip)
+    result = probe_devices(ports=["slow", "dead"], timeout=0.2)
+
+    assert not result["ok"]
+    errors = {d["port"]: d["error"] for d in result["devices"]}
+    assert errors["slow"].startswith("No answer")
+    assert "No serial data" in errors["dead"]
+    assert all(p.closed.is_set() for p in opened.values())
+    assert result["seconds"] < 2
+    assert not probe._probe_ports
@@ -0,0 +1,116 @@
+import sys
+from pathlib import Path
+
+import anyio
+
+from circuithack.backup import backup_full_flash
+from circuithack.progress import (
+    ProgressTracker,
+    esptool_output_handler,
+    parse_esptool_progress,
+)
+from circuithack.util import run_cmd
+
+
+def test_parse_esptool_progress_handles_v5_and_v4_lines() -> None:
+    v5 = "Writing at 0x00010000 [=========>                    ]  33.3% 131072/393216 bytes..."
+    assert parse_esptool_progress(v5) == ("write", 33.3, 131072, 393216)
+    assert parse_esptool_progress("Reading from 0x00000000 [==>  ]  5.0% 4096/81920 bytes...") == (
+        "read",
+        5.0,
+        4096,
+        81920,
+    )
+    assert parse_esptool_progress("Writing at 0x00014000... (45 %)") == ("write", 45.0, None, None)
+    assert parse_esptool_progress("Connecting....") is None
+
+
+def test_tracker_throttles_and_reports_rate_and_eta() -> None:
+    now = [0.0]
+    events = []
+    tracker = ProgressTracker("read", events.append, min_interval=1.0, clock=lambda: now[0])
+    tracker.update(0, 1000)
+    now[0] = 0.5
+    tracker.update(250, 1000)
+    now[0] = 2.0
+    tracker.update(500, 1000)
+    now[0] = 4.0
+    tracker.update(1000, 1000)
+
+    assert [e.percent for e in events] == [0.0, 50.0, 100.0]
+    assert events[1].bytes_per_second == 250.0
+    assert events[1].eta_seconds == 2.0
+    assert events[-1].finished
+
+
+def test_run_cmd_streams_carriage_return_progress_lines() -> None:
+    script = (
+        "import sys\n"
+        "for pct in (10, 60, 100):\n"
+        "    sys.stdout.write(f'\\rWriting at 0x00000000 [==]  {pct}.0% {pct}/100 bytes...')\n"
+        "    sys.stdout.flush()\n"
+        "print()\n"
+    )
+    events = []
+    res = run_cmd([sys.executable, "-c", script], on_line=esptool_output_handler(events.append))
+
+    assert res.ok
+    assert "Writing at" in res.stdout
+    assert events[0].percent == 10.0
+    assert events[-1].percent == 100.0
+    assert events[-1].bytes_total == 100
+
+
+def test_backup_full_flash_reports_progress(
+    tmp_path: Path,
+    monkeypatch,
+    fake_esp,
+    fake_session_opener,
+) -> None:
+    esp = fake_esp(bytes(range(256)) * 0x1000)
+    monkeypatch.setattr("circuithack.backup.open_flash_session", fake_session_opener(esp))
+    events = []
+
+    result = backup_full_flash("/dev/null", tmp_path, flash_size=len(esp.flash), progress=events.append)
+
+    assert result["ok"] is True
+    assert {e.stage for e in events} == {"backup_fullflash"}
+    assert events[0].bytes_done == 0
+    assert events[-1].bytes_done == len(esp.flash)
+    assert events[-1].finished
+
+
+class FakeContext:
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+        self.reports: list[tuple[float, float, str]] = []
+
+    async def report_progress(self, progress: float, total: float, message: str) -> None:
+        if self.fail:
+            raise ConnectionError("client went away")
+        self.reports.append((progress, total, message))
+
+
+def test_mcp_progress_relay_works_from_subprocess_reader_threads() -> None:
+    from circuithack.mcp_server import _run_with_progress
+
+    script = (
+        "import sys\n"
+        "for pct in (10, 60, 100):\n"
+        "    sys.stdout.write(f'\\rWriting at 0x00000000 [==]  {pct}.0% {pct}/100 bytes...')\n"
+        "print()\n"
+        "print('Hash of data verified.')\n"
+    )
+
+    def flow(progress):
+        # esptool_output_handler fires on the pipe reader threads, not AnyIO workers.
+        return run_cmd([sys.executable, "-c", script], on_line=esptool_output_handler(progress))
+
+    ctx = FakeContext()
+    res = anyio.run(_run_with_progress, ctx, flow)
+    assert res.ok
+    assert [r[0] for r in ctx.reports][-1] == 100.0
+
+    failing = anyio.run(_run_with_progress, FakeContext(fail=True), flow)
+    assert failing.ok
+    assert "Hash of data verified." in failing.stdout  # the reader kept draining the pipe
@@ -0,0 +1,101 @@
+from pathlib import Path
+
+from circuithack.flashmap import Extent
+from circuithack.partitions import (
+    PARTITION_TABLE_OFFSET,
+    PARTITION_TABLE_SIZE,
+    PartitionEntry,
+    parse_partition_table_bytes,
+)
+from circuithack.repartition import (
+    encode_partition_table,
+    parse_layout_csv,
+    plan_repartition,
+    repartition_device,
+)
+
+CURRENT_CSV = """
+# Name, Type, SubType, Offset, Size, Flags
+nvs,      data, nvs,     0x11000, 0x6000,
+phy_init, data, phy,     ,        4K,
+factory,  app,  factory, 0x20000, 1M,
+storage,  data, spiffs,  ,        0x80000,
+"""
+
+TARGET_CSV = """
+nvs,      data, nvs,     0x11000,  0x6000,
+phy_init, data, phy,     0x17000,  4K,
+factory,  app,  factory, 0x20000,  0x1E0000,
+storage,  data, spiffs,  0x200000, 0x200000,
+"""
+
+
+def test_parse_layout_csv_packs_offsets_and_encodes_table() -> None:
+    entries = parse_layout_csv(CURRENT_CSV)
+    assert [(e.label, e.offset, e.size) for e in entries] == [
+        ("nvs", 0x11000, 0x6000),
+        ("phy_init", 0x17000, 0x1000),
+        ("factory", 0x20000, 0x100000),
+        ("storage", 0x120000, 0x80000),
+    ]
+    assert entries[3].subtype == 0x82
+
+    table = encode_partition_table(entries)
+    assert len(table) == PARTITION_TABLE_SIZE
+    assert parse_partition_table_bytes(table) == entries
+
+
+def test_plan_repartition_moves_only_affected_partitions() -> None:
+    plan = plan_repartition(parse_layout_csv(CURRENT_CSV), parse_layout_csv(TARGET_CSV))
+    actions = {r.label: r.action for r in plan.relocations}
+
+    assert actions == {"nvs": "keep", "phy_init": "keep", "factory": "resize", "storage": "move"}
+    assert [r.label for r in plan.backups] == ["storage"]
+    assert plan.bytes_to_write == PARTITION_TABLE_SIZE + 0x80000
+    assert plan.fill == [Extent(0x120000, 0xE0000), Extent(0x280000, 0x180000)]
+    assert plan.to_dict()["estimated_seconds"] > 0
+
+
+def test_plan_repartition_orders_overlapping_moves_like_memmove() -> None:
+    def part(label: str, offset: int) -> PartitionEntry:
+        return PartitionEntry(label=label, type=1, subtype=0x82, offset=offset, size=0x100000, flags=0)
+
+    current = [part("a", 0x100000), part("b", 0x200000)]
+    target = [part("a", 0x200000), part("b", 0x300000)]
+
+    plan = plan_repartition(current, target)
+
+    assert [r.label for r in plan.moves] == ["b", "a"]
+    assert plan.order_has_cycle is False
+
+
+def test_repartition_device_backs_up_relocates_and_writes_table(
+    monkeypatch, tmp_path: Path, fake_esp, fake_session_opener
+) -> None:
+    flash = bytearray(b"\xff" * 0x400000)
+    current = parse_layout_csv(CURRENT_CSV)
+    flash[PARTITION_TABLE_OFFSET : PARTITION_TABLE_OFFSET + PARTITION_TABLE_SIZE] = (
+        encode_partition_table(current)
+    )
+    flash[0x120000:0x121000] = b"\x5a" * 0x1000
+    flash[0x1A0000:0x1A1000] = b"\x00" * 0x1000  # stale bytes where factory grows
+    esp = fake_esp(bytes(flash))
+    monkeypatch.setattr("circuithack.repartition.open_flash_session", fake_session_opener(esp))
+    layout = tmp_path / "partitions.csv"
+    layout.write_text(TARGET_CSV)
+    plans: list[dict] = []
+
+    dry = repartition_device("p", layout, out_dir=tmp_path / "bk", on_plan=plans.append)
+    assert dry["ok"] is True and esp.writes == []
+
+    result = repartition_device("p", layout, out_dir=tmp_path / "bk", dry_run=False)
+
+    assert result["ok"] is True
+    assert plans[0]["move_order"] == ["storage"]
+    table = bytes(esp.flash[PARTITION_TABLE_OFFSET : PARTITION_TABLE_OFFSET + PARTITION_TABLE_SIZE])
+    assert parse_partition_table_bytes(table) == parse_layout_csv(TARGET_CSV)
+    assert bytes(esp.flash[0x200000:0x201000]) == b"\x5a" * 0x1000
+    assert bytes(esp.flash[0x1A0000:0x1A1000]) == b"\xff" * 0x1000
+    # Only the one sector with data was written; blank sectors of storage were skipped.
+    assert (0x200000, 0x1000) in esp.writes
+    assert Path(result["backups"]["storage"]).read_bytes()[:0x1000] == b"\x5a" * 0x1000
@@ -0,0 +1,116 @@
+from pathlib import Path
+
+import pytest
+from mpremote.transport import TransportError
+
+from circuithack import replsession
+from circuithack.replsession import ReplPool
+from circuithack.runner import run_repl_ops
+
+
+class FakeTransport:
+    """Raw-REPL stand-in: executes nothing, records what a device would receive."""
+
+    opened: list[str] = []
+
+    def __init__(self, port: str, baudrate: int) -> None:
+        self.opened.append(port)
+        self.in_raw_repl = False
+        self.raw_entries = 0
+        self.soft_resets = 0
+        self.files: dict[str, bytes] = {}
+        self.closed = False
+        self.fail_next = False
+
+    def enter_raw_repl(self, soft_reset: bool = True) -> None:
+        self.raw_entries += 1
+        self.soft_resets += soft_reset
+        self.in_raw_repl = True
+
+    def exit_raw_repl(self) -> None:
+        self.in_raw_repl = False
+
+    def exec_raw(self, code: bytes, timeout: float = 10) -> tuple[bytes, bytes]:
+        if self.fail_next:
+            raise TransportError("could not enter raw repl")
+        if b"raise" in code:
+            return b"", b"Traceback (most recent call last):\r\nValueError: boom\r\n"
+        return b"hello\r\n", b""
+
+    def eval(self, expression: str) -> object:
+        return len(self.files)
+
+    def fs_writefile(self, dest: str, data: bytes, chunk_size: int = 256) -> None:
+        self.files[dest] = data
+
+    def close(self) -> None:
+        self.closed = True
+
+
+@pytest.fixture
+def pool(monkeypatch: pytest.MonkeyPatch) -> ReplPool:
+    FakeTransport.opened = []
+    pool = ReplPool()
+    monkeypatch.setattr(replsession, "SerialTransport", FakeTransport)
+    monkeypatch.setattr(replsession, "_pool", pool)
+    return pool
+
+
+def test_repl_ops_share_one_connection(pool: ReplPool, tmp_path: Path) -> None:
+    script = tmp_path / "hello.py"
+    script.write_text("print('hello')\n")
+    ops = [("cp", f"{script}:lib/hello.py"), ("run", str(script))] * 4 + [("eval", "n")] * 2
+
+    result = run_repl_ops("/dev/ttyACM0", ops)
+
+    assert result["ok"] and len(result["steps"]) == 10
+    assert FakeTransport.opened == ["/dev/ttyACM0"]
+    assert result["sessions"][0]["operations"] == 10
+    assert result["steps"][-1]["value"] == 1
+    with pool.session("/dev/ttyACM0") as session:
+        # The first raw-REPL entry soft-resets, and so does every script run.
+        assert session.transport.soft_resets == 1 + 4
+
+    result = run_repl_ops("/dev/ttyACM0", [("run", str(script))] * 3, soft_reset=False)
+    assert result["ok"]
+    with pool.session("/dev/ttyACM0") as session:
+        assert session.transport.soft_resets == 5
+    assert FakeTransport.opened == ["/dev/ttyACM0"]
+
+
+def test_first_raw_repl_entry_soft_resets_and_releasing_the_port_closes_it(
+    pool: ReplPool,
+) -> None:
+    from circuithack.util import release_port
+
+    replsession.repl_eval("/dev/ttyACM0", "1")
+    replsession.repl_eval("/dev/ttyACM0", "1")
+    with pool.session("/dev/ttyACM0") as session:
+        transport = session.transport
+    assert (transport.raw_entries, transport.soft_resets) == (1, 1)
+
+    release_port("/dev/ttyACM0")  # what esptool launches do first
+    assert transport.closed and pool.sessions() == []
+
+
+def test_device_errors_keep_the_session_and_transport_errors_drop_it(
+    pool: ReplPool,
+    tmp_path: Path,
+) -> None:
+    bad = tmp_path / "bad.py"
+    bad.write_text("raise ValueError('boom')\n")
+    result = run_repl_ops("/dev/ttyACM0", [("run", str(bad)), ("eval", "1")])
+    assert not result["ok"] and len(result["steps"]) == 1
+    assert "ValueError: boom" in result["steps"][0]["stderr"]
+    assert len(pool.sessions()) == 1
+
+    with pool.session("/dev/ttyACM0") as session:
+        session.transport.fail_next = True
+        transport = session.transport
+    assert not run_repl_ops("/dev/ttyACM0", [("run", str(bad))])["ok"]
+    assert transport.closed and pool.sessions() == []
+
+    run_repl_ops("/dev/ttyACM0", [("eval", "1")])
+    assert FakeTransport.opened == ["/dev/ttyACM0", "/dev/ttyACM0"]
+    assert replsession.release_repl_session("/dev/ttyACM0")
+    assert pool.sessions() == []
@@ -0,0 +1,103 @@
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from circuithack.flashsession import FlashSession
+from circuithack.resumable import (
+    ResumableReadError,
+    _save_checkpoint,
+    checkpoint_path,
+    find_resumable_read,
+    read_flash_resumable,
+)
+
+
+def test_resumable_read_continues_after_failure(tmp_path: Path, fake_esp) -> None:
+    image = bytes(range(256)) * (0x40000 // 256)
+    esp = fake_esp(image)
+    fail_at = {"offset": 0x20000}
+    original_read = esp.read_flash
+
+    def flaky_read(offset: int, length: int, progress_fn=None) -> bytes:
+        if offset == fail_at["offset"]:
+            raise OSError("USB hiccup")
+        return original_read(offset, length, progress_fn)
+
+    esp.read_flash = flaky_read
+    session = FlashSession(esp=esp)
+    out = tmp_path / "codee-fullflash-20260101-000000.bin"
+
+    with pytest.raises(ResumableReadError) as excinfo:
+        read_flash_resumable(session, 0, len(image), out, chunk_size=0x10000)
+    assert excinfo.value.progress.chunks_done == 2
+    assert checkpoint_path(out).exists()
+    mac = session.mac()
+    assert find_resumable_read(tmp_path, "codee-fullflash-*.bin", 0, len(image), mac) == out
+    assert find_resumable_read(tmp_path, "codee-fullflash-*.bin", 0, len(image), "other") is None
+
+    fail_at["offset"] = -1
+    esp.reads.clear()
+    progress = read_flash_resumable(session, 0, len(image), out, chunk_size=0x10000)
+
+    assert progress.resumed_chunks == 2
+    assert progress.chunks_done == progress.chunks_total == 4
+    assert esp.reads == [(0x20000, 0x10000), (0x30000, 0x10000)]
+    assert esp.md5_calls == [(0, 0x10000), (0x10000, 0x10000)]
+    assert out.read_bytes() == image
+    assert not checkpoint_path(out).exists()
+
+
+def test_resumable_read_rereads_chunks_damaged_on_disk(tmp_path: Path, fake_esp) -> None:
+    image = b"\x5a" * 0x20000
+    session = FlashSession(esp=fake_esp(image))
+    out = tmp_path / "codee-nvs-20260101-000000.bin"
+    read_flash_resumable(session, 0, len(image), out, chunk_size=0x10000)
+
+    # Simulate an interrupted run whose first chunk was corrupted on disk afterwards.
+    digests = {0: hashlib.md5(image[:0x10000]).hexdigest()}
+    _save_checkpoint(out, 0, len(image), 0x10000, digests, session.mac())
+    out.write_bytes(b"\x00" * 0x10000)
+
+    progress = read_flash_resumable(session, 0, len(image), out, chunk_size=0x10000)
+    assert progress.resumed_chunks == 0
+    assert out.read_bytes() == image
+
+
+def _interrupted_read(tmp_path: Path, fake_esp, image: bytes):
+    esp = fake_esp(image)
+    original_read = esp.read_flash
+
+    def flaky_read(offset: int, length: int, progress_fn=None) -> bytes:
+        if offset == 0x10000:
+            raise OSError("USB hiccup")
+        return original_read(offset, length, progress_fn)
+
+    esp.read_flash = flaky_read
+    out = tmp_path / "codee-fullflash-20260101-000000.bin"
+    with pytest.raises(ResumableReadError):
+        read_flash_resumable(FlashSession(esp=esp), 0, len(image), out, chunk_size=0x10000)
+    return out
+
+
+def test_resume_refuses_a_partial_read_from_another_device(tmp_path: Path, fake_esp) -> None:
+    image = b"\x11" * 0x20000
+    out = _interrupted_read(tmp_path, fake_esp, image)
+
+    other = fake_esp(b"\x22" * 0x20000)
+    other.MAC = b"\xdc\x54\x75\x00\x00\x01"
+    with pytest.raises(ResumableReadError, match="not dc:54:75:00:00:01"):
+        read_flash_resumable(FlashSession(esp=other), 0, len(image), out, chunk_size=0x10000)
+    assert other.reads == []
+    assert out.read_bytes()[:0x10000] == image[:0x10000]
+
+
+def test_resume_rereads_chunks_that_changed_on_the_device(tmp_path: Path, fake_esp) -> None:
+    image = b"\x11" * 0x20000
+    out = _interrupted_read(tmp_path, fake_esp, image)
+
+    changed = fake_esp(b"\x33" * 0x20000)  # same device, flash rewritten since the failure
+    progress = read_flash_resumable(FlashSession(esp=changed), 0, len(image), out, 0x10000)
+
+    assert progress.resumed_chunks == 0
+    assert out.read_bytes() == b"\x33" * 0x20000
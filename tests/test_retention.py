@@ -0,0 +1,119 @@
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+from circuithack.backup import write_full_flash_manifest
+from circuithack.backupstore import add_snapshot
+from circuithack.device import SerialDevice
+from circuithack.inventory import record_backup
+from circuithack.retention import RetentionPolicy, apply_retention, audit_backups, select_retained
+
+
+def test_select_retained_combines_last_daily_and_weekly() -> None:
+    now = datetime(2026, 3, 18, 12, 0)  # a Wednesday
+    created = [
+        datetime(2026, 3, 18, 9, 0),
+        datetime(2026, 3, 18, 8, 0),
+        datetime(2026, 3, 17, 23, 0),
+        datetime(2026, 3, 10, 10, 0),
+        datetime(2026, 3, 9, 10, 0),
+        datetime(2026, 2, 1, 10, 0),
+    ]
+
+    assert select_retained(created, RetentionPolicy(keep_last=2), now) == {0, 1}
+    assert select_retained(created, RetentionPolicy(keep_daily=2), now) == {0, 2}
+    assert select_retained(created, RetentionPolicy(keep_weekly=2), now) == {0, 3}
+    with pytest.raises(ValueError):
+        RetentionPolicy()
+
+
+def _backup(directory: Path, label: str, ts: str, size: int = 0x1000) -> Path:
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"codee-{label}-{ts}.bin"
+    path.write_bytes(bytes([len(ts) % 256]) * size)
+    return path
+
+
+def test_apply_retention_prunes_per_device_and_keeps_unfinished_reads(tmp_path: Path) -> None:
+    root = tmp_path / "backups"
+    old = _backup(root / "fleet" / "SERIAL_A", "fullflash", "20260101-120000")
+    write_full_flash_manifest(old, old.read_bytes(), port="p")
+    new = _backup(root / "fleet" / "SERIAL_A", "fullflash", "20260102-120000")
+    other = _backup(root / "fleet" / "SERIAL_B", "fullflash", "20260101-120000")
+    partial = _backup(root, "nvs", "20251201-120000")
+    (partial.parent / (partial.name + ".ckpt.json")).write_text("{}")
+    _backup(root, "nvs", "20260102-120000")
+
+    result = apply_retention(
+        root,
+        RetentionPolicy(keep_last=1),
+        store_dir=root / "store",
+        dry_run=False,
+        now=datetime(2026, 1, 3),
+    )
+
+    assert result["backups_removed"] == 1
+    assert not old.exists() and not old.with_suffix(".json").exists()
+    assert new.exists() and other.exists() and partial.exists()
+    assert result["reclaimed_bytes_by_device"] == {"SERIAL_A": result["reclaimed_bytes"]}
+    assert result["kept_in_progress"] == 1
+
+
+def test_retention_groups_by_device_serial_and_skips_safety_copies(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    root = tmp_path / "backups"
+    a_old = _backup(root, "fullflash", "20260101-120000")
+    a_new = _backup(root, "fullflash", "20260102-120000")
+    b_only = _backup(root, "fullflash", "20260101-130000")
+    for path, serial in ((a_old, "SERIAL_A"), (a_new, "SERIAL_A"), (b_only, "SERIAL_B")):
+        monkeypatch.setattr("circuithack.backup.serial_number_for_port", lambda port, s=serial: s)
+        write_full_flash_manifest(path, path.read_bytes(), port="/dev/ttyACM0")
+    # Partition dumps carry no manifest; the inventory knows which device they came from.
+    nvs_old = _backup(root, "nvs", "20260101-120000")
+    nvs_new = _backup(root, "nvs", "20260102-120000")
+    device = SerialDevice("/dev/ttyACM0", "Codee", None, None, "SERIAL_A", 0x303A, 0x1001)
+    monkeypatch.setattr("circuithack.inventory._port_info", lambda port: device)
+    record_backup("/dev/ttyACM0", root, kind="backup_state", files=[nvs_old, nvs_new])
+    stray = _backup(root, "nvs", "20251201-120000")
+    safety = _backup(root / "repartition" / "20260101-120000", "storage", "20250101-120000")
+    # A folder of the user's own is not a device, unlike fleet/<usb-serial>/.
+    mine = [_backup(root / "old", "nvs", f"2025010{d}-120000") for d in (1, 2)]
+
+    preview = apply_retention(root, RetentionPolicy(keep_last=1), store_dir=None)
+    assert preview["dry_run"] is True and a_old.exists()
+
+    result = apply_retention(root, RetentionPolicy(keep_last=1), store_dir=None, dry_run=False)
+
+    assert result["backups_removed"] == 2
+    assert not a_old.exists() and not nvs_old.exists()
+    assert a_new.exists() and b_only.exists() and nvs_new.exists()
+    assert stray.exists() and safety.exists() and all(p.exists() for p in mine)
+    assert result["kept_unidentified"] == 3
+    assert list(result["reclaimed_bytes_by_device"]) == ["SERIAL_A"]
+
+
+def test_audit_backups_flags_corrupted_images_and_sectors(tmp_path: Path) -> None:
+    root = tmp_path / "backups"
+    good = _backup(root, "fullflash", "20260101-120000", size=0x20000)
+    write_full_flash_manifest(good, good.read_bytes(), port="p")
+    bad = _backup(root, "fullflash", "20260102-120000", size=0x20000)
+    write_full_flash_manifest(bad, bad.read_bytes(), port="p")
+    with bad.open("r+b") as f:
+        f.seek(0x18000)
+        f.write(b"\x00")
+    _backup(root, "nvs", "20260102-120000")
+    store = root / "store"
+    add_snapshot(store, good, device="A")
+    sector = next((store / "sectors").glob("*/*"))
+    sector.write_bytes(b"not zlib")
+
+    result = audit_backups(root, store_dir=store, workers=2)
+
+    assert result["ok"] is False
+    assert result["images_checked"] == 2
+    assert [(r["path"], r["bad_blocks"]) for r in result["images_failed"]] == [(str(bad), [1])]
+    assert result["images_unverified"] == 1
+    assert result["sectors_bad"] == [str(sector)]
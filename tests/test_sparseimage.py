@@ -0,0 +1,55 @@
+from pathlib import Path
+
+import pytest
+
+from circuithack.partitions import PARTITION_TABLE_OFFSET
+from circuithack.sparseimage import (
+    SparseImageError,
+    convert_raw_to_sparse,
+    data_extents,
+    export_sparse_to_raw,
+    read_sparse_image,
+)
+
+
+def _dump() -> bytes:
+    import struct
+
+    image = bytearray(b"\xff" * 0x40000)
+    image[0:0x1800] = b"\x11" * 0x1800
+    label = b"nvs".ljust(16, b"\x00")
+    table = struct.pack("<HBBII16sI", 0x50AA, 0x01, 0x02, 0x20000, 0x10000, label, 0)
+    image[PARTITION_TABLE_OFFSET : PARTITION_TABLE_OFFSET + len(table)] = table
+    image[0x21000:0x21100] = b"\x22" * 0x100
+    return bytes(image)
+
+
+def test_data_extents_skip_erased_sectors_and_follow_partitions() -> None:
+    extents = [(label, e.offset, e.size) for label, e in data_extents(_dump())]
+    assert extents == [
+        ("bootloader", 0x0, 0x2000),
+        ("partition_table", PARTITION_TABLE_OFFSET, 0x1000),
+        ("nvs", 0x21000, 0x1000),
+    ]
+
+
+def test_sparse_roundtrip_restores_identical_raw_image(tmp_path: Path) -> None:
+    raw = tmp_path / "codee-fullflash.bin"
+    raw.write_bytes(_dump())
+
+    packed = convert_raw_to_sparse(raw)
+    assert packed["stored_bytes"] < len(_dump())
+
+    out = tmp_path / "restored.bin"
+    export_sparse_to_raw(packed["sparse_path"], out)
+    assert out.read_bytes() == _dump()
+
+    image = read_sparse_image(packed["sparse_path"])
+    assert [(e.offset, e.size) for e in image.erased_extents()][0] == (0x2000, PARTITION_TABLE_OFFSET - 0x2000)
+
+
+def test_read_sparse_image_rejects_raw_dump(tmp_path: Path) -> None:
+    raw = tmp_path / "codee-fullflash.bin"
+    raw.write_bytes(_dump())
+    with pytest.raises(SparseImageError, match="Not a sparse flash image"):
+        read_sparse_image(raw)
@@ -0,0 +1,72 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from circuithack.hashcache import hash_cache_path, hash_image_file, image_hashes
+from circuithack.verify import verify_flash_image
+
+
+def test_image_hashes_cached_until_file_changes(tmp_path: Path, monkeypatch) -> None:
+    image = tmp_path / "fw.bin"
+    image.write_bytes(b"\x01" * 0x18000)
+    calls = []
+    monkeypatch.setattr(
+        "circuithack.hashcache.hash_image_file",
+        lambda path, block_size: calls.append(path) or hash_image_file(path, block_size),
+    )
+
+    first = image_hashes(image)
+    second = image_hashes(image)
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert second["block_md5"] == first["block_md5"]
+    assert len(first["block_md5"]) == 2
+    assert len(calls) == 1
+
+    image.write_bytes(b"\x02" * 0x18000)
+    stat = image.stat()
+    os.utime(image, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    third = image_hashes(image)
+    assert third["cached"] is False
+    assert third["md5"] != first["md5"]
+
+
+def test_image_hash_cache_survives_concurrent_writers_and_corruption(tmp_path: Path) -> None:
+    images = []
+    for i in range(8):
+        image = tmp_path / f"image{i}.bin"
+        image.write_bytes(bytes([i]) * 0x2000)
+        images.append(image)
+    hash_cache_path().write_text('{"truncated": ', encoding="utf-8")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda p: image_hashes(p, block_size=0x1000), images))
+
+    assert [r["cached"] for r in results] == [False] * 8
+    assert all(image_hashes(p, block_size=0x1000)["cached"] for p in images)
+    assert not list(hash_cache_path().parent.glob("*.tmp"))
+
+
+def test_verify_flash_image_reports_only_mismatched_blocks(
+    tmp_path: Path,
+    monkeypatch,
+    fake_esp,
+    fake_session_opener,
+) -> None:
+    firmware = bytes(range(256)) * 0x400
+    image = tmp_path / "fw.bin"
+    image.write_bytes(firmware)
+    flash = bytearray(firmware + b"\xff" * 0x10000)
+    flash[0x20010] ^= 0xFF
+    esp = fake_esp(bytes(flash))
+    monkeypatch.setattr("circuithack.verify.open_flash_session", fake_session_opener(esp))
+
+    result = verify_flash_image("/dev/null", image)
+
+    assert result["ok"] is False
+    assert result["blocks_checked"] == 4
+    assert [r["offset"] for r in result["mismatched"]] == [0x20000]
+    assert result["mismatched_bytes"] == 0x10000
+    assert esp.reads == []
+
+    esp.flash[0x20010] ^= 0xFF
+    assert verify_flash_image("/dev/null", image)["ok"] is True